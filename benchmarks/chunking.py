@@ -0,0 +1,92 @@
+"""
+Benchmark splitting and cleaning documents in the ingesting process against worker processes.
+
+    python -m benchmarks.chunking --documents 500 2000 10000 --workers 2 4 --output chunking.json
+
+Pages come from benchmarks.synthetic, so every run chunks exactly the same text. Every worker
+count must produce the same chunks as the serial path, byte for byte, or the benchmark fails.
+Worker start-up is timed on its own, the chunking times are those of a pool already started.
+"""
+from typing import Any, Dict, List
+import argparse
+import json
+import sys
+import time
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter, TextSplitter
+
+from benchmarks.synthetic import generate_corpus
+from graph.chunking import ChunkingPool, chunk_documents, default_text_splitter
+
+
+def make_documents(num_documents: int, words_per_page: int) -> List[Document]:
+    corpus = generate_corpus(num_pages=num_documents, words_per_page=words_per_page, num_questions=0)
+    return [Document(page_content=text, metadata={"source": url}) for url, text in corpus.pages.items()]
+
+
+def serialize(chunks: List[Document]) -> bytes:
+    return json.dumps([[chunk.page_content, chunk.metadata] for chunk in chunks]).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel chunking of documents.")
+    parser.add_argument('--documents', type=int, nargs='+', default=[500, 2000, 5000], help="Document counts to chunk")
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4], help="Worker process counts to compare")
+    parser.add_argument('--words-per-page', type=int, default=1500, help="Words of every synthetic page")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="Characters per chunk")
+    parser.add_argument('--tiktoken', action='store_true', help="Split with the default tiktoken splitter instead")
+    parser.add_argument('--output', type=str, help="Optional path to write the results to as JSON")
+    args = parser.parse_args()
+
+    text_splitter: TextSplitter = (
+        default_text_splitter() if args.tiktoken
+        else RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=0)
+    )
+    worker_text_splitter = None if args.tiktoken else text_splitter
+    pools: Dict[int, ChunkingPool] = {}
+    startup: Dict[int, float] = {}
+    for workers in args.workers:
+        start = time.perf_counter()
+        pools[workers] = ChunkingPool(workers, worker_text_splitter)
+        # A batch per worker, so that every one of them is started and has built its splitter
+        pools[workers].chunk(make_documents(workers * pools[workers].batch_size, 50))
+        startup[workers] = round(time.perf_counter() - start, 4)
+        print(f"{workers} workers started in {startup[workers]:.2f}s")
+
+    results: List[Dict[str, Any]] = []
+    identical = True
+    for num_documents in args.documents:
+        documents = make_documents(num_documents, args.words_per_page)
+        start = time.perf_counter()
+        expected = serialize(chunk_documents(text_splitter, [document.copy(deep=True) for document in documents]))
+        serial_seconds = time.perf_counter() - start
+        result: Dict[str, Any] = {"documents": num_documents, "serial_seconds": round(serial_seconds, 4), "workers": {}}
+        line = f"{num_documents:>7} documents  serial {serial_seconds:.2f}s"
+        for workers, pool in pools.items():
+            start = time.perf_counter()
+            chunks = pool.chunk(documents)
+            seconds = time.perf_counter() - start
+            same = serialize(chunks) == expected
+            identical = identical and same
+            result["workers"][workers] = {
+                "seconds": round(seconds, 4),
+                "speedup": round(serial_seconds / seconds, 2),
+                "identical": same
+            }
+            line += f"  {workers} workers {seconds:.2f}s (x{serial_seconds / seconds:.1f}{'' if same else ', DIFFERENT'})"
+        print(line)
+        results.append(result)
+
+    for pool in pools.values():
+        pool.close()
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"startup_seconds": startup, "results": results}, file, indent=2)
+    if not identical:
+        print("Parallel chunking differs from the serial path")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Benchmark ingestion, routing and whole questions through the graph, fully offline.
+
+    python -m benchmarks.end_to_end --pages 50 --questions 40 --llm-latency 0.05 --output results.json
+    python -m benchmarks.end_to_end --output new.json --baseline results.json
+
+The chat model, the embeddings and the web search are deterministic local stand-ins
+(benchmarks.fakes), so two runs with the same arguments make exactly the same decisions
+and their results can be compared across commits. The LLM and search latencies are simulated.
+"""
+from typing import Any, Dict, List
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from benchmarks.fakes import FakeChatModel, fake_web_search_tool
+from benchmarks.synthetic import SyntheticCorpus, generate_corpus
+from graph.chains.cache import ChainCache, set_chain_cache
+from graph.chains.llm import set_llm
+from graph.config import RAGConfig
+from graph.constants import (
+    BATCH_GRADING,
+    HASHING_EMBEDDINGS,
+    KEYWORD_ROUTING,
+    LLM_KEYWORDS,
+    PER_DOCUMENT_GRADING,
+    SCORE_ROUTING,
+    TFIDF_KEYWORDS,
+    WEB_SEARCH
+)
+from graph.fetch import FetchResult
+from graph.ingest import RAGVectorStore
+from graph.instrumentation import QueryTrace
+from graph.nodes.web_search import set_web_search_tool
+
+
+# Metrics compared against a baseline, all of them lower is better
+COMPARED_METRICS = [
+    ("ingestion", "seconds"),
+    ("routing", "p50_seconds"),
+    ("routing", "p99_seconds"),
+    ("end_to_end", "p50_seconds"),
+    ("end_to_end", "p90_seconds"),
+    ("end_to_end", "p99_seconds"),
+    ("end_to_end", "llm_calls_per_question"),
+]
+
+
+class SyntheticVectorStore(RAGVectorStore):
+    """RAGVectorStore ingesting pages of a synthetic corpus instead of fetching them."""
+
+    def __init__(self, corpus: SyntheticCorpus, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.corpus = corpus
+
+    def fetch_urls(self, urls: List[str]) -> List[FetchResult]:
+        return [
+            FetchResult(url=url, documents=[Document(page_content=self.corpus.pages[url], metadata={"source": url})], status=200)
+            for url in urls
+        ]
+
+
+def percentiles(timings: List[float]) -> Dict[str, float]:
+    if not timings:
+        return {}
+    ordered = sorted(timings)
+
+    def percentile(share: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_seconds": round(statistics.fmean(ordered), 6),
+        "p50_seconds": round(percentile(0.5), 6),
+        "p90_seconds": round(percentile(0.9), 6),
+        "p99_seconds": round(percentile(0.99), 6),
+        "max_seconds": round(ordered[-1], 6),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_ingestion(store: RAGVectorStore, corpus: SyntheticCorpus) -> Dict[str, Any]:
+    start = time.perf_counter()
+    report = store.add_documents_from_urls(list(corpus.pages))
+    seconds = time.perf_counter() - start
+    return {
+        "pages": len(corpus.pages),
+        "words": corpus.words,
+        "chunks": report.added,
+        "seconds": round(seconds, 6),
+        "pages_per_second": round(len(corpus.pages) / seconds, 2),
+        "chunks_per_second": round(report.added / seconds, 2),
+    }
+
+
+def benchmark_routing(store: RAGVectorStore, questions: List[str], config: RAGConfig) -> Dict[str, Any]:
+    from graph.nodes import route
+
+    timings, web_search = [], 0
+    for question in questions:
+        start = time.perf_counter()
+        update = route({"question": question, "retriever": store, "config": config})
+        timings.append(time.perf_counter() - start)
+        web_search += update["route_decision"] == WEB_SEARCH
+    return {**percentiles(timings), "web_search_share": round(web_search / len(questions), 4)}
+
+
+def benchmark_end_to_end(store: RAGVectorStore, questions: List[str], config: RAGConfig) -> Dict[str, Any]:
+    from graph import app
+
+    timings, traces = [], []
+    for question in questions:
+        trace = QueryTrace(question)
+        start = time.perf_counter()
+        app.invoke({"question": question, "retriever": store, "config": config}, config={"callbacks": [trace]})
+        timings.append(time.perf_counter() - start)
+        traces.append(trace.finish())
+
+    totals = [trace.totals() for trace in traces]
+    nodes = sorted({node for trace in traces for node in trace.nodes})
+    return {
+        **percentiles(timings),
+        "llm_calls_per_question": round(statistics.fmean(total.llm_calls for total in totals), 4),
+        "max_llm_calls_per_question": max(total.llm_calls for total in totals),
+        "tokens_per_question": round(statistics.fmean(total.prompt_tokens + total.completion_tokens for total in totals), 2),
+        "node_mean_seconds": {
+            node: round(sum(trace.nodes[node].seconds for trace in traces if node in trace.nodes) / len(traces), 6)
+            for node in nodes
+        },
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    lines = []
+    for section, metric in COMPARED_METRICS:
+        new, old = results.get(section, {}).get(metric), baseline.get(section, {}).get(metric)
+        if new is None or not old:
+            continue
+        lines.append(f"{f'{section}.{metric}':<36} {old:>10.4f} -> {new:>10.4f}  ({(new - old) / old:+.1%})")
+    return lines
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    corpus = generate_corpus(args.pages, args.words_per_page, args.questions, args.out_of_domain_share, args.seed)
+    llm = FakeChatModel(
+        latency_seconds=args.llm_latency,
+        token_latency_seconds=args.token_latency,
+        relevance_rate=args.relevance_rate,
+        grounded_rate=args.grounded_rate,
+        useful_rate=args.useful_rate
+    )
+    set_llm(llm)
+    set_web_search_tool(fake_web_search_tool(args.search_latency))
+    set_chain_cache(ChainCache() if args.chain_cache else None)
+    config = RAGConfig(
+        max_concurrency=args.max_concurrency,
+        grading_mode=args.grading_mode,
+        routing_mode=args.routing_mode,
+        max_llm_calls=None,
+        max_tokens=None,
+        deadline_seconds=None
+    )
+    persist_directory = tempfile.mkdtemp(prefix="rag-benchmark-")
+    try:
+        store = SyntheticVectorStore(
+            corpus,
+            "benchmark",
+            persist_directory,
+            max_concurrency=args.max_concurrency,
+            embedding_backend=HASHING_EMBEDDINGS,
+            embedding_cache=False,
+            text_splitter=RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=0),
+            keyword_extractor=args.keyword_extractor
+        )
+        results = {
+            "commit": git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "parameters": vars(args),
+            "ingestion": benchmark_ingestion(store, corpus),
+            "routing": benchmark_routing(store, corpus.questions, config),
+            "end_to_end": benchmark_end_to_end(store, corpus.questions, config),
+        }
+    finally:
+        set_llm(None)
+        set_web_search_tool(None)
+        set_chain_cache(ChainCache())
+        shutil.rmtree(persist_directory, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the corrective RAG graph offline on a synthetic corpus.")
+    parser.add_argument('--pages', type=int, default=50, help="Number of pages in the synthetic corpus")
+    parser.add_argument('--words-per-page', type=int, default=600, help="Approximate length of every page")
+    parser.add_argument('--questions', type=int, default=40, help="Number of questions asked")
+    parser.add_argument('--out-of-domain-share', type=float, default=0.25, help="Share of questions the corpus can't answer")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic corpus")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="Characters per chunk")
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="Simulated seconds per LLM call")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="Simulated seconds between streamed tokens")
+    parser.add_argument('--search-latency', type=float, default=0.0, help="Simulated seconds per web search")
+    parser.add_argument('--relevance-rate', type=float, default=0.8, help="Share of documents graded relevant")
+    parser.add_argument('--grounded-rate', type=float, default=0.9, help="Share of answers graded grounded")
+    parser.add_argument('--useful-rate', type=float, default=0.9, help="Share of answers graded useful")
+    parser.add_argument('--max-concurrency', type=int, default=3, help="Concurrent LLM calls per question or ingestion stage")
+    parser.add_argument('--grading-mode', choices=[BATCH_GRADING, PER_DOCUMENT_GRADING], default=BATCH_GRADING)
+    parser.add_argument('--routing-mode', choices=[KEYWORD_ROUTING, SCORE_ROUTING], default=KEYWORD_ROUTING)
+    parser.add_argument('--keyword-extractor', choices=[LLM_KEYWORDS, TFIDF_KEYWORDS], default=LLM_KEYWORDS)
+    parser.add_argument('--chain-cache', action='store_true', help="Memoize structured chain calls as in production")
+    parser.add_argument('--output', type=str, help="Path to write the results to as JSON")
+    parser.add_argument('--baseline', type=str, help="Results of an earlier run to compare against")
+    parser.add_argument('--max-regression', type=float, help="Fail if a compared metric is this much worse than the baseline, e.g. 0.2")
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps({section: results[section] for section in ("ingestion", "routing", "end_to_end")}, indent=2))
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        print(f"\nCompared with {args.baseline} (commit {baseline.get('commit')}):")
+        print("\n".join(compare(results, baseline)))
+        if args.max_regression is not None:
+            regressed = [
+                f"{section}.{metric}" for section, metric in COMPARED_METRICS
+                if baseline.get(section, {}).get(metric)
+                and results[section][metric] > baseline[section][metric] * (1 + args.max_regression)
+            ]
+            if regressed:
+                print(f"Performance regression: {', '.join(regressed)}")
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Deterministic stand-ins for the chat model and the web search tool, so that the whole graph
+runs offline with reproducible decisions. Embeddings use the local hashing backend.
+
+Every answer is derived from a hash of the prompt: the same prompt always gets the same
+grade, keywords or answer, and the share of positive grades is set by the pass rates.
+"""
+from typing import Any, AsyncIterator, Dict, Iterator, List, Type
+import asyncio
+import hashlib
+import json
+import re
+import time
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import BaseModel
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from graph.local_keywords import candidate_terms
+
+
+DOCUMENT_INDEX_PATTERN = re.compile(r'<document index="(\d+)">')
+ANSWER_WORDS = "agents plan tasks with memory tools and reflection before answering the question".split()
+
+
+def _fraction(text: str, salt: str) -> float:
+    """Deterministic number in [0, 1) derived from the text."""
+    digest = hashlib.sha256(f"{salt}:{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") / 2 ** 64
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering instantly or after a simulated latency, without any network call.
+    with_structured_output is supported for the schemas of graph/chains.
+
+    Attributes:
+        latency_seconds(float): time before the response, or before the first token when streaming
+        token_latency_seconds(float): time between streamed tokens
+        relevance_rate(float): share of documents graded relevant
+        grounded_rate(float): share of answers graded grounded in the documents
+        useful_rate(float): share of answers graded as answering the question
+        answer_words(int): length of the generated answers
+    """
+
+    latency_seconds: float = 0.0
+    token_latency_seconds: float = 0.0
+    relevance_rate: float = 0.8
+    grounded_rate: float = 0.9
+    useful_rate: float = 0.9
+    answer_words: int = 40
+    model_name: str = "fake-chat-model"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _structured(self, schema_name: str, prompt: str) -> Dict[str, Any]:
+        if schema_name == "GradeDocuments":
+            return {"binary_score": "yes" if _fraction(prompt, "relevance") < self.relevance_rate else "no"}
+        if schema_name == "GradeDocumentsBatch":
+            return {"grades": [
+                {"index": int(index), "binary_score": "yes" if _fraction(f"{prompt}:{index}", "relevance") < self.relevance_rate else "no"}
+                for index in DOCUMENT_INDEX_PATTERN.findall(prompt)
+            ]}
+        if schema_name == "GradeHallucination":
+            return {"binary_score": _fraction(prompt, "grounded") < self.grounded_rate}
+        if schema_name == "GradeAnswer":
+            return {"binary_score": _fraction(prompt, "useful") < self.useful_rate}
+        if schema_name == "DocumentKeywords":
+            return {"keywords": candidate_terms(prompt.rsplit("Here is the document:", 1)[-1])[:10]}
+        raise ValueError(f"FakeChatModel can't produce a {schema_name}")
+
+    def _respond(self, messages: List[BaseMessage], structured_output: str | None) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if structured_output:
+            return json.dumps(self._structured(structured_output, prompt))
+        offset = int(_fraction(prompt, "answer") * len(ANSWER_WORDS))
+        return " ".join(ANSWER_WORDS[(offset + index) % len(ANSWER_WORDS)] for index in range(self.answer_words))
+
+    def _message(self, messages: List[BaseMessage], content: str) -> AIMessage:
+        input_tokens = sum(_count_tokens(str(message.content)) for message in messages)
+        output_tokens = _count_tokens(content)
+        return AIMessage(
+            content,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        structured_output: str | None = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        time.sleep(self.latency_seconds)
+        content = self._respond(messages, structured_output)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, content))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        structured_output: str | None = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency_seconds)
+        content = self._respond(messages, structured_output)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, content))])
+
+    def _chunks(self, messages: List[BaseMessage], structured_output: str | None) -> Iterator[ChatGenerationChunk]:
+        content = self._respond(messages, structured_output)
+        words = content.split(" ")
+        for index, word in enumerate(words):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if index == 0 else f" {word}"))
+        usage = self._message(messages, content).usage_metadata
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        structured_output: str | None = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_seconds)
+        for index, chunk in enumerate(self._chunks(messages, structured_output)):
+            if index:
+                time.sleep(self.token_latency_seconds)
+            if run_manager and chunk.message.content:
+                run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        structured_output: str | None = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency_seconds)
+        for index, chunk in enumerate(self._chunks(messages, structured_output)):
+            if index:
+                await asyncio.sleep(self.token_latency_seconds)
+            if run_manager and chunk.message.content:
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    def with_structured_output(self, schema: Type[BaseModel], **kwargs: Any) -> Runnable:
+        # The schema name travels to _generate as a bound argument, like the tool of a real structured call
+        return self.bind(structured_output=schema.__name__) | RunnableLambda(lambda message: schema.parse_raw(message.content))
+
+
+def fake_web_search_tool(latency_seconds: float = 0.0, max_results: int = 3) -> Runnable:
+    """Search tool returning max_results deterministic snippets about the query."""
+
+    def results(query: Dict[str, str]) -> List[Dict[str, str]]:
+        return [
+            {"url": f"https://search.invalid/{index}", "content": f"Result {index} about {query['query']}"}
+            for index in range(max_results)
+        ]
+
+    def search(query: Dict[str, str]) -> List[Dict[str, str]]:
+        time.sleep(latency_seconds)
+        return results(query)
+
+    async def asearch(query: Dict[str, str]) -> List[Dict[str, str]]:
+        await asyncio.sleep(latency_seconds)
+        return results(query)
+
+    return RunnableLambda(search, afunc=asearch, name="fake_web_search")
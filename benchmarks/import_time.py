@@ -0,0 +1,67 @@
+"""
+Measure how long importing the package entry points takes in a fresh interpreter.
+
+    python -m benchmarks.import_time --repeat 5 --max-seconds 2.0
+
+Each module is imported in a new process so nothing is shared between runs. The
+interpreter start-up time (`python -c pass`) is subtracted from every measurement.
+"""
+from typing import Dict, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+DEFAULT_MODULES = ["graph", "graph.graph", "main"]
+
+
+def time_import(module: str, repeat: int) -> List[float]:
+    timings = []
+    statement = f"import {module}" if module else "pass"
+    env = dict(os.environ)
+    # Chains and clients must not need credentials just to be imported
+    env.pop("OPENAI_API_KEY", None)
+    env.pop("TAVILY_API_KEY", None)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], check=True, env=env, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import time of the corrective RAG modules.")
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES, help="Modules to import")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of fresh interpreters per module")
+    parser.add_argument('--max-seconds', type=float, help="Fail if any module's median import time exceeds this")
+    parser.add_argument('--output', type=str, help="Optional path to write the results to as JSON")
+    args = parser.parse_args()
+
+    interpreter_start = statistics.median(time_import("", args.repeat))
+    results: Dict[str, Dict[str, float]] = {}
+    for module in args.modules:
+        timings = [timing - interpreter_start for timing in time_import(module, args.repeat)]
+        results[module] = {
+            "median_seconds": round(statistics.median(timings), 4),
+            "min_seconds": round(min(timings), 4),
+            "max_seconds": round(max(timings), 4),
+        }
+        print(f"{module:<20} median {results[module]['median_seconds']:.3f}s  min {results[module]['min_seconds']:.3f}s")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"interpreter_start_seconds": round(interpreter_start, 4), "modules": results}, file, indent=2)
+
+    if args.max_seconds is not None:
+        slow = [module for module, result in results.items() if result["median_seconds"] > args.max_seconds]
+        if slow:
+            print(f"Import time regression: {', '.join(slow)} slower than {args.max_seconds}s")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Synthetic corpora and question sets of configurable size, generated from a seed so that
+every run of a benchmark ingests and asks exactly the same thing.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+import random
+
+
+TOPICS: Dict[str, List[str]] = {
+    "agents": ["agent", "planning", "memory", "tool use", "reflection", "task decomposition", "subgoal", "controller"],
+    "prompting": ["prompt", "few-shot", "chain of thought", "instruction", "demonstration", "zero-shot", "template"],
+    "attacks": ["adversarial", "jailbreak", "red teaming", "token manipulation", "gradient attack", "safety", "robustness"],
+    "retrieval": ["retrieval", "embedding", "vector store", "chunk", "reranking", "similarity", "index"],
+    "training": ["fine-tuning", "reward model", "preference", "dataset", "alignment", "loss", "checkpoint"],
+    "evaluation": ["benchmark", "metric", "hallucination", "faithfulness", "human evaluation", "accuracy", "calibration"],
+}
+FILLER = "the a model can be used to improve results when it is combined with careful design of each step".split()
+OUT_OF_DOMAIN_QUESTIONS = [
+    "How do I bake sourdough bread at home?",
+    "What is the best season to plant tomatoes?",
+    "Who won the football world cup in 2010?",
+    "How long should eggs be boiled for a soft yolk?",
+    "What is the capital city of Australia?",
+    "How do I change the oil of a motorcycle?",
+]
+
+
+@dataclass
+class SyntheticCorpus:
+    """
+    Attributes:
+        pages(Dict[str, str]): text of every page, by URL
+        questions(List[str]): questions to ask, the out of domain ones spread evenly among the others
+        out_of_domain_questions(Set[str]): those of the questions the corpus can't answer
+    """
+
+    pages: Dict[str, str] = field(default_factory=dict)
+    questions: List[str] = field(default_factory=list)
+    out_of_domain_questions: Set[str] = field(default_factory=set)
+
+    @property
+    def words(self) -> int:
+        return sum(len(page.split()) for page in self.pages.values())
+
+
+def _sentence(rng: random.Random, terms: List[str]) -> str:
+    words = rng.sample(FILLER, k=6) + rng.sample(terms, k=min(3, len(terms)))
+    rng.shuffle(words)
+    return " ".join(words).capitalize() + "."
+
+
+def generate_corpus(
+    num_pages: int = 50,
+    words_per_page: int = 600,
+    num_questions: int = 40,
+    out_of_domain_share: float = 0.25,
+    seed: int = 0
+) -> SyntheticCorpus:
+    """Pages made of sentences about one main topic each, and questions split between in and out of domain."""
+    rng = random.Random(seed)
+    topics = sorted(TOPICS)
+    corpus = SyntheticCorpus()
+    for index in range(num_pages):
+        topic = topics[index % len(topics)]
+        sentences, words = [], 0
+        while words < words_per_page:
+            # Mostly the page's own topic, sometimes a neighbouring one
+            terms = TOPICS[topic] if rng.random() < 0.8 else TOPICS[rng.choice(topics)]
+            sentence = _sentence(rng, terms)
+            sentences.append(sentence)
+            words += len(sentence.split())
+            if rng.random() < 0.15:
+                sentences.append("\n\n")
+        corpus.pages[f"https://corpus.invalid/{topic}/{index}"] = " ".join(sentences)
+
+    out_of_domain = 0
+    for index in range(num_questions):
+        if int((index + 1) * out_of_domain_share) > int(index * out_of_domain_share):
+            question = OUT_OF_DOMAIN_QUESTIONS[out_of_domain % len(OUT_OF_DOMAIN_QUESTIONS)]
+            corpus.out_of_domain_questions.add(question)
+            out_of_domain += 1
+        else:
+            first, second = rng.sample(TOPICS[rng.choice(topics)], k=2)
+            question = f"How does {first} relate to {second}?"
+        corpus.questions.append(question)
+    return corpus
@@ -1,3 +1,6 @@
 LOGS_DIR = "./logs"
 DEFAULT_COLLECTION_NAME = "rag-chroma"
-DEFAULT_PERSIST_DIRECTORY = "./chroma"
\ No newline at end of file
+DEFAULT_PERSIST_DIRECTORY = "./chroma"
+DEFAULT_BATCH_PARALLELISM = 4
+DEFAULT_ANSWER_CACHE_PATH = "./cache/answers.sqlite"
+DEFAULT_CHAIN_CACHE_PATH = "./cache/chains.sqlite"
@@ -1,3 +1,11 @@
-from graph.graph import app
+__all__ = ["app"]
 
-__all__ = ["app"]
\ No newline at end of file
+
+def __getattr__(name: str):
+    # The compiled graph is built on first access so that importing a submodule
+    # such as graph.ingest doesn't construct the whole workflow.
+    if name == "app":
+        from graph.graph import app
+
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
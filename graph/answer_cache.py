@@ -0,0 +1,258 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from utils import logger
+from graph.constants import (
+    DEFAULT_ANSWER_CACHE_MAX_ENTRIES,
+    DEFAULT_ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    DEFAULT_ANSWER_CACHE_TTL_SECONDS
+)
+
+
+CacheKey = Tuple[str, int, str]
+EXACT_HIT = "exact"
+SEMANTIC_HIT = "semantic"
+MISS = "miss"
+
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+@dataclass
+class CacheEntry:
+    answer: str
+    embedding: List[float] | None
+    created_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class CacheLookup:
+    """
+    Result of looking a question up, carrying the embedding so a miss can be stored without re-embedding,
+    and the collection version looked up, which the answer must be stored under even if the collection
+    changed while it was generated.
+    """
+    answer: str | None
+    kind: str
+    embedding: List[float] | None = None
+    version: int | None = None
+
+
+class _EmbeddingMatrix:
+    """
+    Normalized question embeddings of the answers cached for one collection version, in a preallocated
+    matrix whose rows are filled on put and freed on eviction, so lookups never rebuild it.
+    """
+
+    def __init__(self, dimensions: int, capacity: int):
+        self.vectors = np.zeros((max(capacity, 1), dimensions), dtype=np.float32)
+        self.keys: List[CacheKey | None] = [None] * len(self.vectors)
+        self.rows: Dict[CacheKey, int] = {}
+        self.free = list(range(len(self.vectors) - 1, -1, -1))
+
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @staticmethod
+    def _normalized(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, key: CacheKey, embedding: List[float]):
+        row = self.rows.get(key)
+        if row is None:
+            if not self.free:
+                # Doubled when full, never past twice max_entries as entries beyond it are evicted
+                size = len(self.vectors)
+                self.vectors = np.vstack([self.vectors, np.zeros_like(self.vectors)])
+                self.keys.extend([None] * size)
+                self.free = list(range(2 * size - 1, size - 1, -1))
+            row = self.free.pop()
+        self.vectors[row] = self._normalized(embedding)
+        self.keys[row] = key
+        self.rows[key] = row
+
+    def remove(self, key: CacheKey):
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.vectors[row] = 0
+            self.keys[row] = None
+            self.free.append(row)
+
+    def ranked(self, embedding: List[float], threshold: float) -> List[CacheKey]:
+        """Keys of the questions at least threshold similar to the embedding, most similar first."""
+        similarities = self.vectors @ self._normalized(embedding)
+        rows = np.flatnonzero(similarities >= threshold)
+        rows = rows[np.argsort(-similarities[rows], kind="stable")]
+        return [self.keys[row] for row in rows if self.keys[row] is not None]
+
+
+class AnswerCache:
+    """
+    Bounded LRU/TTL cache of final answers keyed by (collection, collection version, normalized question).
+    Exact matches are checked first, then the nearest cached question embedding above the similarity threshold.
+    When a path is given, entries are written through to SQLite and reloaded on start-up.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_entries: int = DEFAULT_ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: float | None = DEFAULT_ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold: float = DEFAULT_ANSWER_CACHE_SIMILARITY_THRESHOLD
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._matrices: Dict[Tuple[str, int], _EmbeddingMatrix] = {}
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        if path:
+            self._open(path)
+
+    def _open(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS answers (
+                collection TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                embedding TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (collection, version, question)
+            )"""
+        )
+        if self.ttl_seconds is not None:
+            self._connection.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self._connection.execute(
+            "DELETE FROM answers WHERE rowid NOT IN (SELECT rowid FROM answers ORDER BY created_at DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+        self._connection.commit()
+        rows = self._connection.execute(
+            "SELECT collection, version, question, answer, embedding, created_at FROM answers ORDER BY created_at DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        for collection, version, question, answer, embedding, created_at in reversed(rows):
+            embedding = json.loads(embedding) if embedding else None
+            self._entries[(collection, version, question)] = CacheEntry(answer, embedding, created_at)
+            self._index((collection, version, question), embedding)
+        logger.info(f"Loaded {len(rows)} cached answers from {path}")
+
+    def _is_expired(self, entry: CacheEntry) -> bool:
+        return self.ttl_seconds is not None and time.time() - entry.created_at > self.ttl_seconds
+
+    def _index(self, key: CacheKey, embedding: List[float] | None):
+        group = (key[0], key[1])
+        matrix = self._matrices.get(group)
+        if embedding is None or (matrix is not None and len(embedding) != matrix.dimensions):
+            if matrix is not None:
+                matrix.remove(key)
+            return
+        if matrix is None:
+            matrix = self._matrices[group] = _EmbeddingMatrix(len(embedding), min(self.max_entries, 64))
+        matrix.add(key, embedding)
+
+    def _unindex(self, key: CacheKey):
+        group = (key[0], key[1])
+        matrix = self._matrices.get(group)
+        if matrix is not None:
+            matrix.remove(key)
+            if not len(matrix):
+                del self._matrices[group]
+
+    def _delete(self, key: CacheKey):
+        self._entries.pop(key, None)
+        self._unindex(key)
+        if self._connection:
+            self._connection.execute(
+                "DELETE FROM answers WHERE collection = ? AND version = ? AND question = ?", key
+            )
+            self._connection.commit()
+
+    def _nearest(self, collection: str, version: int, embedding: List[float]) -> CacheKey | None:
+        matrix = self._matrices.get((collection, version))
+        if matrix is None or len(embedding) != matrix.dimensions:
+            return None
+        for key in matrix.ranked(embedding, self.similarity_threshold):
+            if not self._is_expired(self._entries[key]):
+                return key
+            self._delete(key)
+        return None
+
+    def lookup(
+        self,
+        collection: str,
+        version: int,
+        question: str,
+        embed_question: Callable[[str], List[float]] | None = None
+    ) -> CacheLookup:
+        """
+        Look for a cached answer. embed_question is only called when there is no exact match,
+        so exact hits never pay for an embedding.
+        """
+        key = (collection, version, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                self._delete(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return CacheLookup(entry.answer, EXACT_HIT, entry.embedding, version)
+        if embed_question is None:
+            return CacheLookup(None, MISS, version=version)
+        embedding = embed_question(question)
+        with self._lock:
+            nearest = self._nearest(collection, version, embedding)
+            if nearest is not None:
+                self._entries.move_to_end(nearest)
+                return CacheLookup(self._entries[nearest].answer, SEMANTIC_HIT, embedding, version)
+        return CacheLookup(None, MISS, embedding, version)
+
+    def put(self, collection: str, version: int, question: str, answer: str, embedding: List[float] | None = None):
+        key = (collection, version, normalize_question(question))
+        entry = CacheEntry(answer, list(embedding) if embedding is not None else None)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._index(key, entry.embedding)
+            if self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                    (*key, answer, json.dumps(entry.embedding) if entry.embedding is not None else None, entry.created_at)
+                )
+                self._connection.commit()
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._delete(oldest)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,131 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Set, Tuple
+import json
+import math
+import os
+import re
+import threading
+
+from utils import logger
+from graph.constants import DEFAULT_BM25_B, DEFAULT_BM25_K1
+from graph.local_keywords import STOPWORDS
+
+
+# Product names, versions and error codes such as gpt-4o, v1.2 or err_conn_reset stay whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:[-.][a-z0-9_]+)*")
+TOKEN_PART_PATTERN = re.compile(r"[-.]")
+
+
+def lexical_tokens(text: str) -> List[str]:
+    """Lowercased terms of a text without stopwords. Compound terms also count as each of their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = TOKEN_PART_PATTERN.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 index over the text of the chunks of a collection, persisted as JSON next to it.
+    Chunks are added and removed incrementally during ingestion, keyed by their chunk ids.
+    """
+
+    def __init__(self, path: str, k1: float = DEFAULT_BM25_K1, b: float = DEFAULT_BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        # term -> chunk id -> frequency of the term in the chunk
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        index = cls(path)
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                stored = json.load(file)
+            index.postings = stored["postings"]
+            index.lengths = stored["lengths"]
+            index._total_length = sum(index.lengths.values())
+            logger.info(f"Loaded BM25 index of {len(index.lengths)} chunks from {path}")
+        return index
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def save(self):
+        """Atomically write the index to disk."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        # Held until the replace, so concurrent saves never share the temporary file
+        with self._lock:
+            with open(tmp_path, "w") as file:
+                json.dump({"lengths": self.lengths, "postings": self.postings}, file)
+            os.replace(tmp_path, self.path)
+
+    def _remove(self, chunk_ids: Set[str]):
+        for term in list(self.postings):
+            chunk_frequencies = self.postings[term]
+            for chunk_id in chunk_ids.intersection(chunk_frequencies):
+                del chunk_frequencies[chunk_id]
+            if not chunk_frequencies:
+                del self.postings[term]
+        for chunk_id in chunk_ids:
+            self._total_length -= self.lengths.pop(chunk_id, 0)
+
+    def add(self, chunks: Iterable[Tuple[str, str]]):
+        """Index (chunk id, text) pairs, replacing chunks already indexed under the same id."""
+        counted = [(chunk_id, Counter(lexical_tokens(text))) for chunk_id, text in chunks]
+        with self._lock:
+            replaced = {chunk_id for chunk_id, _ in counted if chunk_id in self.lengths}
+            if replaced:
+                self._remove(replaced)
+            for chunk_id, counts in counted:
+                for term, frequency in counts.items():
+                    self.postings.setdefault(term, {})[chunk_id] = frequency
+                length = sum(counts.values())
+                self.lengths[chunk_id] = length
+                self._total_length += length
+
+    def remove(self, chunk_ids: Iterable[str]):
+        chunk_ids = set(chunk_ids)
+        if not chunk_ids:
+            return
+        with self._lock:
+            self._remove(chunk_ids)
+
+    def search(self, query: str, k: int, candidates: Set[str] | None = None) -> List[Tuple[str, float]]:
+        """
+        Return the k best (chunk id, score) pairs for the query, only scoring the chunks
+        that contain one of its terms, and only among candidates when given.
+        """
+        terms = set(lexical_tokens(query))
+        scores: Dict[str, float] = {}
+        with self._lock:
+            num_chunks = len(self.lengths)
+            if not num_chunks:
+                return []
+            average_length = self._total_length / num_chunks or 1
+            for term in terms:
+                chunk_frequencies = self.postings.get(term)
+                if not chunk_frequencies:
+                    continue
+                idf = math.log(1 + (num_chunks - len(chunk_frequencies) + 0.5) / (len(chunk_frequencies) + 0.5))
+                for chunk_id, frequency in chunk_frequencies.items():
+                    if candidates is not None and chunk_id not in candidates:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def __len__(self) -> int:
+        return len(self.lengths)
@@ -0,0 +1,151 @@
+from typing import Any, Dict
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler, BaseCallbackManager
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableConfig
+
+from utils import logger
+from graph.config import RAGConfig
+
+
+class QueryBudget(BaseCallbackHandler):
+    """
+    Execution budget of a single question, shared by every node of its run through the "budget" key of the state.
+    It is also a callback handler, counting the LLM calls and tokens of the chains the nodes invoke.
+    A limit of None means unlimited.
+
+    Attributes:
+        max_llm_calls(int): LLM calls allowed for the question
+        max_tokens(int): tokens allowed, as reported by the model
+        max_regenerations(int): answers generated after the first one
+        deadline_seconds(float): wall-clock time allowed, counted from the creation of the budget
+        exhausted(str): first limit that was hit, the answer returned is then the best one so far
+    """
+
+    run_inline = True
+    # Types of the limits, the only attributes a request may override
+    LIMIT_TYPES = {"max_llm_calls": int, "max_tokens": int, "max_regenerations": int, "deadline_seconds": float}
+
+    def __init__(
+        self,
+        max_llm_calls: int | None = None,
+        max_tokens: int | None = None,
+        max_regenerations: int | None = None,
+        deadline_seconds: float | None = None
+    ):
+        self.max_llm_calls = max_llm_calls
+        self.max_tokens = max_tokens
+        self.max_regenerations = max_regenerations
+        self.deadline_seconds = deadline_seconds
+        self.started_at = time.monotonic()
+        self.llm_calls = 0
+        self.tokens = 0
+        self.generations = 0
+        self.exhausted: str | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: RAGConfig) -> "QueryBudget":
+        return cls(config.max_llm_calls, config.max_tokens, config.max_regenerations, config.deadline_seconds)
+
+    @classmethod
+    def parse_limit(cls, limit: str, value: Any) -> int | float | None:
+        """
+        Check a limit given from outside, such as a JSON request, and convert it to the type of the limit:
+        a non-negative number, integral for counts, numeric strings included. None stays unlimited.
+        """
+        if limit not in cls.LIMIT_TYPES:
+            raise ValueError(f"Unknown budget limit: {limit}")
+        if value is None:
+            return None
+        limit_type = cls.LIMIT_TYPES[limit]
+        expected = "an integer" if limit_type is int else "a number"
+        try:
+            if isinstance(value, bool):
+                raise TypeError(value)
+            converted = limit_type(value)
+            # int() truncates 2.5, and float() accepts "nan"
+            if float(value) != converted:
+                raise ValueError(value)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Budget limit {limit} must be {expected} or null, got {value!r}") from None
+        if converted < 0:
+            raise ValueError(f"Budget limit {limit} can't be negative, got {value!r}")
+        return converted
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def _reason(self, llm_calls: int = 0) -> str | None:
+        if self.deadline_seconds is not None and self.elapsed_seconds >= self.deadline_seconds:
+            return "deadline"
+        if self.max_llm_calls is not None and self.llm_calls + llm_calls > self.max_llm_calls:
+            return "llm_calls"
+        if self.max_tokens is not None and self.tokens >= self.max_tokens:
+            return "tokens"
+        return None
+
+    def allows(self, llm_calls: int = 1) -> bool:
+        """Whether a step making llm_calls more calls fits in the budget. Records the limit hit if it doesn't."""
+        reason = self._reason(llm_calls)
+        if reason and not self.exhausted:
+            logger.warning(f"---QUERY BUDGET EXHAUSTED: {reason}, RETURNING THE BEST ANSWER SO FAR---")
+            self.exhausted = reason
+        return reason is None
+
+    def allows_regeneration(self) -> bool:
+        if self.max_regenerations is not None and self.generations > self.max_regenerations:
+            if not self.exhausted:
+                logger.warning("---QUERY BUDGET EXHAUSTED: regenerations, RETURNING THE BEST ANSWER SO FAR---")
+                self.exhausted = "regenerations"
+            return False
+        return self.allows()
+
+    def record_generation(self):
+        with self._lock:
+            self.generations += 1
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        tokens = (response.llm_output or {}).get("token_usage", {}).get("total_tokens")
+        if tokens is None:
+            tokens = sum(
+                (getattr(generation, "message", None) and (generation.message.usage_metadata or {}).get("total_tokens")) or 0
+                for generations in response.generations for generation in generations
+            )
+        with self._lock:
+            self.llm_calls += 1
+            self.tokens += tokens
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any):
+        with self._lock:
+            self.llm_calls += 1
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "llm_calls": self.llm_calls,
+            "tokens": self.tokens,
+            "regenerations": max(self.generations - 1, 0),
+            "elapsed_seconds": round(self.elapsed_seconds, 4),
+            "exhausted": self.exhausted
+        }
+
+
+def get_budget(state, config: RunnableConfig | None = None) -> QueryBudget | None:
+    """
+    The budget of the run, attached to the callbacks of the calling node
+    so that the LLM calls the node makes are charged to it.
+    """
+    budget: QueryBudget | None = state.get("budget")
+    if budget is None or config is None:
+        return budget
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, BaseCallbackManager):
+        if budget not in callbacks.handlers:
+            callbacks.add_handler(budget, inherit=True)
+    elif isinstance(callbacks, list):
+        if budget not in callbacks:
+            callbacks.append(budget)
+    return budget
@@ -1,12 +1,12 @@
-from langchain.schema.runnable import RunnableSequence
+from functools import lru_cache
+
+from langchain_core.runnables import Runnable
 from langchain.pydantic_v1 import Field, BaseModel
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-
-from graph.constants import DEFAULT_COMPLETIONS_MODEL
 
-
-llm = ChatOpenAI(model=DEFAULT_COMPLETIONS_MODEL, temperature=0)
+from graph.chains.cache import cached_structured_output
+from graph.chains.llm import get_llm
+from graph.instrumentation import traced_chain
 
 
 class GradeAnswer(BaseModel):
@@ -16,8 +16,6 @@ class GradeAnswer(BaseModel):
     )
 
 
-structured_llm_answer_grader = llm.with_structured_output(GradeAnswer)
-
 system = """You are a grader assessing whether an answer addresses / resolves a question \n Give a binary score 'True' or 'False'. 'True' means that the answer resolves the question."""
 
 answer_prompt = ChatPromptTemplate.from_messages(
@@ -27,4 +25,14 @@ answer_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-answer_grader_chain:RunnableSequence = answer_prompt | structured_llm_answer_grader
\ No newline at end of file
+
+@lru_cache(maxsize=None)
+def get_answer_grader_chain() -> Runnable:
+    structured_llm_answer_grader = cached_structured_output("answer_grader", get_llm(), GradeAnswer)
+    return traced_chain("answer_grader", answer_prompt | structured_llm_answer_grader)
+
+
+def __getattr__(name: str):
+    if name == "answer_grader_chain":
+        return get_answer_grader_chain()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,69 @@
+from functools import lru_cache
+from typing import List
+
+from langchain.prompts import ChatPromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field
+from langchain_core.runnables import Runnable
+
+from graph.chains.cache import cached_structured_output
+from graph.chains.llm import get_llm
+from graph.instrumentation import traced_chain
+from graph.chains.retrieval_grader import GradeDocuments
+
+
+class DocumentGrade(BaseModel):
+    """Binary relevance score for one of the retrieved documents."""
+    index: int = Field(
+        description="Index of the document exactly as given in the prompt"
+    )
+    binary_score: str = Field(
+        description="Document is relevant to the question, 'yes' or 'no'"
+    )
+
+
+class GradeDocumentsBatch(BaseModel):
+    """Binary relevance scores for all the retrieved documents."""
+    grades: List[DocumentGrade] = Field(
+        description="Exactly one grade for every retrieved document"
+    )
+
+
+system_prompt = """You are a grader assessing relevance of several retrieved documents to a user question.
+Each document is wrapped in <document index="..."> tags. Grade every document on its own.
+If a document contains keyword(s) or semantic meaning related to the question, grade it as relevant.
+Return exactly one grade per document with its index and a binary score 'yes' or 'no' to indicate whether it is relevant to the question."""
+
+batch_grade_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", system_prompt),
+        ("human", "Retrieved documents: \n\n {documents} \n\n User question: {question}")
+    ]
+)
+
+
+def format_documents(documents: List[str]) -> str:
+    return "\n\n".join(
+        f'<document index="{index}">\n{document}\n</document>' for index, document in enumerate(documents)
+    )
+
+
+def parse_batch_grades(response: GradeDocumentsBatch | None, num_documents: int) -> List[GradeDocuments] | None:
+    """
+    Turn a batch response into one GradeDocuments per document, in document order.
+    Returns None when the response doesn't grade every document exactly once.
+    """
+    if response is None or len(response.grades) != num_documents:
+        return None
+    grades: List[GradeDocuments | None] = [None] * num_documents
+    for grade in response.grades:
+        binary_score = grade.binary_score.strip().lower()
+        if not 0 <= grade.index < num_documents or grades[grade.index] is not None or binary_score not in ("yes", "no"):
+            return None
+        grades[grade.index] = GradeDocuments(binary_score=binary_score)
+    return grades
+
+
+@lru_cache(maxsize=None)
+def get_batch_retrieval_grader() -> Runnable:
+    structured_llm_grader = cached_structured_output("batch_retrieval_grader", get_llm(), GradeDocumentsBatch)
+    return traced_chain("batch_retrieval_grader", batch_grade_prompt | structured_llm_grader)
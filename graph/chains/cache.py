@@ -0,0 +1,183 @@
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Type
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.prompt_values import PromptValue
+from langchain_core.pydantic_v1 import BaseModel
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from utils import logger
+from graph.constants import CHAIN_CACHE_HIT_EVENT, DEFAULT_CHAIN_CACHE_MAX_BYTES, DEFAULT_CHAIN_CACHE_MEMORY_ENTRIES
+from graph.streaming import aemit, emit
+
+
+class ChainCache:
+    """
+    Two tier cache for the outputs of deterministic structured chains:
+    an in-memory LRU in front of an optional SQLite file with size-based eviction.
+    Values are the JSON-serialisable dicts of the structured outputs.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_memory_entries: int = DEFAULT_CHAIN_CACHE_MEMORY_ENTRIES,
+        max_disk_bytes: int = DEFAULT_CHAIN_CACHE_MAX_BYTES
+    ):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.stats: Dict[str, Counter] = {}
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._disk_bytes = 0
+        if path:
+            self._open(path)
+
+    def _open(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS chain_outputs (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS chain_outputs_accessed_at ON chain_outputs (accessed_at)")
+        self._connection.commit()
+        self._disk_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM chain_outputs").fetchone()[0]
+
+    @staticmethod
+    def make_key(name: str, model: str, prompt: str) -> str:
+        return hashlib.sha256(json.dumps([name, model, prompt]).encode("utf-8")).hexdigest()
+
+    def _record(self, name: str, outcome: str):
+        self.stats.setdefault(name, Counter())[outcome] += 1
+
+    def _remember(self, key: str, value: Dict[str, Any]):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, name: str, key: str) -> Dict[str, Any] | None:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._record(name, "memory_hits")
+                return self._memory[key]
+            if self._connection:
+                row = self._connection.execute("SELECT value FROM chain_outputs WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self._connection.execute("UPDATE chain_outputs SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                    self._connection.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self._record(name, "disk_hits")
+                    return value
+            self._record(name, "misses")
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._remember(key, value)
+            if not self._connection:
+                return
+            serialized = json.dumps(value)
+            previous = self._connection.execute("SELECT size FROM chain_outputs WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO chain_outputs VALUES (?, ?, ?, ?)",
+                (key, serialized, len(serialized), time.time())
+            )
+            self._disk_bytes += len(serialized) - (previous[0] if previous else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        """Drop least recently used rows until the file is back under 90% of its byte budget."""
+        target = int(self.max_disk_bytes * 0.9)
+        rows = self._connection.execute("SELECT key, size FROM chain_outputs ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        self._connection.executemany("DELETE FROM chain_outputs WHERE key = ?", evicted)
+        logger.info(f"Evicted {len(evicted)} cached chain outputs")
+
+    def hit_rate(self, name: str | None = None) -> float:
+        counters = [self.stats.get(name, Counter())] if name else list(self.stats.values())
+        hits = sum(counter["memory_hits"] + counter["disk_hits"] for counter in counters)
+        total = hits + sum(counter["misses"] for counter in counters)
+        return hits / total if total else 0.0
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+
+_chain_cache: ChainCache | None = ChainCache()
+
+
+def get_chain_cache() -> ChainCache | None:
+    return _chain_cache
+
+
+def set_chain_cache(cache: ChainCache | None):
+    """Replace the process wide chain cache, pass None to disable memoization."""
+    global _chain_cache
+    _chain_cache = cache
+
+
+def cached_structured_output(name: str, llm, schema: Type[BaseModel]) -> Runnable:
+    """
+    Equivalent to llm.with_structured_output(schema), memoized on the chain name,
+    the model and a hash of the rendered prompt. Only use it for temperature 0 models.
+    """
+    structured_llm = llm.with_structured_output(schema)
+    model = getattr(llm, "model_name", type(llm).__name__)
+
+    def lookup(prompt: PromptValue):
+        cache = get_chain_cache()
+        if cache is None:
+            return None, None, None
+        key = ChainCache.make_key(name, model, prompt.to_string())
+        cached = cache.get(name, key)
+        return cache, key, schema(**cached) if cached is not None else None
+
+    def store(cache: ChainCache | None, key: str | None, result):
+        if cache is not None and result is not None:
+            cache.set(key, result.dict())
+
+    def invoke(prompt: PromptValue, config: RunnableConfig):
+        cache, key, cached = lookup(prompt)
+        if cached is not None:
+            emit(CHAIN_CACHE_HIT_EVENT, {"chain": name}, config)
+            return cached
+        result = structured_llm.invoke(prompt, config)
+        store(cache, key, result)
+        return result
+
+    async def ainvoke(prompt: PromptValue, config: RunnableConfig):
+        cache, key, cached = lookup(prompt)
+        if cached is not None:
+            await aemit(CHAIN_CACHE_HIT_EVENT, {"chain": name}, config)
+            return cached
+        result = await structured_llm.ainvoke(prompt, config)
+        store(cache, key, result)
+        return result
+
+    return RunnableLambda(invoke, afunc=ainvoke, name=f"{name}_cached")
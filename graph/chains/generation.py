@@ -1,12 +1,43 @@
-from langchain import hub
+from functools import lru_cache
+import os
+
 from langchain_core.output_parsers import StrOutputParser
-from langchain.schema.runnable import RunnableSequence
-from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+
+from graph.chains.llm import get_llm
+from graph.instrumentation import traced_chain
+from graph.constants import RAG_PROMPT_HUB_ID, USE_HUB_RAG_PROMPT_ENV
+
+
+# Local copy of the "rlm/rag-prompt" hub prompt, so generation works without network access
+rag_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "human",
+            "You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. "
+            "If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.\n"
+            "Question: {question} \nContext: {context} \nAnswer:"
+        )
+    ]
+)
+
+
+def get_generation_prompt() -> ChatPromptTemplate:
+    """Return the bundled RAG prompt, or pull the latest one from the hub when opted in."""
+    if os.getenv(USE_HUB_RAG_PROMPT_ENV, "").lower() in ("1", "true", "yes"):
+        from langchain import hub
+
+        return hub.pull(RAG_PROMPT_HUB_ID)
+    return rag_prompt
 
-from graph.constants import DEFAULT_COMPLETIONS_MODEL
 
+@lru_cache(maxsize=None)
+def get_generation_chain() -> Runnable:
+    return traced_chain("generation", get_generation_prompt() | get_llm() | StrOutputParser())
 
-llm = ChatOpenAI(model=DEFAULT_COMPLETIONS_MODEL, temperature=0)
-prompt = hub.pull("rlm/rag-prompt")
 
-generation_chain:RunnableSequence = prompt | llm | StrOutputParser()
\ No newline at end of file
+def __getattr__(name: str):
+    if name == "generation_chain":
+        return get_generation_chain()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
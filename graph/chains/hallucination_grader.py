@@ -1,12 +1,12 @@
+from functools import lru_cache
+
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain.schema.runnable import RunnableSequence
-from langchain_openai import ChatOpenAI
-
-from graph.constants import DEFAULT_COMPLETIONS_MODEL
-
+from langchain_core.runnables import Runnable
 
-llm = ChatOpenAI(model=DEFAULT_COMPLETIONS_MODEL, temperature=0)
+from graph.chains.cache import cached_structured_output
+from graph.chains.llm import get_llm
+from graph.instrumentation import traced_chain
 
 
 class GradeHallucination(BaseModel):
@@ -16,8 +16,6 @@ class GradeHallucination(BaseModel):
     )
 
 
-structured_llm_grader = llm.with_structured_output(GradeHallucination)
-
 system = """You are a grader assessing whether an LLM generation is grounded in / supported by a set of retrieved facts.\n
 Give a binary score 'yes' or 'no'. 'Yes' means that the answer is grounded in / supported by the set of facts."""
 
@@ -29,4 +27,13 @@ hallucination_prompt = ChatPromptTemplate.from_messages(
 )
 
 
-hallucination_grader_chain:RunnableSequence = hallucination_prompt | structured_llm_grader
+@lru_cache(maxsize=None)
+def get_hallucination_grader_chain() -> Runnable:
+    structured_llm_grader = cached_structured_output("hallucination_grader", get_llm(), GradeHallucination)
+    return traced_chain("hallucination_grader", hallucination_prompt | structured_llm_grader)
+
+
+def __getattr__(name: str):
+    if name == "hallucination_grader_chain":
+        return get_hallucination_grader_chain()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
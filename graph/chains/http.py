@@ -0,0 +1,142 @@
+from typing import AsyncIterator, Callable, Iterator, Tuple
+import json
+import time
+
+import httpx
+
+from graph.constants import (
+    DEFAULT_LLM_COMPLETION_TOKENS_ESTIMATE,
+    DEFAULT_LLM_HTTP_KEEPALIVE_CONNECTIONS,
+    DEFAULT_LLM_HTTP_MAX_CONNECTIONS,
+    FALLBACK_CHARS_PER_TOKEN
+)
+from graph.scheduler import LLMScheduler, Ticket, get_llm_scheduler
+
+
+def estimate_tokens(request: httpx.Request) -> float:
+    """
+    Tokens a completion request is charged, estimated the way OpenAI's limiter does it:
+    characters of the prompt over four plus the completion tokens the request may use.
+    """
+    try:
+        content = request.content
+    except httpx.RequestNotRead:
+        return DEFAULT_LLM_COMPLETION_TOKENS_ESTIMATE
+    try:
+        max_tokens = json.loads(content).get("max_tokens")
+    except (ValueError, AttributeError):
+        max_tokens = None
+    return len(content) / FALLBACK_CHARS_PER_TOKEN + (max_tokens or DEFAULT_LLM_COMPLETION_TOKENS_ESTIMATE)
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    try:
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        if "retry-after" in response.headers:
+            return float(response.headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+def _released_response(
+    scheduler: LLMScheduler, ticket: Ticket, response: httpx.Response, started: float, stream_type: type
+) -> httpx.Response:
+    """The response, holding the ticket's slot until its body is read, e.g. while an answer streams."""
+    latency = time.perf_counter() - started
+    throttled = response.status_code == 429
+    release_args = {"throttled": throttled, "retry_after": retry_after(response) if throttled else None}
+    if not throttled and response.status_code < 500:
+        release_args["latency"] = latency
+    response.stream = stream_type(response.stream, lambda: scheduler.release(ticket, **release_args))
+    return response
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """Sends requests through a pooled transport once the process wide LLM scheduler admits them."""
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        scheduler = get_llm_scheduler()
+        if scheduler is None:
+            return self._transport.handle_request(request)
+        ticket = scheduler.acquire(estimate_tokens(request))
+        started = time.perf_counter()
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            scheduler.release(ticket)
+            raise
+        return _released_response(scheduler, ticket, response, started, _ReleasingStream)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    """Async version of ScheduledTransport."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        scheduler = get_llm_scheduler()
+        if scheduler is None:
+            return await self._transport.handle_async_request(request)
+        ticket = await scheduler.aacquire(estimate_tokens(request))
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            scheduler.release(ticket)
+            raise
+        return _released_response(scheduler, ticket, response, started, _AsyncReleasingStream)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def scheduled_http_clients(
+    max_connections: int = DEFAULT_LLM_HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections: int = DEFAULT_LLM_HTTP_KEEPALIVE_CONNECTIONS
+) -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Sync and async clients keeping connections to the provider alive, with every request scheduled."""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+    return (
+        httpx.Client(transport=ScheduledTransport(httpx.HTTPTransport(limits=limits))),
+        httpx.AsyncClient(transport=AsyncScheduledTransport(httpx.AsyncHTTPTransport(limits=limits)))
+    )
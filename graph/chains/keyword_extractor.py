@@ -1,15 +1,13 @@
+from functools import lru_cache
 from typing import List
 
 from langchain.pydantic_v1 import BaseModel, Field
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain.schema import Document
-from langchain.schema.runnable import RunnableSequence
+from langchain_core.runnables import Runnable
 
-from graph.constants import DEFAULT_COMPLETIONS_MODEL
-
-
-llm = ChatOpenAI(model=DEFAULT_COMPLETIONS_MODEL, temperature=0)
+from graph.chains.cache import cached_structured_output
+from graph.chains.llm import get_llm
+from graph.instrumentation import traced_chain
 
 
 class DocumentKeywords(BaseModel):
@@ -20,8 +18,6 @@ class DocumentKeywords(BaseModel):
     )
 
 
-structured_llm_keyword_extractor = llm.with_structured_output(DocumentKeywords)
-
 system_prompt = """You are an expert an extracting keywords from a given document. Keywords can have either single word or two words at maximum."""
 extraction_prompt = ChatPromptTemplate.from_messages(
     [
@@ -30,4 +26,14 @@ extraction_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-keyword_extractor_chain:RunnableSequence = extraction_prompt | structured_llm_keyword_extractor
\ No newline at end of file
+
+@lru_cache(maxsize=None)
+def get_keyword_extractor_chain() -> Runnable:
+    structured_llm_keyword_extractor = cached_structured_output("keyword_extractor", get_llm(), DocumentKeywords)
+    return traced_chain("keyword_extractor", extraction_prompt | structured_llm_keyword_extractor)
+
+
+def __getattr__(name: str):
+    if name == "keyword_extractor_chain":
+        return get_keyword_extractor_chain()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
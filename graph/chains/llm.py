@@ -0,0 +1,64 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Tuple
+
+from graph.constants import DEFAULT_COMPLETIONS_MODEL
+
+if TYPE_CHECKING:
+    import httpx
+    from langchain_core.language_models import BaseChatModel
+
+
+_llm: "BaseChatModel | None" = None
+
+
+@lru_cache(maxsize=None)
+def get_http_clients() -> Tuple["httpx.Client", "httpx.AsyncClient"]:
+    """
+    The HTTP clients every chat model shares, so that connections to the provider are pooled across chains
+    and every request goes through the process wide LLM scheduler, see graph.scheduler.
+    """
+    from graph.chains.http import scheduled_http_clients
+
+    return scheduled_http_clients()
+
+
+@lru_cache(maxsize=None)
+def get_llm(model: str = DEFAULT_COMPLETIONS_MODEL, temperature: float = 0):
+    """
+    Build the chat model on first use. langchain_openai is imported here so that
+    importing the chain modules stays cheap and never needs credentials.
+    Streamed calls report their token usage too, for the query budget and the traces.
+    """
+    if _llm is not None:
+        return _llm
+    from langchain_openai import ChatOpenAI
+
+    http_client, http_async_client = get_http_clients()
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        stream_usage=True,
+        http_client=http_client,
+        http_async_client=http_async_client
+    )
+
+
+def set_llm(llm: "BaseChatModel | None"):
+    """
+    Replace the chat model of every chain, e.g. with a local fake for benchmarks.
+    Pass None to go back to OpenAI. Chains already built are rebuilt on their next use.
+    """
+    global _llm
+    from graph.chains import answer_grader, batch_retrieval_grader, generation, hallucination_grader, keyword_extractor, retrieval_grader
+
+    _llm = llm
+    get_llm.cache_clear()
+    for getter in (
+        answer_grader.get_answer_grader_chain,
+        batch_retrieval_grader.get_batch_retrieval_grader,
+        generation.get_generation_chain,
+        hallucination_grader.get_hallucination_grader_chain,
+        keyword_extractor.get_keyword_extractor_chain,
+        retrieval_grader.get_retrieval_grader
+    ):
+        getter.cache_clear()
@@ -1,14 +1,12 @@
+from functools import lru_cache
+
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI
-
-from graph.constants import DEFAULT_COMPLETIONS_MODEL
+from langchain_core.runnables import Runnable
 
-
-llm = ChatOpenAI(
-    model=DEFAULT_COMPLETIONS_MODEL,
-    temperature=0
-)
+from graph.chains.cache import cached_structured_output
+from graph.chains.llm import get_llm
+from graph.instrumentation import traced_chain
 
 
 class GradeDocuments(BaseModel):
@@ -18,8 +16,6 @@ class GradeDocuments(BaseModel):
     )
 
 
-structured_llm_grader = llm.with_structured_output(GradeDocuments)
-
 system_prompt = """You are a grader assessing relevance of a retrieved document to a user question.
 If the document contains keyword(s) or semantic meaning related to the question, grade it as relevant.
 Give a binary score 'yes' or 'no' score to indicate whether the document is relevant to the question."""
@@ -31,4 +27,14 @@ grade_final_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-retrieval_grader = grade_final_prompt | structured_llm_grader
\ No newline at end of file
+
+@lru_cache(maxsize=None)
+def get_retrieval_grader() -> Runnable:
+    structured_llm_grader = cached_structured_output("retrieval_grader", get_llm(), GradeDocuments)
+    return traced_chain("retrieval_grader", grade_final_prompt | structured_llm_grader)
+
+
+def __getattr__(name: str):
+    if name == "retrieval_grader":
+        return get_retrieval_grader()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
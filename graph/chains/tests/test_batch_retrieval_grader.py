@@ -0,0 +1,39 @@
+from graph.chains.batch_retrieval_grader import (
+    DocumentGrade,
+    GradeDocumentsBatch,
+    format_documents,
+    parse_batch_grades
+)
+
+
+def test_format_documents_tags_every_document_with_its_index() -> None:
+    formatted = format_documents(["first", "second"])
+    assert '<document index="0">\nfirst\n</document>' in formatted
+    assert '<document index="1">\nsecond\n</document>' in formatted
+
+
+def test_parse_batch_grades_orders_by_index() -> None:
+    response = GradeDocumentsBatch(grades=[
+        DocumentGrade(index=1, binary_score="No"),
+        DocumentGrade(index=0, binary_score="yes"),
+    ])
+    grades = parse_batch_grades(response, 2)
+    assert [grade.binary_score for grade in grades] == ["yes", "no"]
+
+
+def test_parse_batch_grades_rejects_malformed_responses() -> None:
+    missing = GradeDocumentsBatch(grades=[DocumentGrade(index=0, binary_score="yes")])
+    duplicate = GradeDocumentsBatch(grades=[
+        DocumentGrade(index=0, binary_score="yes"),
+        DocumentGrade(index=0, binary_score="no"),
+    ])
+    out_of_range = GradeDocumentsBatch(grades=[
+        DocumentGrade(index=0, binary_score="yes"),
+        DocumentGrade(index=2, binary_score="no"),
+    ])
+    unknown_score = GradeDocumentsBatch(grades=[
+        DocumentGrade(index=0, binary_score="yes"),
+        DocumentGrade(index=1, binary_score="maybe"),
+    ])
+    for response in (None, missing, duplicate, out_of_range, unknown_score):
+        assert parse_batch_grades(response, 2) is None
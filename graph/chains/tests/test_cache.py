@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from graph.chains.cache import ChainCache, cached_structured_output, set_chain_cache
+from graph.chains.retrieval_grader import GradeDocuments
+
+
+class CountingLLM:
+    model_name = "counting-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        def grade(prompt):
+            self.calls += 1
+            return schema(binary_score="yes")
+        return RunnableLambda(grade)
+
+
+prompt = ChatPromptTemplate.from_messages([("human", "Document: {document} Question: {question}")])
+
+
+def test_repeated_inputs_hit_the_cache() -> None:
+    cache = ChainCache()
+    set_chain_cache(cache)
+    llm = CountingLLM()
+    chain = prompt | cached_structured_output("retrieval_grader", llm, GradeDocuments)
+    try:
+        first = chain.invoke({"document": "a", "question": "q"})
+        second = chain.invoke({"document": "a", "question": "q"})
+        asyncio.run(chain.ainvoke({"document": "b", "question": "q"}))
+    finally:
+        set_chain_cache(ChainCache())
+
+    assert first == second == GradeDocuments(binary_score="yes")
+    assert llm.calls == 2
+    assert cache.stats["retrieval_grader"]["memory_hits"] == 1
+    assert cache.stats["retrieval_grader"]["misses"] == 2
+
+
+def test_disabled_cache_always_calls_the_model() -> None:
+    set_chain_cache(None)
+    llm = CountingLLM()
+    chain = prompt | cached_structured_output("retrieval_grader", llm, GradeDocuments)
+    try:
+        chain.invoke({"document": "a", "question": "q"})
+        chain.invoke({"document": "a", "question": "q"})
+    finally:
+        set_chain_cache(ChainCache())
+    assert llm.calls == 2
+
+
+def test_disk_tier_persists_and_evicts_by_size(tmp_path) -> None:
+    path = os.path.join(tmp_path, "chains.sqlite")
+    cache = ChainCache(path=path, max_disk_bytes=100)
+    for index in range(10):
+        cache.set(f"key-{index}", {"binary_score": "yes", "padding": "x" * 10})
+    cache.close()
+
+    reopened = ChainCache(path=path, max_disk_bytes=100)
+    assert reopened._disk_bytes <= 100
+    assert reopened.get("retrieval_grader", "key-9") == {"binary_score": "yes", "padding": "x" * 10}
+    assert reopened.get("retrieval_grader", "key-0") is None
+    assert reopened.stats["retrieval_grader"]["disk_hits"] == 1
@@ -1,72 +1,79 @@
 from typing import List
 from pprint import pprint
+import os
 
+import pytest
 from dotenv import load_dotenv
 from langchain_core.vectorstores import VectorStoreRetriever
 from langchain_core.documents import Document
 
-from graph.chains.retrieval_grader import GradeDocuments, retrieval_grader
-from graph.chains.hallucination_grader import GradeHallucination, hallucination_grader_chain
-from graph.chains.keyword_extractor import DocumentKeywords, keyword_extractor_chain
-from graph.chains.generation import generation_chain
+from graph.chains.retrieval_grader import GradeDocuments, get_retrieval_grader
+from graph.chains.hallucination_grader import GradeHallucination, get_hallucination_grader_chain
+from graph.chains.keyword_extractor import DocumentKeywords, get_keyword_extractor_chain
+from graph.chains.generation import get_generation_chain
 from graph.ingest import RAGVectorStore
 from constants import DEFAULT_COLLECTION_NAME, DEFAULT_PERSIST_DIRECTORY
 
 
 load_dotenv()
-retriever:VectorStoreRetriever = RAGVectorStore.get_retriever(
-                                            collection_name=DEFAULT_COLLECTION_NAME,
-                                            persist_directory=DEFAULT_PERSIST_DIRECTORY
-                                        )
+# These tests call the OpenAI API, offline runs use python -m benchmarks.end_to_end instead
+pytestmark = pytest.mark.skipif(not os.getenv("OPENAI_API_KEY"), reason="OPENAI_API_KEY is not set")
 
 
-def test_retrieval_grader_answer_yes() -> None:
+@pytest.fixture(scope="module")
+def retriever() -> VectorStoreRetriever:
+    if not os.path.exists(DEFAULT_PERSIST_DIRECTORY):
+        pytest.skip(f"No vector store ingested in {DEFAULT_PERSIST_DIRECTORY}")
+    return RAGVectorStore(DEFAULT_COLLECTION_NAME, DEFAULT_PERSIST_DIRECTORY).get_retriever()
+
+
+def test_retrieval_grader_answer_yes(retriever) -> None:
     question = "prompt engineering"
     docs:List[Document] = retriever.invoke(question)
     doc_txt = docs[0].page_content
 
-    res: GradeDocuments = retrieval_grader.invoke(
+    res: GradeDocuments = get_retrieval_grader().invoke(
         {"question": question, "document": doc_txt}
     )
 
     assert res.binary_score == "yes"
 
 
-def test_retrieval_grader_answer_no() -> None:
+def test_retrieval_grader_answer_no(retriever) -> None:
     question = "how to make pizza"
     docs:List[Document] = retriever.invoke(question)
     doc_txt = docs[0].page_content
 
-    res: GradeDocuments = retrieval_grader.invoke(
+    res: GradeDocuments = get_retrieval_grader().invoke(
         {"question": question, "document": doc_txt}
     )
 
     assert res.binary_score == "no"
 
 
-def test_generation_chain() -> None:
+def test_generation_chain(retriever) -> None:
     question = "how to reduce hallucinations in LLMs?"
     docs = retriever.invoke(question)
-    generation = generation_chain.invoke({"context": docs, "question": question})
+    generation = get_generation_chain().invoke({"context": docs, "question": question})
     pprint(generation)
 
 
-def test_hallucination_grader_answer_yes() -> None:
+def test_hallucination_grader_answer_yes(retriever) -> None:
     question = "prompt engineering"
     docs = retriever.invoke(question)
 
-    answer:str = generation_chain.invoke({"context": docs, "question": question})
-    res:GradeHallucination = hallucination_grader_chain.invoke(
+    answer:str = get_generation_chain().invoke({"context": docs, "question": question})
+    res:GradeHallucination = get_hallucination_grader_chain().invoke(
         {"documents": docs, "answer": answer}
     )
     assert res.binary_score == True
 
 
-def test_hallucination_grader_answer_no() -> None:
+def test_hallucination_grader_answer_no(retriever) -> None:
     question = "prompt engineering"
     docs = retriever.invoke(question)
 
-    res:GradeHallucination = hallucination_grader_chain.invoke(
+    res:GradeHallucination = get_hallucination_grader_chain().invoke(
         {
             "documents": docs,
             "answer": "In order to make pizza, we first need to start with the dough"
@@ -78,10 +85,10 @@ def test_hallucination_grader_answer_no() -> None:
 def test_keyword_extractor_chain() -> None:
     document = "Prompt engineering is the process of structuring an instruction that can be interpreted and understood by a generative AI model."
     expected_keywords = ["prompt engineering", "process", "structuring", "instruction", "generative ai", "model"]
-    res:DocumentKeywords = keyword_extractor_chain.invoke(
+    res:DocumentKeywords = get_keyword_extractor_chain().invoke(
         {"document": document}
     )
     keywords = res.keywords
     print(keywords)
     matched_keywords = [keyword for keyword in keywords if keyword.lower() in expected_keywords]
-    assert len(matched_keywords) >= len(expected_keywords)//2
\ No newline at end of file
+    assert len(matched_keywords) >= len(expected_keywords)//2
@@ -0,0 +1,21 @@
+from graph.chains.generation import get_generation_prompt, rag_prompt
+from graph.constants import USE_HUB_RAG_PROMPT_ENV
+
+
+def test_generation_prompt_is_bundled(monkeypatch) -> None:
+    monkeypatch.delenv(USE_HUB_RAG_PROMPT_ENV, raising=False)
+    prompt = get_generation_prompt()
+
+    assert prompt is rag_prompt
+    assert set(prompt.input_variables) == {"context", "question"}
+
+
+def test_chain_modules_import_without_credentials(monkeypatch) -> None:
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    import graph.chains.answer_grader
+    import graph.chains.hallucination_grader
+    import graph.chains.keyword_extractor
+    import graph.chains.retrieval_grader
+    import graph.graph
+
+    assert graph.graph.app is not None
@@ -0,0 +1,87 @@
+from collections import deque
+from typing import Callable, Deque, Iterable, Iterator, List, Tuple, TypeVar
+import concurrent.futures
+import multiprocessing
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter, TextSplitter
+
+from graph.constants import DEFAULT_CHUNKING_BATCH_SIZE
+from graph import utils
+
+
+T = TypeVar("T")
+
+_worker_text_splitter: TextSplitter | None = None
+
+
+def default_text_splitter() -> TextSplitter:
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(chunk_size=250, chunk_overlap=0)
+
+
+def chunk_documents(text_splitter: TextSplitter, documents: List[Document]) -> List[Document]:
+    """Split the documents into chunks with their whitespace cleaned, the same way in and out of the workers."""
+    return utils.preprocess_documents(text_splitter.split_documents(documents))
+
+
+def _init_worker(text_splitter: TextSplitter | None):
+    global _worker_text_splitter
+    _worker_text_splitter = text_splitter or default_text_splitter()
+
+
+def _chunk_in_worker(documents: List[Document]) -> List[Document]:
+    return chunk_documents(_worker_text_splitter, documents)
+
+
+class ChunkingPool:
+    """
+    Worker processes splitting and cleaning documents, work the GIL would otherwise keep on a single core.
+    Documents are split one by one, so chunking them in batches on several processes and concatenating
+    the batches in order gives exactly the chunks of chunk_documents.
+
+    Workers are spawned rather than forked, as ingestion runs threads that a fork could copy mid-lock.
+    text_splitter is sent to every worker, None has each of them build the default tiktoken splitter.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        text_splitter: TextSplitter | None = None,
+        batch_size: int = DEFAULT_CHUNKING_BATCH_SIZE
+    ):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(text_splitter,)
+        )
+
+    def chunk(self, documents: List[Document]) -> List[Document]:
+        batches = [documents[start:start + self.batch_size] for start in range(0, len(documents), self.batch_size)]
+        return [chunk for chunks in self._executor.map(_chunk_in_worker, batches) for chunk in chunks]
+
+    def chunk_each(
+        self, items: Iterable[T], documents: Callable[[T], List[Document]]
+    ) -> Iterator[Tuple[T, List[Document]]]:
+        """
+        Chunk the documents of every item as the items come, e.g. fetched pages, and yield the items with
+        their chunks in order. A couple of items per worker are chunked ahead of the one yielded next.
+        """
+        pending: Deque[Tuple[T, concurrent.futures.Future | None]] = deque()
+
+        def resolve(entry: Tuple[T, concurrent.futures.Future | None]) -> Tuple[T, List[Document]]:
+            item, future = entry
+            return item, future.result() if future is not None else []
+
+        for item in items:
+            item_documents = documents(item)
+            pending.append((item, self._executor.submit(_chunk_in_worker, item_documents) if item_documents else None))
+            while pending and (len(pending) > 2 * self.workers or pending[0][1] is None or pending[0][1].done()):
+                yield resolve(pending.popleft())
+        while pending:
+            yield resolve(pending.popleft())
+
+    def close(self):
+        self._executor.shutdown()
@@ -0,0 +1,163 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Set
+import math
+import re
+
+from langchain.schema import Document
+
+from utils import logger
+from graph.bm25 import lexical_tokens
+from graph.constants import DEFAULT_COMPLETIONS_MODEL, DEFAULT_CONTEXT_SENTENCE_WINDOW, FALLBACK_CHARS_PER_TOKEN
+
+
+SENTENCE_BREAK_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(DEFAULT_COMPLETIONS_MODEL)
+    except Exception as e:
+        # The encodings are downloaded on first use, offline the length based estimate stands in
+        logger.warning(f"Tiktoken encoding unavailable, estimating token counts from lengths: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return math.ceil(len(text) / FALLBACK_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * FALLBACK_CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def normalize_text(text: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", text).strip().lower()
+
+
+def deduplicate_documents(documents: List[Document]) -> List[Document]:
+    """Drop documents whose text, ignoring case and whitespace, was already seen, keeping the first."""
+    seen: Set[str] = set()
+    unique = []
+    for document in documents:
+        key = normalize_text(document.page_content)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(document)
+    return unique
+
+
+@dataclass
+class _Sentence:
+    document: int
+    position: int
+    text: str
+    terms: Set[str]
+    priority: float | None = None
+
+
+def _split_sentences(documents: List[Document]) -> List[_Sentence]:
+    seen: Set[str] = set()
+    sentences = []
+    for document_index, document in enumerate(documents):
+        for position, text in enumerate(SENTENCE_BREAK_PATTERN.split(document.page_content)):
+            text = text.strip()
+            key = normalize_text(text)
+            # Web results often repeat a retrieved chunk, or each other, sentence for sentence
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            sentences.append(_Sentence(document_index, position, text, set(lexical_tokens(text))))
+    return sentences
+
+
+def _prioritize(question: str, sentences: List[_Sentence], window: int):
+    """
+    Score every sentence by the idf weighted question terms it contains. Sentences around a matching one
+    inherit half its score, as they often carry the subject it refers to. Documents without any matching
+    sentence were still graded relevant, their sentences are kept last. Other sentences are dropped.
+    """
+    question_terms = set(lexical_tokens(question))
+    frequencies: Dict[str, int] = {}
+    for sentence in sentences:
+        for term in sentence.terms & question_terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+    for sentence in sentences:
+        score = sum(math.log(1 + len(sentences) / frequencies[term]) for term in sentence.terms & question_terms)
+        sentence.priority = score or None
+
+    by_document: Dict[int, List[_Sentence]] = {}
+    for sentence in sentences:
+        by_document.setdefault(sentence.document, []).append(sentence)
+    for document_sentences in by_document.values():
+        scores = [sentence.priority for sentence in document_sentences]
+        if not any(scores):
+            for sentence in document_sentences:
+                sentence.priority = 0.0
+            continue
+        for index, sentence in enumerate(document_sentences):
+            if scores[index] is None:
+                neighbours = [score for score in scores[max(0, index - window):index + window + 1] if score]
+                sentence.priority = max(neighbours) / 2 if neighbours else None
+
+
+def compress_documents(
+    question: str,
+    documents: List[Document],
+    max_tokens: int | None,
+    window: int = DEFAULT_CONTEXT_SENTENCE_WINDOW,
+    token_counter: Callable[[str], int] = count_tokens
+) -> List[Document]:
+    """
+    Shrink documents to the sentences that matter for the question, within max_tokens of text.
+
+    Duplicate documents and sentences are dropped, the others are taken best first until the budget
+    is spent and put back in their original order. The compressed documents only keep their source
+    in the metadata, the prompts render the documents whole and ids or keywords would cost tokens too.
+    """
+    documents = deduplicate_documents(documents)
+    sentences = _split_sentences(documents)
+    _prioritize(question, sentences, window)
+    candidates = sorted(
+        (sentence for sentence in sentences if sentence.priority is not None),
+        key=lambda sentence: (-sentence.priority, sentence.document, sentence.position)
+    )
+
+    selected: List[_Sentence] = []
+    remaining = max_tokens
+    for sentence in candidates:
+        if remaining is None:
+            selected.append(sentence)
+            continue
+        # Joining sentences costs about a token each
+        tokens = token_counter(sentence.text) + 1
+        if tokens <= remaining:
+            selected.append(sentence)
+            remaining -= tokens
+        elif not selected and remaining > 1:
+            # Better part of the best sentence than no context at all
+            sentence.text = truncate_to_tokens(sentence.text, remaining - 1)
+            selected.append(sentence)
+            remaining = 0
+
+    texts: Dict[int, List[_Sentence]] = {}
+    for sentence in sorted(selected, key=lambda sentence: (sentence.document, sentence.position)):
+        texts.setdefault(sentence.document, []).append(sentence)
+    compressed = []
+    for document_index, document_sentences in texts.items():
+        source = documents[document_index].metadata.get("source")
+        compressed.append(Document(
+            page_content=" ".join(sentence.text for sentence in document_sentences),
+            metadata={"source": source} if source else {}
+        ))
+    return compressed
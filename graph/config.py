@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+from typing import Tuple
+
+from graph.constants import (
+    BATCH_GRADING,
+    DEFAULT_BATCH_GRADING_MAX_CHARS,
+    DEFAULT_CONTEXT_MAX_TOKENS,
+    DEFAULT_CONTEXT_SENTENCE_WINDOW,
+    DEFAULT_DEADLINE_SECONDS,
+    DEFAULT_HYBRID_FETCH_K,
+    DEFAULT_LEXICAL_WEIGHT,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_LLM_CALLS,
+    DEFAULT_MAX_REGENERATIONS,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_RETRIEVAL_K,
+    DEFAULT_ROUTE_MIN_KEYWORD_OVERLAP,
+    DEFAULT_ROUTE_MIN_RELEVANCE,
+    DEFAULT_RRF_K,
+    DEFAULT_SPECULATIVE_MAX_RELEVANCE,
+    DEFAULT_VECTOR_WEIGHT,
+    DEFAULT_WRITE_BACK_MIN_CHARS,
+    KEYWORD_ROUTING,
+    SPECULATE_NEVER,
+    VECTOR_RETRIEVAL
+)
+
+
+@dataclass
+class RAGConfig:
+    """
+    Tunable settings for a single run of the graph, passed in through the "config" key of the state.
+
+    Attributes:
+        max_concurrency(int): maximum number of LLM calls a node issues at the same time
+        grading_mode(str): "batch" to grade all retrieved documents in one LLM call, "per_document" for one call each
+        batch_grading_max_chars(int): documents longer than this in total are graded one by one
+        routing_mode(str): "keywords" to route on keywords extracted from the question,
+            "score" to route on retrieval scores and keyword overlap without an LLM call
+        retrieval_k(int): number of documents retrieved from the vector store
+        retrieval_mode(str): "vector" for Chroma similarity search, "hybrid" to fuse it with BM25 keyword search
+        hybrid_fetch_k(int): candidates taken from each ranking before "hybrid" fuses them
+        vector_weight(float): weight of the vector ranking in the reciprocal rank fusion
+        lexical_weight(float): weight of the BM25 ranking in the reciprocal rank fusion
+        rrf_k(int): constant of the reciprocal rank fusion, higher values flatten the weight of the top ranks
+        keyword_prefilter(bool): "hybrid" only searches the chunks tagged with one of the question's keywords, when any
+        route_min_relevance(float): "score" routing retrieves when the best match is at least this relevant
+        route_min_keyword_overlap(float): or when at least this share of the question's keywords is indexed
+        speculative_web_search(str): when retrieve starts the web search in the background, "never", "always",
+            or "low_relevance" when the best retrieved document is less relevant than speculative_max_relevance
+        speculative_max_relevance(float): relevance below which "low_relevance" speculates
+        max_llm_calls(int): default LLM call budget of a question, None for unlimited
+        max_tokens(int): default token budget of a question, None for unlimited
+        max_regenerations(int): default number of times an answer may be regenerated, None for unlimited
+        deadline_seconds(float): default wall-clock budget of a question, None for unlimited
+        compress_context(bool): whether graded documents are cut down to the sentences matching the question
+            before generation and the hallucination grader see them
+        context_max_tokens(int): tokens of document text left after compression, None for unlimited
+        context_sentence_window(int): sentences kept on each side of one matching the question
+        web_search_write_back(bool): whether trusted web results are ingested into the retriever's collection,
+            so the next question on the same topic is answered from the vector store
+        write_back_domains(Tuple[str, ...]): domains, subdomains included, whose results are trusted, any when empty
+        write_back_min_chars(int): shorter web results are never written back
+    """
+
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    grading_mode: str = BATCH_GRADING
+    batch_grading_max_chars: int = DEFAULT_BATCH_GRADING_MAX_CHARS
+    routing_mode: str = KEYWORD_ROUTING
+    retrieval_k: int = DEFAULT_RETRIEVAL_K
+    retrieval_mode: str = VECTOR_RETRIEVAL
+    hybrid_fetch_k: int = DEFAULT_HYBRID_FETCH_K
+    vector_weight: float = DEFAULT_VECTOR_WEIGHT
+    lexical_weight: float = DEFAULT_LEXICAL_WEIGHT
+    rrf_k: int = DEFAULT_RRF_K
+    keyword_prefilter: bool = False
+    route_min_relevance: float = DEFAULT_ROUTE_MIN_RELEVANCE
+    route_min_keyword_overlap: float = DEFAULT_ROUTE_MIN_KEYWORD_OVERLAP
+    speculative_web_search: str = SPECULATE_NEVER
+    speculative_max_relevance: float = DEFAULT_SPECULATIVE_MAX_RELEVANCE
+    max_llm_calls: int | None = DEFAULT_MAX_LLM_CALLS
+    max_tokens: int | None = DEFAULT_MAX_TOKENS
+    max_regenerations: int | None = DEFAULT_MAX_REGENERATIONS
+    deadline_seconds: float | None = DEFAULT_DEADLINE_SECONDS
+    compress_context: bool = True
+    context_max_tokens: int | None = DEFAULT_CONTEXT_MAX_TOKENS
+    context_sentence_window: int = DEFAULT_CONTEXT_SENTENCE_WINDOW
+    web_search_write_back: bool = False
+    write_back_domains: Tuple[str, ...] = ()
+    write_back_min_chars: int = DEFAULT_WRITE_BACK_MIN_CHARS
+
+
+def get_config(state) -> RAGConfig:
+    return state.get("config") or RAGConfig()
@@ -2,4 +2,126 @@ RETRIEVE = "retrieve"
 GRADE_DOCUMENTS = "grade_documents"
 GENERATE = "generate"
 WEB_SEARCH = "websearch"
-DEFAULT_COMPLETIONS_MODEL = "gpt-4o-mini"
\ No newline at end of file
+ROUTE = "route"
+COMPRESS_CONTEXT = "compress_context"
+DEFAULT_COMPLETIONS_MODEL = "gpt-4o-mini"
+RAG_PROMPT_HUB_ID = "rlm/rag-prompt"
+USE_HUB_RAG_PROMPT_ENV = "USE_HUB_RAG_PROMPT"
+
+DEFAULT_MAX_CONCURRENCY = 3
+
+PER_DOCUMENT_GRADING = "per_document"
+BATCH_GRADING = "batch"
+DEFAULT_BATCH_GRADING_MAX_CHARS = 24000
+
+DEFAULT_ANSWER_CACHE_MAX_ENTRIES = 10000
+DEFAULT_ANSWER_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+
+DEFAULT_CHAIN_CACHE_MEMORY_ENTRIES = 10000
+DEFAULT_CHAIN_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+DEFAULT_FETCH_WORKERS = 16
+DEFAULT_FETCH_PER_HOST_LIMIT = 4
+DEFAULT_FETCH_TIMEOUT_SECONDS = 20
+DEFAULT_FETCH_RETRIES = 2
+DEFAULT_FETCH_BACKOFF_SECONDS = 0.5
+
+DEFAULT_URL_BATCH_SIZE = 32
+DEFAULT_WRITE_BATCH_SIZE = 64
+DEFAULT_PIPELINE_QUEUE_SIZE = 4
+DEFAULT_CHECKPOINT_EVERY_BATCHES = 10
+
+OPENAI_EMBEDDINGS = "openai"
+HASHING_EMBEDDINGS = "hashing"
+DEFAULT_EMBEDDING_BATCH_SIZE = 256
+DEFAULT_EMBEDDING_CACHE_MEMORY_ENTRIES = 10000
+DEFAULT_HASHING_EMBEDDING_DIMENSIONS = 512
+
+LLM_KEYWORDS = "llm"
+TFIDF_KEYWORDS = "tfidf"
+DEFAULT_LOCAL_KEYWORDS_PER_CHUNK = 10
+
+KEYWORD_ROUTING = "keywords"
+SCORE_ROUTING = "score"
+# Same k as the retriever returned by RAGVectorStore.get_retriever, so routed documents can be reused
+DEFAULT_RETRIEVAL_K = 4
+# Distance space of new collections. Relevance scores are the cosine similarity whatever the space,
+# see graph.retrieval.RELEVANCE_FUNCTIONS
+DEFAULT_DISTANCE_SPACE = "cosine"
+# Cosine similarity of the best match. The former 0.3, on LangChain's 1 - distance / sqrt(2) of Chroma's
+# squared l2 distances, was this same cosine of 0.5. Recalibrate per collection and embedder with
+# graph.routing.calibrate_threshold
+DEFAULT_ROUTE_MIN_RELEVANCE = 0.5
+DEFAULT_ROUTE_MIN_KEYWORD_OVERLAP = 0.5
+
+SPECULATE_NEVER = "never"
+SPECULATE_ALWAYS = "always"
+SPECULATE_LOW_RELEVANCE = "low_relevance"
+DEFAULT_SPECULATIVE_MAX_RELEVANCE = 0.5
+DEFAULT_SPECULATIVE_SEARCH_WORKERS = 8
+
+ANSWER_TOKEN_EVENT = "answer_token"
+GENERATION_STARTED_EVENT = "generation_started"
+VERIFICATION_EVENT = "verification"
+
+BUDGET_EXHAUSTED = "budget_exhausted"
+DEFAULT_MAX_LLM_CALLS = 25
+DEFAULT_MAX_TOKENS = 100000
+DEFAULT_MAX_REGENERATIONS = 2
+DEFAULT_DEADLINE_SECONDS = 120.0
+
+CHAIN_CACHE_HIT_EVENT = "chain_cache_hit"
+RETRY_EVENT = "retry"
+# Upper bounds in seconds of the latency histograms, from a cached grading call to a slow regeneration loop
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+VECTOR_RETRIEVAL = "vector"
+HYBRID_RETRIEVAL = "hybrid"
+DEFAULT_BM25_K1 = 1.5
+DEFAULT_BM25_B = 0.75
+# Constant of reciprocal rank fusion, 60 as in the original paper
+DEFAULT_RRF_K = 60
+DEFAULT_VECTOR_WEIGHT = 1.0
+DEFAULT_LEXICAL_WEIGHT = 1.0
+# Candidates taken from each of the vector and lexical rankings before fusing them
+DEFAULT_HYBRID_FETCH_K = 20
+# Above this many chunks matching the question's keywords, filtering by them no longer shrinks the search much
+DEFAULT_PREFILTER_MAX_CANDIDATES = 5000
+
+# Tokens of retrieved text passed to generation and the hallucination grader
+DEFAULT_CONTEXT_MAX_TOKENS = 2000
+# Sentences on each side of one matching the question kept with it
+DEFAULT_CONTEXT_SENTENCE_WINDOW = 1
+# Rough length of an English token, to count tokens when no tiktoken encoding can be loaded
+FALLBACK_CHARS_PER_TOKEN = 4
+
+DEFAULT_WEB_SEARCH_CACHE_MAX_ENTRIES = 1000
+DEFAULT_WEB_SEARCH_CACHE_TTL_SECONDS = 60 * 60
+# Shorter web results are mostly navigation or teasers, not worth keeping in the collection
+DEFAULT_WRITE_BACK_MIN_CHARS = 200
+
+HASH_SHARDING = "hash"
+DOMAIN_SHARDING = "domain"
+
+INTERACTIVE_PRIORITY = "interactive"
+BULK_PRIORITY = "bulk"
+DEFAULT_LLM_INITIAL_CONCURRENCY = 8
+DEFAULT_LLM_MIN_CONCURRENCY = 1
+DEFAULT_LLM_MAX_CONCURRENCY = 64
+# Slower answers than this halve the concurrency, as they mean the provider is queueing requests
+DEFAULT_LLM_TARGET_LATENCY_SECONDS = 30.0
+# Completion tokens charged to the token bucket for requests without max_tokens, as the provider reserves some too
+DEFAULT_LLM_COMPLETION_TOKENS_ESTIMATE = 500
+DEFAULT_LLM_HTTP_MAX_CONNECTIONS = 100
+DEFAULT_LLM_HTTP_KEEPALIVE_CONNECTIONS = 20
+
+# Chunking runs in the ingesting process unless more workers are configured
+DEFAULT_CHUNKING_WORKERS = 1
+# Documents sent to a chunking worker at a time, enough to outweigh pickling them
+DEFAULT_CHUNKING_BATCH_SIZE = 32
+
+# Coarse IVF lists searched per question in a snapshot partitioned into lists
+DEFAULT_IVF_PROBES = 8
+# k-means iterations placing the IVF lists when a snapshot is exported
+DEFAULT_IVF_ITERATIONS = 10
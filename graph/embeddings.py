@@ -0,0 +1,207 @@
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils import logger
+from graph.constants import (
+    DEFAULT_EMBEDDING_BATCH_SIZE,
+    DEFAULT_EMBEDDING_CACHE_MEMORY_ENTRIES,
+    DEFAULT_HASHING_EMBEDDING_DIMENSIONS,
+    HASHING_EMBEDDINGS,
+    OPENAI_EMBEDDINGS
+)
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local CPU embedder using signed feature hashing of unigrams and bigrams.
+    It needs no network or model download, so it suits tests, offline runs and benchmarks.
+    """
+
+    def __init__(self, dimensions: int = DEFAULT_HASHING_EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    @property
+    def model_name(self) -> str:
+        return f"{HASHING_EMBEDDINGS}-{self.dimensions}"
+
+    def _embed(self, text: str) -> np.ndarray:
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        features = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        if not features:
+            return vector
+        digests = np.array(
+            [int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little") for feature in features],
+            dtype=np.uint64
+        )
+        indices = (digests % np.uint64(self.dimensions)).astype(np.int64)
+        signs = np.where((digests >> np.uint64(63)) == 1, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, indices, signs)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps another embedder with a cache keyed by a hash of the namespace, naming the backend, model
+    and dimensions, and the text, shared by ingestion and querying: a bounded in-memory LRU in front
+    of an optional persistent SQLite file. Cached vectors of another size than the embedder's are ignored.
+    Misses are embedded in batches of batch_size.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        path: str | None,
+        namespace: str,
+        batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+        max_memory_entries: int = DEFAULT_EMBEDDING_CACHE_MEMORY_ENTRIES,
+        dimensions: int | None = None
+    ):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.max_memory_entries = max_memory_entries
+        self.hits = 0
+        self.misses = 0
+        # Learned from the first vector embedded when the embedder doesn't say
+        self.dimensions = dimensions
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._connection: sqlite3.Connection | None = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._connection.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _fits(self, vector: List[float]) -> bool:
+        return self.dimensions is None or len(vector) == self.dimensions
+
+    def _load(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for key in keys:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[key] = self._memory[key]
+        missing = [key for key in keys if key not in found]
+        if self._connection is None:
+            return found
+        # Stay well under SQLite's limit on bound parameters
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            rows = self._connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, vector in rows:
+                vector = np.frombuffer(vector, dtype=np.float32).tolist()
+                if self._fits(vector):
+                    found[key] = vector
+                    self._remember(key, vector)
+        return found
+
+    def _save(self, items: Dict[str, List[float]]):
+        for key, vector in items.items():
+            if self.dimensions is None:
+                self.dimensions = len(vector)
+            self._remember(key, vector)
+        if self._connection is not None:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+            )
+            self._connection.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            cached = self._load(list(set(keys)))
+            missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), self.batch_size):
+            batch_keys = missing_keys[start:start + self.batch_size]
+            vectors = self.underlying.embed_documents([missing[key] for key in batch_keys])
+            embedded = dict(zip(batch_keys, vectors))
+            with self._lock:
+                self._save(embedded)
+            cached.update(embedded)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        with self._lock:
+            cached = self._load([key])
+            if key in cached:
+                self.hits += 1
+                return cached[key]
+            self.misses += 1
+        vector = self.underlying.embed_query(text)
+        with self._lock:
+            self._save({key: vector})
+        return vector
+
+
+def get_embeddings(
+    backend: str = OPENAI_EMBEDDINGS,
+    cache_path: str | None = None,
+    batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE
+) -> Embeddings:
+    """Build the embedder for the given backend, wrapped in a persistent cache when cache_path is set."""
+    if backend == OPENAI_EMBEDDINGS:
+        from langchain_openai import OpenAIEmbeddings
+
+        embeddings = OpenAIEmbeddings(chunk_size=batch_size)
+        namespace = f"{OPENAI_EMBEDDINGS}-{embeddings.model}-{embeddings.dimensions or 'native'}"
+        dimensions = embeddings.dimensions
+    elif backend == HASHING_EMBEDDINGS:
+        embeddings = HashingEmbeddings()
+        namespace = embeddings.model_name
+        dimensions = embeddings.dimensions
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    if cache_path is None:
+        return embeddings
+    logger.info(f"Caching {namespace} embeddings in {cache_path}")
+    return CachedEmbeddings(embeddings, cache_path, namespace, batch_size, dimensions=dimensions)
+
+
+def embedding_model(embeddings: Embeddings) -> Tuple[str, int | None]:
+    """
+    Name of the model behind an embedder built by get_embeddings, the namespace its vectors are cached under,
+    and their dimensions, None while the provider's native size isn't known yet.
+    """
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.namespace, embeddings.dimensions
+    if isinstance(embeddings, HashingEmbeddings):
+        return embeddings.model_name, embeddings.dimensions
+    return f"{OPENAI_EMBEDDINGS}-{embeddings.model}-{embeddings.dimensions or 'native'}", embeddings.dimensions
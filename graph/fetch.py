@@ -0,0 +1,195 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List
+from urllib.parse import urlparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from bs4 import BeautifulSoup
+from langchain.schema import Document
+from requests.adapters import HTTPAdapter
+
+from utils import logger
+from graph.constants import (
+    DEFAULT_FETCH_BACKOFF_SECONDS,
+    DEFAULT_FETCH_PER_HOST_LIMIT,
+    DEFAULT_FETCH_RETRIES,
+    DEFAULT_FETCH_TIMEOUT_SECONDS,
+    DEFAULT_FETCH_WORKERS
+)
+
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class FetchResult:
+    """
+    Outcome of fetching one URL.
+
+    Attributes:
+        url(str): the requested URL
+        documents(List[Document]): parsed page, empty when the page failed or was not modified
+        status(int): HTTP status code of the last response, if any
+        not_modified(bool): the server answered 304 to a conditional GET
+        error(str): reason the URL could not be fetched
+        etag(str): ETag of the response, saved with remember() once the page is ingested
+        last_modified(str): Last-Modified of the response, saved with remember() once the page is ingested
+    """
+
+    url: str
+    documents: List[Document] = field(default_factory=list)
+    status: int | None = None
+    not_modified: bool = False
+    error: str | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def parse_html(url: str, html: str) -> Document:
+    """Turn a page into a Document the same way WebBaseLoader does."""
+    soup = BeautifulSoup(html, "html.parser")
+    metadata = {"source": url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html_tag := soup.find("html"):
+        metadata["language"] = html_tag.get("lang", "No language found.")
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+class HttpCache:
+    """On-disk cache of validators (ETag / Last-Modified) for conditional GETs, one JSON file per URL."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json")
+
+    def get(self, url: str) -> Dict[str, str] | None:
+        try:
+            with open(self._path(url), "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def set(self, url: str, etag: str | None, last_modified: str | None):
+        if not etag and not last_modified:
+            return
+        path = self._path(url)
+        with open(f"{path}.tmp", "w") as file:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified}, file)
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def conditional_headers(entry: Dict[str, str] | None) -> Dict[str, str]:
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+class URLFetcher:
+    """
+    Fetches many URLs concurrently through one pooled requests.Session, with a limit
+    on concurrent requests per host, timeouts and retries with exponential backoff.
+    Failures are reported per URL instead of aborting the batch.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | None = None,
+        max_workers: int = DEFAULT_FETCH_WORKERS,
+        per_host_limit: int = DEFAULT_FETCH_PER_HOST_LIMIT,
+        timeout: float = DEFAULT_FETCH_TIMEOUT_SECONDS,
+        retries: int = DEFAULT_FETCH_RETRIES,
+        backoff: float = DEFAULT_FETCH_BACKOFF_SECONDS
+    ):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = HttpCache(cache_dir) if cache_dir else None
+        self.session = requests.Session()
+        if os.environ.get("USER_AGENT"):
+            self.session.headers["User-Agent"] = os.environ["USER_AGENT"]
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = defaultdict(
+            lambda: threading.BoundedSemaphore(self.per_host_limit)
+        )
+        self._host_limits_lock = threading.Lock()
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        with self._host_limits_lock:
+            return self._host_limits[urlparse(url).netloc]
+
+    def fetch(self, url: str) -> FetchResult:
+        cached = self.cache.get(url) if self.cache else None
+        headers = HttpCache.conditional_headers(cached)
+        result = FetchResult(url=url)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                with self._host_limit(url):
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                result.error = f"{type(e).__name__}: {e}"
+                continue
+            result.status = response.status_code
+            if response.status_code == 304 and cached:
+                result.error = None
+                result.not_modified = True
+                return result
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                result.error = f"HTTP {response.status_code}"
+                continue
+            if response.status_code >= 400:
+                result.error = f"HTTP {response.status_code}"
+                return result
+            response.encoding = response.apparent_encoding
+            result.error = None
+            result.documents = [parse_html(url, response.text)]
+            result.etag = response.headers.get("ETag")
+            result.last_modified = response.headers.get("Last-Modified")
+            return result
+        return result
+
+    def fetch_all(self, urls: List[str]) -> List[FetchResult]:
+        """Fetch all URLs concurrently, returning one result per URL in the given order."""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.fetch, urls))
+        failed = [result for result in results if not result.ok]
+        not_modified = sum(result.not_modified for result in results)
+        logger.info(f"Fetched {len(results) - len(failed)} of {len(results)} URLs, {not_modified} not modified")
+        for result in failed:
+            logger.error(f"Failed to fetch {result.url}: {result.error}")
+        return results
+
+    def remember(self, results: List[FetchResult]):
+        """
+        Save the validators of fetched pages. Call it only once their content is safely
+        stored, otherwise a failed ingestion would be skipped as "not modified" next time.
+        """
+        if not self.cache:
+            return
+        for result in results:
+            if result.ok and not result.not_modified:
+                self.cache.set(result.url, result.etag, result.last_modified)
@@ -1,46 +1,120 @@
-from typing import Set
-
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import END, StateGraph
 
 from utils import logger
 from graph.constants import (
+    BUDGET_EXHAUSTED,
+    COMPRESS_CONTEXT,
     RETRIEVE,
+    ROUTE,
     GRADE_DOCUMENTS,
     GENERATE,
+    VERIFICATION_EVENT,
     WEB_SEARCH
 )
-from graph.chains.answer_grader import answer_grader_chain
-from graph.chains.hallucination_grader import hallucination_grader_chain
-from graph.chains.keyword_extractor import DocumentKeywords, keyword_extractor_chain
-from graph.nodes import generate, grade_documents, retrieve, web_search
+from graph.budget import QueryBudget, get_budget
+from graph.chains.answer_grader import GradeAnswer, get_answer_grader_chain
+from graph.chains.hallucination_grader import GradeHallucination, get_hallucination_grader_chain
+from graph.nodes import (
+    acompress_context, agenerate, agrade_documents, aretrieve, aroute, aweb_search,
+    compress_context, generate, grade_documents, retrieve, route, web_search
+)
 from graph.state import GraphState
-from graph.ingest import RAGVectorStore
+from graph.streaming import aemit, emit
 
 
-def is_answer_grounded_in_documents(state: GraphState) -> str:
-    logger.info("---CHECK HALLUCINATIONS---")
+def _grounded_decision(is_grounded: GradeHallucination) -> str | None:
+    if is_grounded.binary_score:
+        logger.info("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
+        logger.info("---CHECKING IF LLM GENERATION ANSWERED THE QUESTION---")
+        return None
+    logger.info("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS, RE-RUNNING THE CHAIN")
+    return "not_supported"
+
+
+def _answered_decision(is_answered: GradeAnswer) -> str:
+    if is_answered.binary_score:
+        logger.info("---DECISION: GENERATION ANSWERED THE QUESTION---")
+        return "useful"
+    logger.info("---DECISION: GENERATION DOES NOT ADDRESS THE QUESTION---")
+    return "not_useful"
+
+
+def _within_budget(budget: QueryBudget | None, decision: str | None = None) -> bool:
+    """
+    Whether verification can go on. Before each grader call there must be room for it,
+    and a rejected answer is only worth grading when it may still be regenerated.
+    """
+    if budget is None:
+        return True
+    if decision is not None:
+        return budget.allows_regeneration()
+    return budget.allows()
+
+
+def _verify(state: GraphState, budget: QueryBudget | None) -> str:
     question = state["question"]
-    documents = state["documents"]
+    # The same compressed context the answer was generated from
+    documents = state.get("context", state["documents"])
     answer = state["answer"]
 
-    is_grounded = hallucination_grader_chain.invoke(
+    if not _within_budget(budget):
+        return BUDGET_EXHAUSTED
+    is_grounded = get_hallucination_grader_chain().invoke(
         {"documents": documents, "answer": answer}
     )
-    if is_grounded:
-        logger.info("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
-        logger.info("---CHECKING IF LLM GENERATION ANSWERED THE QUESTION---")
-        is_answered = answer_grader_chain.invoke(
-            {"question": question, "answer": answer}
-        )
-        if is_answered:
-            logger.info("---DECISION: GENERATION ANSWERED THE QUESTION---")
-            return "useful"
-        else:
-            logger.info("---DECISION: GENERATION DOES NOT ADDRESS THE QUESTION---")
-            return "not_useful"
-    else:
-        logger.info("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS, RE-RUNNING THE CHAIN")
-        return "not_supported"
+    decision = _grounded_decision(is_grounded)
+    if decision:
+        return decision if _within_budget(budget, decision) else BUDGET_EXHAUSTED
+    if not _within_budget(budget):
+        return BUDGET_EXHAUSTED
+    is_answered = get_answer_grader_chain().invoke(
+        {"question": question, "answer": answer}
+    )
+    decision = _answered_decision(is_answered)
+    if decision != "useful" and not _within_budget(budget, decision):
+        return BUDGET_EXHAUSTED
+    return decision
+
+
+async def _averify(state: GraphState, budget: QueryBudget | None) -> str:
+    question = state["question"]
+    # The same compressed context the answer was generated from
+    documents = state.get("context", state["documents"])
+    answer = state["answer"]
+
+    if not _within_budget(budget):
+        return BUDGET_EXHAUSTED
+    is_grounded = await get_hallucination_grader_chain().ainvoke(
+        {"documents": documents, "answer": answer}
+    )
+    decision = _grounded_decision(is_grounded)
+    if decision:
+        return decision if _within_budget(budget, decision) else BUDGET_EXHAUSTED
+    if not _within_budget(budget):
+        return BUDGET_EXHAUSTED
+    is_answered = await get_answer_grader_chain().ainvoke(
+        {"question": question, "answer": answer}
+    )
+    decision = _answered_decision(is_answered)
+    if decision != "useful" and not _within_budget(budget, decision):
+        return BUDGET_EXHAUSTED
+    return decision
+
+
+def is_answer_grounded_in_documents(state: GraphState, config: RunnableConfig | None = None) -> str:
+    logger.info("---CHECK HALLUCINATIONS---")
+    decision = _verify(state, get_budget(state, config))
+    # Lets a caller streaming the answer know whether it stands or is about to be replaced
+    emit(VERIFICATION_EVENT, {"decision": decision}, config)
+    return decision
+
+
+async def ais_answer_grounded_in_documents(state: GraphState, config: RunnableConfig | None = None) -> str:
+    logger.info("---CHECK HALLUCINATIONS---")
+    decision = await _averify(state, get_budget(state, config))
+    await aemit(VERIFICATION_EVENT, {"decision": decision}, config)
+    return decision
 
 
 def decide_to_generate(state):
@@ -51,44 +125,41 @@ def decide_to_generate(state):
         return WEB_SEARCH
     else:
         logger.info("---DECISION: GENERATE---")
-        return GENERATE
-
-
-def decide_to_route(state: GraphState):
-    question:str = state["question"]
-    keywords_in_question:DocumentKeywords = keyword_extractor_chain.invoke({"document": question})
-    keywords_in_question:Set[str] = set(keywords_in_question.keywords)
-    retriever:RAGVectorStore = state["retriever"]
-    keywords_in_db:Set[str] = retriever.get_keywords_in_vector_store()
-    #TODO: find a more scalable solution when amount of keywords in db grows exponentially
-    if keywords_in_db.isdisjoint(keywords_in_question):
-        logger.info("---ROUTE DECISION: WEB SEARCH")
-        return WEB_SEARCH
-    logger.info("---ROUTE DECISION: VECTOR STORE")
-    return RETRIEVE
+        return COMPRESS_CONTEXT
+
+
+def decide_to_route(state: GraphState) -> str:
+    return state["route_decision"]
 
 
 workflow = StateGraph(GraphState)
 
-workflow.add_node(RETRIEVE, retrieve)
-workflow.add_node(GRADE_DOCUMENTS, grade_documents)
-workflow.add_node(GENERATE, generate)
-workflow.add_node(WEB_SEARCH, web_search)
+# Every node and router carries both implementations, so app.invoke stays synchronous
+# while app.ainvoke runs the whole graph on the event loop.
+workflow.add_node(ROUTE, RunnableLambda(route, afunc=aroute))
+workflow.add_node(RETRIEVE, RunnableLambda(retrieve, afunc=aretrieve))
+workflow.add_node(GRADE_DOCUMENTS, RunnableLambda(grade_documents, afunc=agrade_documents))
+workflow.add_node(COMPRESS_CONTEXT, RunnableLambda(compress_context, afunc=acompress_context))
+workflow.add_node(GENERATE, RunnableLambda(generate, afunc=agenerate))
+workflow.add_node(WEB_SEARCH, RunnableLambda(web_search, afunc=aweb_search))
 
-workflow.set_conditional_entry_point(decide_to_route)
+workflow.set_entry_point(ROUTE)
+workflow.add_conditional_edges(ROUTE, decide_to_route, path_map=[RETRIEVE, WEB_SEARCH])
 
 workflow.add_edge(RETRIEVE, GRADE_DOCUMENTS)
-workflow.add_conditional_edges(GRADE_DOCUMENTS, decide_to_generate)
+workflow.add_conditional_edges(GRADE_DOCUMENTS, decide_to_generate, path_map=[WEB_SEARCH, COMPRESS_CONTEXT])
 workflow.add_conditional_edges(
     GENERATE,
-    is_answer_grounded_in_documents,
+    RunnableLambda(is_answer_grounded_in_documents, afunc=ais_answer_grounded_in_documents),
     path_map={
         "useful": END,
         "not_useful": WEB_SEARCH,
-        "not_supported": GENERATE
+        "not_supported": GENERATE,
+        BUDGET_EXHAUSTED: END
     }
 )
-workflow.add_edge(WEB_SEARCH, GENERATE)
+workflow.add_edge(WEB_SEARCH, COMPRESS_CONTEXT)
+workflow.add_edge(COMPRESS_CONTEXT, GENERATE)
 workflow.add_edge(GENERATE, END)
 
-app = workflow.compile()
\ No newline at end of file
+app = workflow.compile()
@@ -1,88 +1,427 @@
-from typing import List, Tuple, Set
-import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple, TypeVar
+import asyncio
 import json
+import os
+import pickle
+import threading
 
 from dotenv import load_dotenv
 from langchain.schema import Document
-from langchain_core.vectorstores import VectorStoreRetriever
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from langchain.text_splitter import TextSplitter
 
 from utils import logger
-from graph.chains.keyword_extractor import keyword_extractor_chain, DocumentKeywords
+from graph.bm25 import BM25Index
+from graph.chunking import ChunkingPool, default_text_splitter
+from graph.chains.keyword_extractor import get_keyword_extractor_chain, DocumentKeywords
+from graph.constants import (
+    BULK_PRIORITY,
+    DEFAULT_CHUNKING_WORKERS,
+    DEFAULT_DISTANCE_SPACE,
+    DEFAULT_EMBEDDING_BATCH_SIZE,
+    DEFAULT_HYBRID_FETCH_K,
+    DEFAULT_LEXICAL_WEIGHT,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_PREFILTER_MAX_CANDIDATES,
+    DEFAULT_RETRIEVAL_K,
+    DEFAULT_RRF_K,
+    DEFAULT_VECTOR_WEIGHT,
+    LLM_KEYWORDS,
+    OPENAI_EMBEDDINGS,
+    TFIDF_KEYWORDS
+)
+from graph.embeddings import embedding_model, get_embeddings
+from graph.fetch import FetchResult, URLFetcher
+from graph.keyword_index import KeywordIndex
+from graph.local_keywords import TfidfKeywordExtractor
+from graph.retrieval import RELEVANCE_FUNCTIONS, fuse_hybrid
+from graph.scheduler import llm_priority
 from graph import utils
 
 
 load_dotenv()
 
 
+T = TypeVar("T")
+
+
+@dataclass
+class IngestionReport:
+    """
+    Outcome of an ingestion run.
+
+    Attributes:
+        added(int): chunks that did not exist before
+        updated(int): chunks whose content changed at the same position of their page
+        skipped(int): unchanged chunks that were neither re-embedded nor re-tagged
+        deleted(int): chunks that disappeared from a re-crawled page
+        not_modified(int): pages skipped because the server answered 304
+        failed_urls(List[str]): URLs that could not be fetched
+    """
+
+    added: int = 0
+    updated: int = 0
+    skipped: int = 0
+    deleted: int = 0
+    not_modified: int = 0
+    failed_urls: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        return (
+            f"added={self.added} updated={self.updated} skipped={self.skipped} deleted={self.deleted} "
+            f"not_modified={self.not_modified} failed={len(self.failed_urls)}"
+        )
+
+    def merge(self, other: "IngestionReport"):
+        self.added += other.added
+        self.updated += other.updated
+        self.skipped += other.skipped
+        self.deleted += other.deleted
+        self.not_modified += other.not_modified
+        self.failed_urls.extend(other.failed_urls)
+
+
+@dataclass
+class IngestionPlan:
+    """
+    Chunks to write and chunk ids to delete so a collection matches freshly crawled pages, and unchanged
+    chunks that moved within their page, whose stored metadata only needs their new chunk_index.
+    """
+    to_add: List[Document] = field(default_factory=list)
+    to_delete: List[str] = field(default_factory=list)
+    to_reindex: List[Document] = field(default_factory=list)
+    report: IngestionReport = field(default_factory=IngestionReport)
+
+
 class RAGVectorStore:
-    def __init__(self, collection_name: str, persist_directory: str):
+    def __init__(
+        self,
+        collection_name: str,
+        persist_directory: str,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        embedding_backend: str = OPENAI_EMBEDDINGS,
+        embedding_batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: bool = True,
+        text_splitter: TextSplitter | None = None,
+        keyword_extractor: str = LLM_KEYWORDS,
+        chunking_workers: int = DEFAULT_CHUNKING_WORKERS,
+        chunking_pool: ChunkingPool | None = None
+    ):
         """
-        Initialize the class with the URLs to fetch, the name of the vector store collection, and the directory for persistence.
+        Initialize the class with the name of the vector store collection, the directory for persistence,
+        the maximum number of concurrent LLM calls made during ingestion, and the embedding backend.
+        Embeddings are cached on disk next to the collection unless embedding_cache is False. The collection
+        records the embedding model that created it, opening it with another raises ValueError.
+        keyword_extractor selects how chunks and questions are tagged with keywords,
+        either with the LLM chain or with a local TF-IDF extractor.
+        With more than one chunking_workers, documents are split on that many worker processes.
+        A chunking_pool given is used instead, shared with other stores, and left running by close.
         """
+        if keyword_extractor not in (LLM_KEYWORDS, TFIDF_KEYWORDS):
+            raise ValueError(f"Unknown keyword extractor: {keyword_extractor}")
+        if chunking_workers > 1 and text_splitter is not None:
+            try:
+                pickle.dumps(text_splitter)
+            except Exception as e:
+                raise ValueError(f"The text splitter can't be sent to chunking worker processes: {e}") from e
+        import chromadb
+        from langchain_chroma import Chroma
+
         self.collection_name = collection_name
         self.persist_directory = persist_directory
+        self.max_concurrency = max_concurrency
+        self.embedding_backend = embedding_backend
+        self.http_cache_directory = os.path.join(self.persist_directory, "http_cache", self.collection_name)
+        self._fetcher: URLFetcher | None = None
+        self._fetcher_lock = threading.Lock()
+        self.embeddings = get_embeddings(
+            embedding_backend,
+            cache_path=os.path.join(self.persist_directory, "embedding_cache.sqlite") if embedding_cache else None,
+            batch_size=embedding_batch_size
+        )
+        self.embedding_model, self.embedding_dimensions = embedding_model(self.embeddings)
+        client = chromadb.PersistentClient(path=self.persist_directory)
+        # Only new collections get the distance space, Chroma would relabel an existing one without changing its index
+        is_new = self.collection_name not in {collection.name for collection in client.list_collections()}
+        collection_metadata = None
+        if is_new:
+            collection_metadata = {
+                "hnsw:space": DEFAULT_DISTANCE_SPACE,
+                "embedding_backend": self.embedding_backend,
+                "embedding_model": self.embedding_model
+            }
+            if self.embedding_dimensions:
+                collection_metadata["embedding_dimensions"] = self.embedding_dimensions
         self.vector_store = Chroma(
+                client=client,
                 collection_name=self.collection_name,
                 persist_directory=self.persist_directory,
-                embedding_function=OpenAIEmbeddings(),
+                embedding_function=self.embeddings,
+                collection_metadata=collection_metadata,
             )
+        # The collection itself, for the writes LangChain has no method for: chunks embedded ahead of time
+        # and metadata-only updates
+        self.collection = client.get_collection(self.collection_name)
+        self._check_embedding_model()
+        # Collections created before the cosine default keep their l2 space, scored on the same scale
+        self.distance_space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        self.vector_store.override_relevance_score_fn = RELEVANCE_FUNCTIONS[self.distance_space]
         self.docs: List[Document] = []
-        self.text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            chunk_size=250, chunk_overlap=0
+        self._text_splitter = text_splitter
+        # None has every worker build the default splitter, which holds an unpicklable tiktoken encoder
+        self._worker_text_splitter = text_splitter
+        self.chunking_workers = chunking_workers
+        self._chunking_pool = chunking_pool
+        self._owns_chunking_pool = chunking_pool is None
+        self.keyword_index = KeywordIndex.load(
+            os.path.join(self.persist_directory, f"{self.collection_name}_keyword_index.json")
         )
+        if not self.keyword_index.exists():
+            self.rebuild_keyword_index()
+        self.bm25_path = os.path.join(self.persist_directory, f"{self.collection_name}_bm25_index.json")
+        self._bm25_index: BM25Index | None = None
+        self._retrievers: Dict[int, Any] = {}
+        self.local_keyword_extractor: TfidfKeywordExtractor | None = None
+        if keyword_extractor == TFIDF_KEYWORDS:
+            self.local_keyword_extractor = TfidfKeywordExtractor.load(
+                os.path.join(self.persist_directory, f"{self.collection_name}_keyword_stats.json")
+            )
+        self.version_path = os.path.join(self.persist_directory, f"{self.collection_name}_version.json")
+
+    def _check_embedding_model(self):
+        """
+        Refuse to open a collection embedded by another model, whose vectors questions can't be compared with.
+        Collections created before the model was recorded are checked against the size of a stored vector.
+        """
+        metadata = self.collection.metadata or {}
+        stored_model = metadata.get("embedding_model")
+        if stored_model is not None and stored_model != self.embedding_model:
+            raise ValueError(
+                f"Collection {self.collection_name} was embedded with {stored_model} "
+                f"({metadata.get('embedding_backend')} backend), not {self.embedding_model}: "
+                f"open it with the same embedding backend or ingest into another collection"
+            )
+        stored_dimensions = metadata.get("embedding_dimensions")
+        if stored_dimensions is None and self.embedding_dimensions:
+            embeddings = self.collection.get(limit=1, include=["embeddings"])["embeddings"]
+            stored_dimensions = len(embeddings[0]) if embeddings is not None and len(embeddings) else None
+        if stored_dimensions and self.embedding_dimensions and stored_dimensions != self.embedding_dimensions:
+            raise ValueError(
+                f"Collection {self.collection_name} holds {stored_dimensions} dimension embeddings, "
+                f"{self.embedding_model} makes {self.embedding_dimensions}: "
+                f"open it with the same embedding backend or ingest into another collection"
+            )
+
+    @property
+    def collection_version(self) -> int:
+        """
+        Counter bumped on every ingestion. It is read from disk each time so that
+        ingestion done by another process invalidates answers cached by this one.
+        """
+        try:
+            with open(self.version_path, "r") as file:
+                return json.load(file)["version"]
+        except FileNotFoundError:
+            return 0
+
+    def bump_collection_version(self) -> int:
+        version = self.collection_version + 1
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = f"{self.version_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"version": version}, file)
+        os.replace(tmp_path, self.version_path)
+        return version
+
+    @property
+    def text_splitter(self) -> TextSplitter:
+        # Built on first use, query-only processes never need the tiktoken encoding
+        if self._text_splitter is None:
+            self._text_splitter = default_text_splitter()
+        return self._text_splitter
+
+    @property
+    def chunking_pool(self) -> ChunkingPool | None:
+        """The chunking worker processes, started on first use. None when chunking stays in this process."""
+        if self._chunking_pool is None and self.chunking_workers > 1:
+            self._chunking_pool = ChunkingPool(self.chunking_workers, self._worker_text_splitter)
+        return self._chunking_pool
+
+    def embed_query(self, question: str) -> List[float]:
+        return self.embeddings.embed_query(question)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def write_chunks(self, documents: List[Document], embeddings: List[List[float]]):
+        """
+        Upsert chunks whose embeddings were computed ahead of time, keyed by their chunk ids,
+        and add them to the keyword and BM25 indexes, which save_keyword_index persists.
+        """
+        if not documents:
+            return
+        self.collection.upsert(
+            ids=[document.metadata["chunk_id"] for document in documents],
+            embeddings=embeddings,
+            metadatas=[document.metadata for document in documents],
+            documents=[document.page_content for document in documents]
+        )
+        self._update_keyword_index(documents, [])
+
+    def delete_chunks(self, chunk_ids: List[str]):
+        """Delete chunks by id and drop them from the keyword and BM25 indexes, which save_keyword_index persists."""
+        if not chunk_ids:
+            return
+        self.collection.delete(ids=chunk_ids)
+        self._update_keyword_index([], chunk_ids)
+
+    def rebuild_keyword_index(self, page_size: int = 5000):
+        """
+        Build the keyword index from the metadata already stored in the collection.
+        Only needed once for collections ingested before the index existed, whose chunks
+        also get the chunk_id metadata keyword prefiltering matches, their id in Chroma.
+        """
+        offset = 0
+        while True:
+            records = self.vector_store.get(limit=page_size, offset=offset, include=["metadatas"])
+            ids = records.get("ids") or []
+            if not ids:
+                break
+            backfill = {}
+            for chunk_id, metadata in zip(ids, records.get("metadatas") or []):
+                if metadata:
+                    self.keyword_index.add(chunk_id, KeywordIndex.keywords_from_metadata(metadata))
+                if (metadata or {}).get("chunk_id") != chunk_id:
+                    backfill[chunk_id] = {**(metadata or {}), "chunk_id": chunk_id}
+            if backfill:
+                self.collection.update(ids=list(backfill), metadatas=list(backfill.values()))
+            offset += len(ids)
+        if offset:
+            logger.info(f"Rebuilt keyword index from {offset} chunks")
+            self.keyword_index.save()
+
+    @property
+    def fetcher(self) -> URLFetcher:
+        # Created on the first ingestion, so stores only answering questions hold no HTTP session or cache directory
+        with self._fetcher_lock:
+            if self._fetcher is None:
+                self._fetcher = URLFetcher(cache_dir=self.http_cache_directory)
+            return self._fetcher
+
+    @property
+    def bm25_index(self) -> BM25Index:
+        # Loaded on first use, only hybrid retrieval and ingestion need it
+        if self._bm25_index is None:
+            self._bm25_index = BM25Index.load(self.bm25_path)
+            if not self._bm25_index.exists():
+                self.rebuild_bm25_index()
+        return self._bm25_index
+
+    def rebuild_bm25_index(self, page_size: int = 5000):
+        """
+        Build the BM25 index from the chunks already stored in the collection.
+        Only needed once for collections ingested before the index existed.
+        """
+        offset = 0
+        while True:
+            records = self.vector_store.get(limit=page_size, offset=offset, include=["documents"])
+            ids = records.get("ids") or []
+            if not ids:
+                break
+            self._bm25_index.add(zip(ids, records.get("documents") or []))
+            offset += len(ids)
+        if offset:
+            logger.info(f"Rebuilt BM25 index from {offset} chunks")
+            self._bm25_index.save()
 
     def get_keywords_in_vector_store(self) -> Set[str]:
-        metadata_in_db = self.vector_store.get().get("metadatas")
-        keywords = set()
-        if metadata_in_db:
-            for metadata in metadata_in_db:
-                keywords_in_doc = json.loads(metadata.get('keywords', '[]'))
-                keywords.update(keywords_in_doc)
-        return keywords
-    
-    def add_additional_metadata(self, documents:List[Document]) -> Tuple[Document, List[str]]:
+        return self.keyword_index.keywords()
+
+    def has_any_keyword(self, keywords: Set[str]) -> bool:
+        """Check whether any of the given keywords is present in the vector store."""
+        return self.keyword_index.contains_any(utils.preprocess_keywords(keywords))
+
+    def keyword_overlap(self, keywords: Set[str]) -> float:
+        """Share of the given keywords present in the vector store."""
+        return self.keyword_index.overlap(utils.preprocess_keywords(keywords))
+
+    def present_keywords(self, keywords: Set[str]) -> Set[str]:
+        """Those of the given keywords present in the vector store, preprocessed like stored keywords."""
+        return self.keyword_index.present(utils.preprocess_keywords(keywords))
+
+    def search_with_relevance_scores(self, question: str, k: int = DEFAULT_RETRIEVAL_K) -> List[Tuple[Document, float]]:
+        return self.search_by_vector(self.embed_query(question), k)
+
+    async def asearch_with_relevance_scores(self, question: str, k: int = DEFAULT_RETRIEVAL_K) -> List[Tuple[Document, float]]:
+        return await asyncio.to_thread(self.search_with_relevance_scores, question, k)
+
+    def save_keyword_index(self):
+        self.keyword_index.save()
+        if self._bm25_index is not None:
+            self._bm25_index.save()
+        if self.local_keyword_extractor:
+            self.local_keyword_extractor.save()
+
+    def extract_question_keywords(self, question: str) -> Set[str]:
+        """Keywords of a question, extracted the same way as the keywords of the stored chunks."""
+        if self.local_keyword_extractor:
+            return set(self.local_keyword_extractor.question_keywords(question))
+        keywords: DocumentKeywords = get_keyword_extractor_chain().invoke({"document": question})
+        return set(keywords.keywords)
+
+    async def aextract_question_keywords(self, question: str) -> Set[str]:
+        """Async version of extract_question_keywords."""
+        if self.local_keyword_extractor:
+            return set(self.local_keyword_extractor.question_keywords(question))
+        keywords: DocumentKeywords = await get_keyword_extractor_chain().ainvoke({"document": question})
+        return set(keywords.keywords)
+
+    def _extract_local_keywords(self, documents: List[Document]) -> List[DocumentKeywords]:
+        keywords = self.local_keyword_extractor.extract([document.page_content for document in documents])
+        return [DocumentKeywords(keywords=document_keywords) for document_keywords in keywords]
+
+    @staticmethod
+    def _apply_keywords(documents: List[Document], results: List[DocumentKeywords | Exception]) -> List[Document]:
+        for document, document_keywords in zip(documents, results):
+            if isinstance(document_keywords, Exception):
+                logger.error(f"Could not extract keywords for the document: {document.page_content}")
+                continue
+            document_keywords = utils.preprocess_keywords(document_keywords.keywords)
+            document.metadata["keywords"] = json.dumps(list(document_keywords))
+        return documents
+
+    def _batch_config(self) -> Dict[str, Any]:
+        return {"max_concurrency": self.max_concurrency}
+
+    def add_additional_metadata(self, documents:List[Document]) -> List[Document]:
         """Given a set of documents, generate relevant metadata for them."""
         logger.info("Generating metadata for documents")
-        # Keyword extraction
-        def get_keywords(document: Document) -> Document:
-            try:
-                document_keywords: DocumentKeywords = keyword_extractor_chain.invoke(
-                    {"document": document.page_content}
-                )
-                document_keywords = utils.preprocess_keywords(document_keywords.keywords)
-                document.metadata["keywords"] = json.dumps(list(document_keywords))
-            except Exception as e:
-                logger.error(f"Could not extract keywords for the document: {document.page_content}")
-            return document
-        documents_with_keywords = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-            futures = [executor.submit(get_keywords, document) for document in documents]
-            for future in futures:
-                documents_with_keywords.append(future.result())
-        return documents_with_keywords
-        
+        if self.local_keyword_extractor:
+            return self._apply_keywords(documents, self._extract_local_keywords(documents))
+        # Ingestion waits behind the questions being answered for the LLM
+        with llm_priority(BULK_PRIORITY):
+            results = get_keyword_extractor_chain().batch(
+                [{"document": document.page_content} for document in documents],
+                config=self._batch_config(),
+                return_exceptions=True
+            )
+        return self._apply_keywords(documents, results)
+
+    def fetch_urls(self, urls: List[str]) -> List[FetchResult]:
+        """
+        Fetch the URLs concurrently. Failed URLs are reported in their results instead of raised,
+        and pages unchanged since the last ingestion come back as not modified, without documents.
+        """
+        logger.info("Loading documents from the web.")
+        return self.fetcher.fetch_all(urls)
 
     def load_documents(self, urls: List[str]) -> List[Document]:
         """
         Load web documents from the provided URLs.
         """
-        try:
-            logger.info("Loading documents from the web.")
-            web_responses: List[List[Document]] = [WebBaseLoader(url).load() for url in urls]
-            
-            # Flatten the list of lists into a single list of documents
-            documents = []
-            for response in web_responses:
-                documents.extend(response)
-            logger.info(f"Loaded {len(documents)} documents.")
-            return documents
-        except Exception as e:
-            logger.error(f"Failed to load documents: {e}")
-            raise
+        documents = [document for result in self.fetch_urls(urls) for document in result.documents]
+        logger.info(f"Loaded {len(documents)} documents.")
+        return documents
 
     def split_documents(self, documents: List[Document]):
         """
@@ -96,33 +435,265 @@ class RAGVectorStore:
         doc_splits = self.text_splitter.split_documents(documents)
         logger.info(f"Split documents into {len(doc_splits)} chunks.")
         return doc_splits
+
+    def chunk_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Split the documents into chunks and clean their whitespace,
+        on the chunking worker processes when there are some.
+        """
+        if self.chunking_pool is None:
+            return utils.preprocess_documents(self.split_documents(documents))
+        if not documents:
+            logger.error("No documents given. Cannot split documents.")
+            raise ValueError("No documents given. Cannot split documents.")
+        chunks = self.chunking_pool.chunk(documents)
+        logger.info(f"Split documents into {len(chunks)} chunks on {self.chunking_workers} processes.")
+        return chunks
+
+    def chunk_each(self, items: Iterable[T], documents: Callable[[T], List[Document]]) -> Iterator[Tuple[T, List[Document]]]:
+        """Yield every item with the chunks of its documents, chunking the next items meanwhile when there are workers."""
+        if self.chunking_pool is not None:
+            yield from self.chunking_pool.chunk_each(items, documents)
+            return
+        for item in items:
+            item_documents = documents(item)
+            yield item, self.chunk_documents(item_documents) if item_documents else []
+
+    def close(self):
+        if self._chunking_pool is not None and self._owns_chunking_pool:
+            self._chunking_pool.close()
+            self._chunking_pool = None
     
-    def add_documents_from_urls(self, urls: List[str]) -> VectorStoreRetriever | None:
+    def _update_keyword_index(self, documents: List[Document], deleted_ids: List[str]):
+        self.keyword_index.remove(deleted_ids)
+        for document in documents:
+            self.keyword_index.add(document.metadata["chunk_id"], KeywordIndex.keywords_from_metadata(document.metadata))
+        self.bm25_index.remove(deleted_ids)
+        self.bm25_index.add((document.metadata["chunk_id"], document.page_content) for document in documents)
+
+    def plan_ingestion(self, documents: List[Document]) -> IngestionPlan:
+        """
+        Compare freshly split chunks against what is stored for the same sources.
+        Unchanged chunks are skipped, new ones are added, and chunks no longer present
+        on their page are deleted. A new chunk taking the place of a deleted one at the
+        same position of its page counts as an update. Skipped chunks whose position
+        changed, as chunks before them were added or deleted, are planned for reindexing.
+        """
+        utils.assign_chunk_ids(documents)
+        plan = IngestionPlan()
+        sources = sorted({document.metadata.get("source", "") for document in documents})
+        if not sources:
+            return plan
+        existing = self.collection.get(where={"source": {"$in": sources}}, include=["metadatas"])
+        stored = {
+            chunk_id: metadata or {} for chunk_id, metadata in zip(existing.get("ids") or [], existing.get("metadatas") or [])
+        }
+        new_ids = {document.metadata["chunk_id"] for document in documents}
+
+        replaced_positions = set()
+        for chunk_id, metadata in stored.items():
+            if chunk_id not in new_ids:
+                plan.to_delete.append(chunk_id)
+                replaced_positions.add((metadata.get("source"), metadata.get("chunk_index")))
+
+        for document in documents:
+            metadata = stored.get(document.metadata["chunk_id"])
+            if metadata is not None:
+                plan.report.skipped += 1
+                if metadata.get("chunk_index") != document.metadata["chunk_index"]:
+                    # Keywords and everything else stored stay, only the position is refreshed
+                    plan.to_reindex.append(Document(
+                        page_content=document.page_content,
+                        metadata={**metadata, "chunk_index": document.metadata["chunk_index"]}
+                    ))
+                continue
+            plan.to_add.append(document)
+            position = (document.metadata.get("source"), document.metadata["chunk_index"])
+            if position in replaced_positions:
+                replaced_positions.discard(position)
+                plan.report.updated += 1
+            else:
+                plan.report.added += 1
+        plan.report.deleted = len(plan.to_delete) - plan.report.updated
+        return plan
+
+    def reindex_chunks(self, documents: List[Document]):
+        """Store the new metadata of chunks whose content didn't change, without embedding them again."""
+        if documents:
+            self.collection.update(
+                ids=[document.metadata["chunk_id"] for document in documents],
+                metadatas=[document.metadata for document in documents]
+            )
+
+    def add_documents_from_urls(self, urls: List[str], checkpoint_path: str | None = None) -> IngestionReport:
         """
-        Method to add new documents to an existing vector store
+        Method to add new documents to an existing vector store.
+        Pages are streamed through fetch, split, keyword extraction, embedding and write stages
+        with bounded memory, and an interrupted run resumes from its checkpoint.
+        Re-running it on the same URLs only writes the chunks that changed.
         """
+        from graph.pipeline import StreamingIngestion
+
         logger.info("Trying to add new documents to the vector store")
         try:
-            documents = self.load_documents(urls)
-            documents = self.split_documents(documents)
-            documents = utils.preprocess_documents(documents)
-            documents = self.add_additional_metadata(documents)
-            self.vector_store.add_documents(documents)
-            logger.info("Documents added succesfully")
+            report = StreamingIngestion(self, checkpoint_path=checkpoint_path).run(urls)
+            logger.info(f"Documents added succesfully: {report}")
+            return report
         except Exception as e:
-            logger.error(f"Failed to initialize retriever: {e}")
+            logger.error(f"Failed to add documents: {e}")
             raise
 
-    def get_retriever(self):
+    async def aadd_documents_from_urls(self, urls: List[str], checkpoint_path: str | None = None) -> IngestionReport:
+        """
+        Async version of add_documents_from_urls, running the pipeline's threads off the event loop.
+        """
+        return await asyncio.to_thread(self.add_documents_from_urls, urls, checkpoint_path)
+
+    def known_sources(self, sources: List[str]) -> Set[str]:
+        """Those of the sources that already have chunks in the collection."""
+        if not sources:
+            return set()
+        existing = self.vector_store.get(where={"source": {"$in": sources}}, include=["metadatas"])
+        return {(metadata or {}).get("source") for metadata in existing.get("metadatas") or []}
+
+    def sources(self, page_size: int = 5000) -> Set[str]:
+        """Every source with chunks in the collection."""
+        sources, offset = set(), 0
+        while True:
+            records = self.vector_store.get(limit=page_size, offset=offset, include=["metadatas"])
+            metadatas = records.get("metadatas") or []
+            if not metadatas:
+                return sources - {None}
+            sources.update((metadata or {}).get("source") for metadata in metadatas)
+            offset += len(metadatas)
+
+    def drop(self):
+        """
+        Delete the collection with its keyword indexes and HTTP cache, so that re-ingesting its pages
+        fetches and writes them again. Embeddings stay cached, and the version file is kept so answers
+        cached for the old contents are never served again. Open a new store to use the collection again.
+        """
+        import shutil
+
+        self.vector_store.delete_collection()
+        paths = [self.keyword_index.path, self.bm25_path]
+        if self.local_keyword_extractor:
+            paths.append(self.local_keyword_extractor.path)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(self.http_cache_directory, ignore_errors=True)
+        self.bump_collection_version()
+
+    def add_documents(self, documents: List[Document], bump_version: bool = True) -> IngestionReport:
+        """
+        Ingest documents that were loaded some other way, such as web search results,
+        with the same splitting, keyword tagging and embedding as crawled pages.
+        Without bump_version, answers cached for the current collection version stay valid.
+        """
+        chunks = self.chunk_documents(documents)
+        plan = self.plan_ingestion(chunks)
+        if plan.to_add:
+            self.add_additional_metadata(plan.to_add)
+            self.write_chunks(plan.to_add, self.embed_documents([document.page_content for document in plan.to_add]))
+        self.delete_chunks(plan.to_delete)
+        self.reindex_chunks(plan.to_reindex)
+        if plan.to_add or plan.to_delete:
+            self.save_keyword_index()
+            if bump_version:
+                self.bump_collection_version()
+        logger.info(f"Documents added succesfully: {plan.report}")
+        return plan.report
+
+    def _prefilter(self, question: str) -> Set[str] | None:
+        """Chunks tagged with one of the question's candidate keywords, None when filtering wouldn't help."""
+        chunk_ids = self.keyword_index.chunk_ids_for(
+            utils.preprocess_keywords(TfidfKeywordExtractor.question_keywords(question))
+        )
+        if not chunk_ids or len(chunk_ids) > DEFAULT_PREFILTER_MAX_CANDIDATES:
+            return None
+        return chunk_ids
+
+    def get_documents(self, chunk_ids: List[str]) -> Dict[str, Document]:
+        """Stored chunks by id, ids missing from the collection are left out."""
+        if not chunk_ids:
+            return {}
+        records = self.vector_store.get(ids=chunk_ids, include=["documents", "metadatas"])
+        return {
+            chunk_id: Document(id=chunk_id, page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(records["ids"], records["documents"], records["metadatas"])
+        }
+
+    def search_by_vector(
+        self, embedding: List[float], k: int = DEFAULT_RETRIEVAL_K, search_filter: Dict[str, Any] | None = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Like search_with_relevance_scores for a question embedded ahead of time.
+        The chunks carry their id in Chroma as Document.id, which hybrid search fuses on.
+        """
+        results = self.collection.query(
+            query_embeddings=[embedding], n_results=k, where=search_filter, include=["documents", "metadatas", "distances"]
+        )
+        relevance = RELEVANCE_FUNCTIONS[self.distance_space]
+        return [
+            (Document(id=chunk_id, page_content=text, metadata=metadata or {}), relevance(distance))
+            for chunk_id, text, metadata, distance in zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+
+    def hybrid_candidates(
+        self,
+        question: str,
+        fetch_k: int = DEFAULT_HYBRID_FETCH_K,
+        keyword_prefilter: bool = False,
+        embedding: List[float] | None = None
+    ) -> Tuple[List[Tuple[Document, float]], List[Tuple[str, float]]]:
+        """
+        The fetch_k best (chunk, relevance) pairs of vector similarity search and (chunk id, score) pairs
+        of BM25 keyword search. With keyword_prefilter, both searches are restricted to the chunks
+        tagged with one of the question's keywords.
+        """
+        candidates = self._prefilter(question) if keyword_prefilter else None
+        search_filter = {"chunk_id": {"$in": sorted(candidates)}} if candidates else None
+        vector_results = self.search_by_vector(embedding or self.embed_query(question), fetch_k, search_filter)
+        return vector_results, self.bm25_index.search(question, fetch_k, candidates)
+
+    def hybrid_search(
+        self,
+        question: str,
+        k: int = DEFAULT_RETRIEVAL_K,
+        fetch_k: int = DEFAULT_HYBRID_FETCH_K,
+        vector_weight: float = DEFAULT_VECTOR_WEIGHT,
+        lexical_weight: float = DEFAULT_LEXICAL_WEIGHT,
+        rrf_k: int = DEFAULT_RRF_K,
+        keyword_prefilter: bool = False
+    ) -> List[Tuple[Document, float]]:
+        """
+        Fuse the fetch_k best chunks of vector similarity search and of BM25 keyword search
+        with reciprocal rank fusion, and return the k best with their vector relevance scores,
+        0 for chunks only found by BM25. With keyword_prefilter, both searches are restricted
+        to the chunks tagged with one of the question's keywords.
+        """
+        vector_results, lexical_results = self.hybrid_candidates(question, fetch_k, keyword_prefilter)
+        return fuse_hybrid(
+            vector_results, lexical_results, self.get_documents,
+            k=k, vector_weight=vector_weight, lexical_weight=lexical_weight, rrf_k=rrf_k
+        )
+
+    def get_retriever(self, k: int = DEFAULT_RETRIEVAL_K):
         """
         Method to return a retriever for querying the vector store, 
-        independent of the class initialization.
+        independent of the class initialization. Retrievers are reused for the same k.
         """
+        if k in self._retrievers:
+            return self._retrievers[k]
         logger.info("Initializing retriever from the Chroma vector store.")
         try:
-            retriever = self.vector_store.as_retriever()
+            retriever = self.vector_store.as_retriever(search_kwargs={"k": k})
             logger.info("Retriever initialized successfully.")
+            self._retrievers[k] = retriever
             return retriever
         except Exception as e:
             logger.error(f"Failed to initialize retriever: {e}")
-            raise
\ No newline at end of file
+            raise
@@ -0,0 +1,336 @@
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Sequence, Set, TextIO, Tuple
+from uuid import UUID
+import json
+import os
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+from langgraph.constants import START
+
+from utils import logger
+from graph.constants import CHAIN_CACHE_HIT_EVENT, DEFAULT_LATENCY_BUCKETS, RETRY_EVENT
+
+
+# Run names of the chains in graph/chains, LLM calls are attributed to the innermost one they run in
+TRACED_CHAINS: Set[str] = set()
+NODE_RUN = "node"
+CHAIN_RUN = "chain"
+
+
+def traced_chain(name: str, chain: Runnable) -> Runnable:
+    """Name the runs of a chain so that QueryTrace reports its calls, latency and tokens under that name."""
+    TRACED_CHAINS.add(name)
+    return chain.with_config(run_name=name)
+
+
+@dataclass
+class StageStats:
+    """
+    Aggregated measurements of a graph node or chain within one question.
+
+    Attributes:
+        runs(int): times the node or chain ran, a regenerated answer runs generate twice
+        seconds(float): total wall time of those runs, a node includes the routing decision that follows it
+        llm_calls(int): model calls made, failed ones included
+        prompt_tokens(int): prompt tokens reported by the model
+        completion_tokens(int): completion tokens reported by the model
+        cache_hits(int): structured chain calls answered by the chain cache
+        retries(int): calls retried, and batch calls redone one by one
+        errors(int): runs that raised
+    """
+
+    runs: int = 0
+    seconds: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cache_hits: int = 0
+    retries: int = 0
+    errors: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        stats = asdict(self)
+        stats["seconds"] = round(self.seconds, 6)
+        return stats
+
+
+def _token_usage(response: LLMResult) -> Tuple[int, int]:
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt_tokens += usage_metadata.get("input_tokens", 0)
+            completion_tokens += usage_metadata.get("output_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+class QueryTrace(BaseCallbackHandler):
+    """
+    Callback handler measuring one run of the graph per node and per chain.
+    Only attached when instrumentation is enabled, so disabled runs pay nothing for it.
+
+    Attributes:
+        question(str): question being answered
+        nodes(Dict[str, StageStats]): measurements of every node that ran
+        chains(Dict[str, StageStats]): measurements of every traced chain that ran
+        spans(List[Dict]): node runs in order, with their start offset and duration in seconds
+        seconds(float): wall time of the whole question, set by finish
+    """
+
+    run_inline = True
+
+    def __init__(self, question: str):
+        self.question = question
+        self.started_at = time.perf_counter()
+        self.seconds: float | None = None
+        self.nodes: Dict[str, StageStats] = defaultdict(StageStats)
+        self.chains: Dict[str, StageStats] = defaultdict(StageStats)
+        self.spans: List[Dict[str, Any]] = []
+        self.attributes: Dict[str, Any] = {}
+        # run id -> (node and chain it runs in, start time, NODE_RUN or CHAIN_RUN for the runs measured)
+        self._runs: Dict[UUID, Tuple[str | None, str | None, float, str | None]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, parent_run_id: UUID | None, name: str | None, node: str | None, is_node: bool):
+        kind = NODE_RUN if is_node else CHAIN_RUN if name in TRACED_CHAINS else None
+        with self._lock:
+            parent = self._runs.get(parent_run_id)
+            if not is_node:
+                node = parent[0] if parent else None
+            chain = name if kind == CHAIN_RUN else (parent[1] if parent else None)
+            self._runs[run_id] = (node, chain, time.perf_counter(), kind)
+            if kind == NODE_RUN:
+                self.nodes[node].runs += 1
+            elif kind == CHAIN_RUN:
+                self.chains[chain].runs += 1
+
+    def _end(self, run_id: UUID, error: bool = False):
+        now = time.perf_counter()
+        with self._lock:
+            node, chain, started_at, kind = self._runs.pop(run_id, (None, None, now, None))
+            if kind is None:
+                return
+            stats = self.nodes[node] if kind == NODE_RUN else self.chains[chain]
+            stats.seconds += now - started_at
+            stats.errors += error
+            if kind == NODE_RUN:
+                self.spans.append({"node": node, "start": round(started_at - self.started_at, 6), "seconds": round(now - started_at, 6)})
+
+    def _stages(self, run_id: UUID | None) -> List[StageStats]:
+        run = self._runs.get(run_id)
+        if run is None:
+            return []
+        node, chain, _, _ = run
+        return [stats for stats in (self.nodes[node] if node else None, self.chains[chain] if chain else None) if stats]
+
+    def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        tags: List[str] | None = None,
+        metadata: Dict[str, Any] | None = None,
+        **kwargs: Any
+    ):
+        name = kwargs.get("name")
+        node = (metadata or {}).get("langgraph_node")
+        # langgraph tags the run of each node with the step it runs in, its children only inherit the metadata
+        is_node = node not in (None, START) and name == node and any(tag.startswith("graph:step:") for tag in tags or ())
+        self._start(run_id, parent_run_id, name, node, is_node)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error=True)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs: Any):
+        self._start(run_id, parent_run_id, None, None, False)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List, *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs: Any):
+        self._start(run_id, parent_run_id, None, None, False)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        prompt_tokens, completion_tokens = _token_usage(response)
+        with self._lock:
+            for stats in self._stages(run_id):
+                stats.llm_calls += 1
+                stats.prompt_tokens += prompt_tokens
+                stats.completion_tokens += completion_tokens
+            self._runs.pop(run_id, None)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            for stats in self._stages(run_id):
+                stats.llm_calls += 1
+                stats.errors += 1
+            self._runs.pop(run_id, None)
+
+    def on_retry(self, retry_state: Any, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            for stats in self._stages(run_id):
+                stats.retries += 1
+
+    def on_custom_event(self, name: str, data: Any, *, run_id: UUID, **kwargs: Any):
+        if name not in (CHAIN_CACHE_HIT_EVENT, RETRY_EVENT):
+            return
+        with self._lock:
+            for stats in self._stages(run_id):
+                if name == CHAIN_CACHE_HIT_EVENT:
+                    stats.cache_hits += 1
+                else:
+                    stats.retries += 1
+
+    def finish(self) -> "QueryTrace":
+        self.seconds = time.perf_counter() - self.started_at
+        return self
+
+    def totals(self) -> StageStats:
+        # Chains run inside nodes, so the nodes alone add up to the whole question
+        totals = StageStats(runs=len(self.spans))
+        for stats in self.nodes.values():
+            for counter in ("seconds", "llm_calls", "prompt_tokens", "completion_tokens", "cache_hits", "retries", "errors"):
+                setattr(totals, counter, getattr(totals, counter) + getattr(stats, counter))
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "question": self.question,
+            "seconds": round(self.seconds if self.seconds is not None else time.perf_counter() - self.started_at, 6),
+            **self.attributes,
+            "totals": self.totals().to_dict(),
+            "nodes": {node: stats.to_dict() for node, stats in self.nodes.items()},
+            "chains": {chain: stats.to_dict() for chain, stats in self.chains.items()},
+            "spans": sorted(self.spans, key=lambda span: span["start"])
+        }
+
+
+class MetricsRegistry:
+    """
+    Process wide counters and latency histograms aggregated over every traced question,
+    rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = defaultdict(lambda: defaultdict(float))
+        # name -> labels -> [count of every bucket, +Inf included, sum]
+        self.histograms: Dict[str, Dict[Tuple[Tuple[str, str], ...], List[float]]] = defaultdict(dict)
+        self.help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1, help: str = ""):
+        with self._lock:
+            self.help.setdefault(name, help)
+            self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def observe(self, name: str, labels: Dict[str, str], value: float, help: str = ""):
+        with self._lock:
+            self.help.setdefault(name, help)
+            series = self.histograms[name].setdefault(tuple(sorted(labels.items())), [0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def record(self, trace: QueryTrace):
+        self.observe("rag_query_seconds", {}, trace.seconds, "Wall time of a question")
+        labels = {key: str(trace.attributes[key]).lower() for key in ("cache", "budget_exhausted") if key in trace.attributes}
+        self.inc("rag_queries_total", labels, help="Questions answered, by answer cache outcome and budget exhaustion")
+        for kind, stages in (("node", trace.nodes), ("chain", trace.chains)):
+            for stage, stats in stages.items():
+                labels = {kind: stage}
+                self.observe(f"rag_{kind}_seconds", labels, stats.seconds, f"Wall time of a {kind} per question")
+                self.inc(f"rag_{kind}_runs_total", labels, stats.runs, f"Runs of a {kind}")
+                self.inc(f"rag_{kind}_llm_calls_total", labels, stats.llm_calls, f"LLM calls made by a {kind}")
+                self.inc(f"rag_{kind}_tokens_total", {**labels, "type": "prompt"}, stats.prompt_tokens, f"Tokens used by a {kind}")
+                self.inc(f"rag_{kind}_tokens_total", {**labels, "type": "completion"}, stats.completion_tokens)
+                self.inc(f"rag_{kind}_cache_hits_total", labels, stats.cache_hits, f"Chain cache hits of a {kind}")
+                self.inc(f"rag_{kind}_retries_total", labels, stats.retries, f"Retried calls of a {kind}")
+                self.inc(f"rag_{kind}_errors_total", labels, stats.errors, f"Failed runs of a {kind}")
+
+    @staticmethod
+    def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines += [f"# HELP {name} {self.help.get(name, '')}".rstrip(), f"# TYPE {name} counter"]
+                lines += [f"{name}{self._labels(labels)} {value:g}" for labels, value in sorted(series.items())]
+            for name, series in sorted(self.histograms.items()):
+                lines += [f"# HELP {name} {self.help.get(name, '')}".rstrip(), f"# TYPE {name} histogram"]
+                for labels, values in sorted(series.items()):
+                    bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, values[:-2] + [values[-2]]):
+                        lines.append(f"{name}_bucket{self._labels(labels + (('le', bound),))} {count:g}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {values[-1]:g}")
+                    lines.append(f"{name}_count{self._labels(labels)} {values[-2]:g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Atomically write the metrics, e.g. for the textfile collector of the node exporter."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
+
+
+class Instrumentation:
+    """
+    Traces questions answered by the QueryService, appending one JSON trace per question
+    to trace_path and keeping the aggregate metrics, written to metrics_path after every question.
+    """
+
+    def __init__(self, trace_path: str | None = None, metrics_path: str | None = None, metrics: MetricsRegistry | None = None):
+        self.trace_path = trace_path
+        self.metrics_path = metrics_path
+        self.metrics = metrics or MetricsRegistry()
+        self._trace_file: TextIO | None = None
+        self._lock = threading.Lock()
+
+    def new_trace(self, question: str) -> QueryTrace:
+        return QueryTrace(question)
+
+    def record(self, trace: QueryTrace) -> Dict[str, Any]:
+        trace.finish()
+        self.metrics.record(trace)
+        trace_dict = trace.to_dict()
+        try:
+            with self._lock:
+                if self.trace_path:
+                    if self._trace_file is None:
+                        directory = os.path.dirname(self.trace_path)
+                        if directory:
+                            os.makedirs(directory, exist_ok=True)
+                        self._trace_file = open(self.trace_path, "a")
+                    self._trace_file.write(json.dumps(trace_dict) + "\n")
+                    self._trace_file.flush()
+                if self.metrics_path:
+                    self.metrics.write(self.metrics_path)
+        except OSError as e:
+            logger.warning(f"Failed to export the trace of '{trace.question}': {e}")
+        return trace_dict
+
+    def close(self):
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
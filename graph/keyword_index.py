@@ -0,0 +1,96 @@
+from typing import Dict, Iterable, List, Set
+import json
+import os
+import threading
+
+from utils import logger
+
+
+class KeywordIndex:
+    """
+    Inverted index from keyword to the ids of the chunks containing it, persisted as JSON
+    next to the Chroma collection so routing never has to scan the collection.
+    Writes from ingestion threads are safe while questions read it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.postings: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "KeywordIndex":
+        index = cls(path)
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                postings = json.load(file)
+            index.postings = {keyword: set(chunk_ids) for keyword, chunk_ids in postings.items()}
+            logger.info(f"Loaded keyword index with {len(index.postings)} keywords from {path}")
+        return index
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def save(self):
+        """Atomically write the index to disk."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        # Held until the replace, so concurrent saves never share the temporary file
+        with self._lock:
+            with open(tmp_path, "w") as file:
+                json.dump({keyword: sorted(chunk_ids) for keyword, chunk_ids in self.postings.items()}, file)
+            os.replace(tmp_path, self.path)
+
+    def add(self, chunk_id: str, keywords: Iterable[str]):
+        with self._lock:
+            for keyword in keywords:
+                self.postings.setdefault(keyword, set()).add(chunk_id)
+
+    def remove(self, chunk_ids: Iterable[str]):
+        chunk_ids = set(chunk_ids)
+        if not chunk_ids:
+            return
+        with self._lock:
+            for keyword in list(self.postings):
+                remaining = self.postings[keyword] - chunk_ids
+                if remaining:
+                    self.postings[keyword] = remaining
+                else:
+                    del self.postings[keyword]
+
+    def keywords(self) -> Set[str]:
+        with self._lock:
+            return set(self.postings)
+
+    def contains_any(self, keywords: Iterable[str]) -> bool:
+        """Costs one set lookup per given keyword, independent of the corpus size."""
+        with self._lock:
+            return any(keyword in self.postings for keyword in keywords)
+
+    def present(self, keywords: Iterable[str]) -> Set[str]:
+        """Those of the given keywords present in the index."""
+        with self._lock:
+            return {keyword for keyword in keywords if keyword in self.postings}
+
+    def overlap(self, keywords: Iterable[str]) -> float:
+        """Share of the given keywords present in the index."""
+        keywords = set(keywords)
+        if not keywords:
+            return 0.0
+        return len(self.present(keywords)) / len(keywords)
+
+    def chunk_ids_for(self, keywords: Iterable[str]) -> Set[str]:
+        chunk_ids = set()
+        with self._lock:
+            for keyword in keywords:
+                chunk_ids.update(self.postings.get(keyword, ()))
+        return chunk_ids
+
+    def __len__(self) -> int:
+        return len(self.postings)
+
+    @staticmethod
+    def keywords_from_metadata(metadata: dict) -> List[str]:
+        return json.loads(metadata.get("keywords", "[]"))
@@ -0,0 +1,136 @@
+from collections import Counter
+from typing import Dict, Iterable, List
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from utils import logger
+from graph.constants import DEFAULT_LOCAL_KEYWORDS_PER_CHUNK
+from graph import utils
+
+
+WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9'\-]*")
+# Punctuation ending a phrase, candidate bigrams never span it
+PHRASE_BREAK_PATTERN = re.compile(r"[.,;:!?()\[\]{}\"\n]+")
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her here
+hers herself him himself his how i if in into is it its itself just let me more most my myself no nor not now of
+off on once only or other our ours ourselves out over own same she should so some such than that the their theirs
+them themselves then there these they this those through to too under until up very was we were what when where
+which while who whom why will with would you your yours yourself yourselves
+""".split())
+
+
+def candidate_terms(text: str) -> List[str]:
+    """
+    Split a text into RAKE-style phrases at stopwords and punctuation and return their
+    unigrams and bigrams, the same one or two word keywords the LLM extractor is asked for.
+    """
+    terms = []
+    for fragment in PHRASE_BREAK_PATTERN.split(text.lower()):
+        phrase: List[str] = []
+        for word in WORD_PATTERN.findall(fragment) + [""]:
+            word = word.strip("'-")
+            if word and word not in STOPWORDS and len(word) > 1 and not word.isdigit():
+                phrase.append(word)
+                continue
+            terms.extend(phrase)
+            terms.extend(f"{first} {second}" for first, second in zip(phrase, phrase[1:]))
+            phrase = []
+    return utils.preprocess_keywords(terms)
+
+
+class TfidfKeywordExtractor:
+    """
+    LLM-free keyword extractor ranking the candidate terms of each chunk by TF-IDF.
+    Document frequencies are accumulated over everything ingested into the collection
+    and persisted as JSON next to it, so terms common to the whole corpus rank low.
+    """
+
+    def __init__(self, path: str | None = None, keywords_per_chunk: int = DEFAULT_LOCAL_KEYWORDS_PER_CHUNK):
+        self.path = path
+        self.keywords_per_chunk = keywords_per_chunk
+        self.document_count = 0
+        self.document_frequencies: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, keywords_per_chunk: int = DEFAULT_LOCAL_KEYWORDS_PER_CHUNK) -> "TfidfKeywordExtractor":
+        extractor = cls(path, keywords_per_chunk)
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                stats = json.load(file)
+            extractor.document_count = stats["document_count"]
+            extractor.document_frequencies = Counter(stats["document_frequencies"])
+            logger.info(f"Loaded keyword statistics of {extractor.document_count} chunks from {path}")
+        return extractor
+
+    @classmethod
+    def merged(cls, extractors: Iterable["TfidfKeywordExtractor"]) -> "TfidfKeywordExtractor":
+        """An extractor, saved nowhere, with the corpus statistics of all the given ones, e.g. of every shard."""
+        merged = cls()
+        for extractor in extractors:
+            with extractor._lock:
+                merged.keywords_per_chunk = extractor.keywords_per_chunk
+                merged.document_count += extractor.document_count
+                merged.document_frequencies.update(extractor.document_frequencies)
+        return merged
+
+    def save(self, path: str | None = None):
+        """Atomically write the corpus statistics to disk, to path or else to the extractor's own."""
+        path = path or self.path
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        # Held until the replace, so concurrent saves never share the temporary file
+        with self._lock:
+            with open(tmp_path, "w") as file:
+                json.dump({"document_count": self.document_count, "document_frequencies": self.document_frequencies}, file)
+            os.replace(tmp_path, path)
+
+    def extract(self, texts: Iterable[str], update: bool = True) -> List[List[str]]:
+        """
+        Return the top keywords of every text. With update, the texts are first counted
+        into the corpus statistics, so a batch is scored against everything seen so far.
+        """
+        term_counts = [Counter(candidate_terms(text)) for text in texts]
+        with self._lock:
+            if update:
+                self.document_count += len(term_counts)
+                for counts in term_counts:
+                    self.document_frequencies.update(counts.keys())
+            document_count = self.document_count
+            vocabulary: Dict[str, float] = {
+                term: self.document_frequencies.get(term, 0)
+                for counts in term_counts for term in counts
+            }
+
+        terms = list(vocabulary)
+        positions = {term: position for position, term in enumerate(terms)}
+        frequencies = np.fromiter((vocabulary[term] for term in terms), dtype=np.float64, count=len(terms))
+        idf = np.log((1 + document_count) / (1 + frequencies)) + 1
+
+        keywords = []
+        for counts in term_counts:
+            if not counts:
+                keywords.append([])
+                continue
+            chunk_terms = list(counts)
+            tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts)) / sum(counts.values())
+            scores = tf * idf[[positions[term] for term in chunk_terms]]
+            # Stable sort keeps the order of first appearance among equal scores
+            top = np.argsort(-scores, kind="stable")[:self.keywords_per_chunk]
+            keywords.append([chunk_terms[index] for index in top])
+        return keywords
+
+    @staticmethod
+    def question_keywords(question: str) -> List[str]:
+        """Every candidate term of a question, so routing matches any of them against the keyword index."""
+        return list(dict.fromkeys(candidate_terms(question)))
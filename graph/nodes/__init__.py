@@ -1,7 +1,12 @@
-from graph.nodes.generate import generate
-from graph.nodes.grade_documents import grade_documents
-from graph.nodes.retrieve import retrieve
-from graph.nodes.web_search import web_search
+from graph.nodes.compress import acompress_context, compress_context
+from graph.nodes.generate import agenerate, generate
+from graph.nodes.grade_documents import agrade_documents, grade_documents
+from graph.nodes.retrieve import aretrieve, retrieve
+from graph.nodes.route import aroute, route
+from graph.nodes.web_search import aweb_search, web_search
 
 
-__all__ = ["generate", "grade_documents", "retrieve", "web_search"]
\ No newline at end of file
+__all__ = [
+    "compress_context", "generate", "grade_documents", "retrieve", "route", "web_search",
+    "acompress_context", "agenerate", "agrade_documents", "aretrieve", "aroute", "aweb_search"
+]
@@ -0,0 +1,25 @@
+from typing import Any, Dict
+import asyncio
+
+from utils import logger
+from graph.compression import compress_documents
+from graph.config import get_config
+from graph.state import GraphState
+
+
+def compress_context(state: GraphState) -> Dict[str, Any]:
+    logger.info("---COMPRESS CONTEXT---")
+    documents = state["documents"]
+    config = get_config(state)
+    if not config.compress_context:
+        return {"context": documents}
+
+    context = compress_documents(state["question"], documents, config.context_max_tokens, config.context_sentence_window)
+    logger.info(f"---KEPT {sum(len(document.page_content) for document in context)} OF "
+                f"{sum(len(document.page_content) for document in documents)} CHARACTERS---")
+    return {"context": context}
+
+
+async def acompress_context(state: GraphState) -> Dict[str, Any]:
+    # Pure CPU work, but loading the tiktoken encoding the first time may touch the disk or network
+    return await asyncio.to_thread(compress_context, state)
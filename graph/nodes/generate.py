@@ -1,14 +1,57 @@
 from typing import Any, Dict
 
+from langchain_core.runnables import RunnableConfig
+
 from utils import logger
-from graph.chains.generation import generation_chain
+from graph.budget import QueryBudget, get_budget
+from graph.chains.generation import get_generation_chain
+from graph.constants import ANSWER_TOKEN_EVENT, GENERATION_STARTED_EVENT
 from graph.state import GraphState
+from graph.streaming import aemit, emit
+
+
+def _keep_answer(state: GraphState, budget: QueryBudget | None) -> Dict[str, Any] | None:
+    """Once the budget is spent, the answer generated last is kept instead of generating a new one."""
+    if budget is None or not state.get("answer") or budget.allows(1):
+        return None
+    logger.warning("---KEEPING THE PREVIOUS ANSWER, QUERY BUDGET EXHAUSTED---")
+    return {"answer": state["answer"]}
+
+
+def generate(state: GraphState, config: RunnableConfig | None = None) -> Dict[str, Any]:
+    logger.info("---GENERATE---")
+    question = state["question"]
+    documents = state["documents"]
+    context = state.get("context", documents)
+    budget = get_budget(state, config)
+    if (kept := _keep_answer(state, budget)) is not None:
+        return kept
+    if budget is not None:
+        budget.record_generation()
+
+    # Streamed so callers listening to the run see the answer token by token
+    emit(GENERATION_STARTED_EVENT, {}, config)
+    answer = ""
+    for token in get_generation_chain().stream({"context": context, "question": question}, config):
+        answer += token
+        emit(ANSWER_TOKEN_EVENT, {"token": token}, config)
+    return {"documents": documents, "question": question, "answer": answer}
 
 
-def generate(state: GraphState) -> Dict[str, Any]:
+async def agenerate(state: GraphState, config: RunnableConfig | None = None) -> Dict[str, Any]:
     logger.info("---GENERATE---")
     question = state["question"]
     documents = state["documents"]
+    context = state.get("context", documents)
+    budget = get_budget(state, config)
+    if (kept := _keep_answer(state, budget)) is not None:
+        return kept
+    if budget is not None:
+        budget.record_generation()
 
-    answer = generation_chain.invoke({"context": documents, "question": question})
-    return {"documents": documents, "question": question, "answer": answer}
\ No newline at end of file
+    await aemit(GENERATION_STARTED_EVENT, {}, config)
+    answer = ""
+    async for token in get_generation_chain().astream({"context": context, "question": question}, config):
+        answer += token
+        await aemit(ANSWER_TOKEN_EVENT, {"token": token}, config)
+    return {"documents": documents, "question": question, "answer": answer}
@@ -1,14 +1,65 @@
-from typing import Any, Dict, Tuple
-import concurrent.futures
+from typing import Any, Dict, List
 
 from langchain.schema import Document
+from langchain_core.runnables import RunnableConfig
 
 from utils import logger
-from graph.chains.retrieval_grader import retrieval_grader
+from graph.chains.batch_retrieval_grader import format_documents, get_batch_retrieval_grader, parse_batch_grades
+from graph.budget import QueryBudget, get_budget
+from graph.chains.retrieval_grader import GradeDocuments, get_retrieval_grader
+from graph.config import RAGConfig, get_config
+from graph.constants import BATCH_GRADING, RETRY_EVENT
+from graph.nodes.web_search import cancel_speculative_search
 from graph.state import GraphState
+from graph.streaming import aemit, emit
 
 
-def grade_documents(state: GraphState) -> Dict[str, Any]:
+def _grading_inputs(question: str, documents: List[Document]) -> List[Dict[str, str]]:
+    return [{"question": question, "document": document.page_content} for document in documents]
+
+
+def _batch_grading_input(question: str, documents: List[Document]) -> Dict[str, str]:
+    return {"question": question, "documents": format_documents([document.page_content for document in documents])}
+
+
+def _use_batch_grading(config: RAGConfig, documents: List[Document]) -> bool:
+    if config.grading_mode != BATCH_GRADING or len(documents) < 2:
+        return False
+    if sum(len(document.page_content) for document in documents) > config.batch_grading_max_chars:
+        logger.info("---DOCUMENTS TOO LARGE FOR BATCH GRADING, GRADING ONE BY ONE---")
+        return False
+    return True
+
+
+def _ungraded(state: GraphState, budget: QueryBudget | None, llm_calls: int) -> Dict[str, Any] | None:
+    """When grading doesn't fit in the budget, every retrieved document is kept as is."""
+    if budget is None or budget.allows(llm_calls):
+        return None
+    logger.warning("---SKIPPING DOCUMENT GRADING, QUERY BUDGET EXHAUSTED---")
+    return _filter_relevant(state, state["documents"], [GradeDocuments(binary_score="yes")] * len(state["documents"]))
+
+
+def _filter_relevant(state: GraphState, documents: List[Document], grades: List[GradeDocuments]) -> Dict[str, Any]:
+    filtered_docs = []
+    web_search = False
+    for document, grade in zip(documents, grades):
+        if grade.binary_score == "yes":
+            filtered_docs.append(document)
+        else:
+            web_search = True
+
+    update = {
+        "documents": filtered_docs,
+        "question": state["question"],
+        "web_search": web_search
+    }
+    if not web_search and state.get("speculative_search") is not None:
+        cancel_speculative_search(state["speculative_search"])
+        update["speculative_search"] = None
+    return update
+
+
+def grade_documents(state: GraphState, config: RunnableConfig | None = None) -> Dict[str, Any]:
     """
     Determines whether the retrieved documents are relevant to the question
     If any document is not relevant, we will set a flag to run web search
@@ -21,27 +72,56 @@ def grade_documents(state: GraphState) -> Dict[str, Any]:
     logger.info("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
     question = state["question"]
     documents = state["documents"]
+    budget = get_budget(state, config)
+    rag_config = get_config(state)
 
-    def is_relevant(document:Document) -> Tuple[Document, bool]:
-        grade = retrieval_grader.invoke(
-            {"question": question, "document": document.page_content}
+    grades = None
+    if _use_batch_grading(rag_config, documents):
+        if (ungraded := _ungraded(state, budget, 1)) is not None:
+            return ungraded
+        try:
+            response = get_batch_retrieval_grader().invoke(_batch_grading_input(question, documents))
+            grades = parse_batch_grades(response, len(documents))
+        except Exception as e:
+            logger.warning(f"Batch grading failed: {e}")
+        if grades is None:
+            logger.warning("---BATCH GRADES UNUSABLE, GRADING ONE BY ONE---")
+            emit(RETRY_EVENT, {"reason": "batch_grading"}, config)
+    if grades is None:
+        if (ungraded := _ungraded(state, budget, len(documents))) is not None:
+            return ungraded
+        grades = get_retrieval_grader().batch(
+            _grading_inputs(question, documents),
+            config={"max_concurrency": rag_config.max_concurrency}
         )
-        return document, grade.binary_score == "yes"
-    
+    return _filter_relevant(state, documents, grades)
 
-    filtered_docs = []
-    web_search = False
-    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-        futures = [executor.submit(is_relevant, document) for document in documents]
-        for future in futures:
-            document, is_document_relevant = future.result()
-            if is_document_relevant:
-                filtered_docs.append(document)
-            else:
-                web_search = True
-                
-    return {
-        "documents": filtered_docs,
-        "question": question,
-        "web_search": web_search
-    }
\ No newline at end of file
+
+async def agrade_documents(state: GraphState, config: RunnableConfig | None = None) -> Dict[str, Any]:
+    """Async version of grade_documents, grading all documents concurrently on the event loop."""
+    logger.info("---CHECK DOCUMENT RELEVANCE TO QUESTION---")
+    question = state["question"]
+    documents = state["documents"]
+    budget = get_budget(state, config)
+    rag_config = get_config(state)
+
+    grades = None
+    if _use_batch_grading(rag_config, documents):
+        if (ungraded := _ungraded(state, budget, 1)) is not None:
+            return ungraded
+        try:
+            response = await get_batch_retrieval_grader().ainvoke(_batch_grading_input(question, documents))
+            grades = parse_batch_grades(response, len(documents))
+        except Exception as e:
+            logger.warning(f"Batch grading failed: {e}")
+        if grades is None:
+            logger.warning("---BATCH GRADES UNUSABLE, GRADING ONE BY ONE---")
+            await aemit(RETRY_EVENT, {"reason": "batch_grading"}, config)
+    if grades is None:
+        if (ungraded := _ungraded(state, budget, len(documents))) is not None:
+            return ungraded
+        grades = await get_retrieval_grader().abatch(
+            _grading_inputs(question, documents),
+            config={"max_concurrency": rag_config.max_concurrency}
+        )
+    return _filter_relevant(state, documents, grades)
@@ -1,19 +1,67 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 from langchain.schema import Document
 
 from utils import logger
+from graph.config import RAGConfig, get_config
+from graph.constants import HYBRID_RETRIEVAL, SPECULATE_ALWAYS, SPECULATE_LOW_RELEVANCE
+from graph.nodes.web_search import astart_speculative_search, should_speculate, start_speculative_search
 from graph.state import GraphState
 from graph.ingest import RAGVectorStore
+from graph import retrieval
+
+
+def _from_scored(scored: List[Tuple[Document, float]]) -> Tuple[List[Document], float]:
+    return [document for document, _ in scored], max((score for _, score in scored), default=0.0)
+
+
+def _needs_scores(config: RAGConfig) -> bool:
+    # Hybrid search always scores, plain vector retrieval only when speculation depends on the relevance
+    return config.retrieval_mode == HYBRID_RETRIEVAL or config.speculative_web_search == SPECULATE_LOW_RELEVANCE
 
 
 def retrieve(state: GraphState) -> Dict[str, Any]:
-    #TODO: add metadata filtering
     logger.info("---RETRIEVE---")
     question:str = state["question"]
-    retriever:RAGVectorStore = state["retriever"]
-    documents:List[Document] = retriever.get_retriever().invoke(question)
+    config = get_config(state)
+    # Started first so the search overlaps with retrieval as well as grading
+    speculative_search = start_speculative_search(question) if config.speculative_web_search == SPECULATE_ALWAYS else None
+    documents:List[Document] | None = state.get("prefetched_documents")
+    relevance = state.get("retrieval_relevance")
+    if documents is None:
+        retriever:RAGVectorStore = state["retriever"]
+        if _needs_scores(config):
+            documents, relevance = _from_scored(retrieval.search(retriever, question, config))
+        else:
+            documents = retriever.get_retriever(config.retrieval_k).invoke(question)
+    if speculative_search is None and should_speculate(config, relevance):
+        speculative_search = start_speculative_search(question)
+    return {
+        "documents": documents,
+        "question": question,
+        "prefetched_documents": None,
+        "speculative_search": speculative_search
+    }
+
+
+async def aretrieve(state: GraphState) -> Dict[str, Any]:
+    logger.info("---RETRIEVE---")
+    question:str = state["question"]
+    config = get_config(state)
+    speculative_search = astart_speculative_search(question) if config.speculative_web_search == SPECULATE_ALWAYS else None
+    documents:List[Document] | None = state.get("prefetched_documents")
+    relevance = state.get("retrieval_relevance")
+    if documents is None:
+        retriever:RAGVectorStore = state["retriever"]
+        if _needs_scores(config):
+            documents, relevance = _from_scored(await retrieval.asearch(retriever, question, config))
+        else:
+            documents = await retriever.get_retriever(config.retrieval_k).ainvoke(question)
+    if speculative_search is None and should_speculate(config, relevance):
+        speculative_search = astart_speculative_search(question)
     return {
         "documents": documents,
-        "question": question
-    }
\ No newline at end of file
+        "question": question,
+        "prefetched_documents": None,
+        "speculative_search": speculative_search
+    }
@@ -0,0 +1,61 @@
+from typing import Any, Dict, Set
+
+from langchain_core.runnables import RunnableConfig
+
+from utils import logger
+from graph.budget import QueryBudget, get_budget
+from graph.config import get_config
+from graph.constants import RETRIEVE, SCORE_ROUTING
+from graph.state import GraphState
+from graph.ingest import RAGVectorStore
+from graph import routing
+
+
+def _score_update(signals: routing.RouteSignals, state: GraphState) -> Dict[str, Any]:
+    decision = routing.score_route(signals, get_config(state))
+    return {
+        "route_decision": decision,
+        "prefetched_documents": signals.documents if decision == RETRIEVE else None,
+        "retrieval_relevance": signals.top_relevance
+    }
+
+
+def _start_budget(state: GraphState, config: RunnableConfig | None) -> QueryBudget:
+    """The entry node gives runs started without a budget one built from their RAGConfig."""
+    if state.get("budget") is None:
+        state = {**state, "budget": QueryBudget.from_config(get_config(state))}
+    return get_budget(state, config)
+
+
+def _keyword_update(retriever: RAGVectorStore, keywords_in_question: Set[str] | None, budget: QueryBudget) -> Dict[str, Any]:
+    # Without the budget for a keyword extraction call, the vector store is tried first
+    decision = routing.keyword_route(retriever, keywords_in_question) if keywords_in_question is not None else RETRIEVE
+    return {"route_decision": decision, "budget": budget}
+
+
+def route(state: GraphState, config: RunnableConfig | None = None) -> Dict[str, Any]:
+    logger.info("---ROUTE---")
+    question:str = state["question"]
+    retriever:RAGVectorStore = state["retriever"]
+    budget = _start_budget(state, config)
+    rag_config = get_config(state)
+    if rag_config.routing_mode == SCORE_ROUTING:
+        return {**_score_update(routing.route_signals(retriever, question, rag_config), state), "budget": budget}
+    keywords_in_question = None
+    if budget.allows(1) or retriever.local_keyword_extractor:
+        keywords_in_question = retriever.extract_question_keywords(question)
+    return _keyword_update(retriever, keywords_in_question, budget)
+
+
+async def aroute(state: GraphState, config: RunnableConfig | None = None) -> Dict[str, Any]:
+    logger.info("---ROUTE---")
+    question:str = state["question"]
+    retriever:RAGVectorStore = state["retriever"]
+    budget = _start_budget(state, config)
+    rag_config = get_config(state)
+    if rag_config.routing_mode == SCORE_ROUTING:
+        return {**_score_update(await routing.aroute_signals(retriever, question, rag_config), state), "budget": budget}
+    keywords_in_question = None
+    if budget.allows(1) or retriever.local_keyword_extractor:
+        keywords_in_question = await retriever.aextract_question_keywords(question)
+    return _keyword_update(retriever, keywords_in_question, budget)
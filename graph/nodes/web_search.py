@@ -1,27 +1,206 @@
-from typing import Any, Dict
+from collections import Counter
+from typing import Any, Dict, List
+import asyncio
+import concurrent.futures
+import threading
 
 from langchain.schema import Document
-from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_core.runnables import Runnable, RunnableConfig
 
 from utils import logger
+from graph.budget import QueryBudget, get_budget
+from graph.compression import normalize_text
+from graph.config import RAGConfig, get_config
+from graph.constants import DEFAULT_SPECULATIVE_SEARCH_WORKERS, RETRY_EVENT, SPECULATE_ALWAYS, SPECULATE_LOW_RELEVANCE
+from graph.search_cache import get_web_search_cache
 from graph.state import GraphState
+from graph.streaming import aemit, emit
+from graph.write_back import start_write_back
 
 
-web_search_tool = TavilySearchResults(max_results=3)
+_web_search_tool: Runnable | None = None
+_speculation_executor: concurrent.futures.ThreadPoolExecutor | None = None
+_speculation_executor_lock = threading.Lock()
+# Counts of speculative searches started, used by web_search and cancelled after grading passed
+speculation_stats: Counter = Counter()
+_speculation_stats_lock = threading.Lock()
 
 
-def web_search(state: GraphState) -> Dict[str, Any]:
+def _count_speculation(event: str):
+    # Counted from concurrent graphs and the speculative search threads
+    with _speculation_stats_lock:
+        speculation_stats[event] += 1
+
+
+def get_web_search_tool() -> Runnable:
+    global _web_search_tool
+    if _web_search_tool is None:
+        from langchain_community.tools.tavily_search import TavilySearchResults
+
+        _web_search_tool = TavilySearchResults(max_results=3)
+    return _web_search_tool
+
+
+def set_web_search_tool(tool: Runnable | None):
+    """
+    Replace the search tool with any runnable taking {"query": ...} and returning a list of
+    {"content": ...} results, e.g. a local stub. Pass None to go back to Tavily.
+    Results cached from the previous tool are dropped.
+    """
+    global _web_search_tool
+    _web_search_tool = tool
+    if (cache := get_web_search_cache()) is not None:
+        cache.clear()
+
+
+def search_web(query: str) -> List[Dict[str, Any]]:
+    """Search the web, or reuse the results of the same query while they are cached."""
+    cache = get_web_search_cache()
+    if cache is not None and (cached := cache.get(query)) is not None:
+        logger.info("---WEB SEARCH CACHE HIT---")
+        return cached
+    results = get_web_search_tool().invoke({"query": query})
+    if cache is not None:
+        cache.set(query, results)
+    return results
+
+
+async def asearch_web(query: str) -> List[Dict[str, Any]]:
+    cache = get_web_search_cache()
+    if cache is not None and (cached := cache.get(query)) is not None:
+        logger.info("---WEB SEARCH CACHE HIT---")
+        return cached
+    results = await get_web_search_tool().ainvoke({"query": query})
+    if cache is not None:
+        cache.set(query, results)
+    return results
+
+
+def should_speculate(config: RAGConfig, relevance: float | None) -> bool:
+    """
+    Whether to start the web search before grading. "always" pays one extra search for every question
+    answered from the vector store, "low_relevance" only when the best retrieved match looks weak.
+    """
+    if config.speculative_web_search == SPECULATE_ALWAYS:
+        return True
+    if config.speculative_web_search == SPECULATE_LOW_RELEVANCE:
+        return relevance is not None and relevance < config.speculative_max_relevance
+    return False
+
+
+def start_speculative_search(question: str) -> concurrent.futures.Future:
+    """Start the web search on a background thread, for graphs run with invoke."""
+    global _speculation_executor
+    # Concurrent first questions must share one pool, or the worker limit would be per pool
+    with _speculation_executor_lock:
+        if _speculation_executor is None:
+            _speculation_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=DEFAULT_SPECULATIVE_SEARCH_WORKERS, thread_name_prefix="speculative-search"
+            )
+    logger.info("---SPECULATIVE WEB SEARCH STARTED---")
+    _count_speculation("started")
+    return _speculation_executor.submit(search_web, question)
+
+
+def astart_speculative_search(question: str) -> asyncio.Task:
+    """Start the web search as a task on the running event loop, for graphs run with ainvoke."""
+    logger.info("---SPECULATIVE WEB SEARCH STARTED---")
+    _count_speculation("started")
+    return asyncio.ensure_future(asearch_web(question))
+
+
+def cancel_speculative_search(speculative_search: concurrent.futures.Future | asyncio.Task | None):
+    """Drop a speculative search that is no longer needed, a search already in flight just has its result ignored."""
+    if speculative_search is None:
+        return
+    logger.info("---SPECULATIVE WEB SEARCH DISCARDED---")
+    _count_speculation("cancelled")
+    speculative_search.cancel()
+
+
+def _merge_results(documents: List[Document] | None, tavily_results: List[Dict[str, Any]]) -> List[Document]:
+    """
+    Add one document per result, with its URL as source. Results already among the documents,
+    by URL or by content, are skipped, so searching again after a rejected answer adds no duplicates.
+    """
+    documents = list(documents or [])
+    sources = {document.metadata.get("source") for document in documents} - {None}
+    contents = {normalize_text(document.page_content) for document in documents}
+    added = 0
+    for tavily_result in tavily_results:
+        url = tavily_result.get("url")
+        content = normalize_text(tavily_result.get("content") or "")
+        if not content or content in contents or (url and url in sources):
+            continue
+        documents.append(Document(page_content=tavily_result["content"], metadata={"source": url} if url else {}))
+        contents.add(content)
+        if url:
+            sources.add(url)
+        added += 1
+    logger.info(f"---ADDED {added} OF {len(tavily_results)} WEB RESULTS---")
+    return documents
+
+
+def _write_back(state: GraphState, tavily_results: List[Dict[str, Any]]):
+    config = get_config(state)
+    retriever = state.get("retriever")
+    # Snapshots are read-only, results written back would only land in the collection they were exported from
+    if config.web_search_write_back and retriever is not None and not getattr(retriever, "read_only", False):
+        start_write_back(retriever, tavily_results, config)
+
+
+def _out_of_time(state: GraphState, budget: QueryBudget | None) -> Dict[str, Any] | None:
+    # Searching makes no LLM call, only the deadline and the other limits already hit can stop it
+    if budget is None or budget.allows(0):
+        return None
+    logger.warning("---SKIPPING WEB SEARCH, QUERY BUDGET EXHAUSTED---")
+    cancel_speculative_search(state.get("speculative_search"))
+    return {"documents": state.get("documents") or [], "speculative_search": None}
+
+
+def web_search(state: GraphState, config: RunnableConfig | None = None) -> Dict[str, Any]:
+    logger.info("---WEB SEARCH---")
+    question = state.get("question", "Who are you?")
+    documents = state.get("documents", [])
+    if (skipped := _out_of_time(state, get_budget(state, config))) is not None:
+        return skipped
+
+    tavily_results = None
+    speculative_search = state.get("speculative_search")
+    if speculative_search is not None and not speculative_search.cancelled():
+        try:
+            tavily_results = speculative_search.result()
+            _count_speculation("used")
+        except Exception as e:
+            logger.warning(f"Speculative web search failed, searching again: {e}")
+            emit(RETRY_EVENT, {"reason": "speculative_search"}, config)
+    if tavily_results is None:
+        tavily_results = search_web(question)
+    documents = _merge_results(documents, tavily_results)
+    _write_back(state, tavily_results)
+    return {"documents": documents, "question": question, "speculative_search": None}
+
+
+async def aweb_search(state: GraphState, config: RunnableConfig | None = None) -> Dict[str, Any]:
     logger.info("---WEB SEARCH---")
     question = state.get("question", "Who are you?")
     documents = state.get("documents", [])
+    if (skipped := _out_of_time(state, get_budget(state, config))) is not None:
+        return skipped
 
-    tavily_results = web_search_tool.invoke({"query": question})
-    joined_tavily_result = "\n".join(
-        [tavily_result["content"] for tavily_result in tavily_results]
-    )
-    web_results = Document(page_content=joined_tavily_result)
-    if documents is not None:
-        documents.append(web_results)
-    else:
-        documents = [web_results]
-    return {"documents": documents, "question": question}
\ No newline at end of file
+    tavily_results = None
+    speculative_search = state.get("speculative_search")
+    if speculative_search is not None and not speculative_search.cancelled():
+        if isinstance(speculative_search, concurrent.futures.Future):
+            speculative_search = asyncio.wrap_future(speculative_search)
+        try:
+            tavily_results = await speculative_search
+            _count_speculation("used")
+        except Exception as e:
+            logger.warning(f"Speculative web search failed, searching again: {e}")
+            await aemit(RETRY_EVENT, {"reason": "speculative_search"}, config)
+    if tavily_results is None:
+        tavily_results = await asearch_web(question)
+    documents = _merge_results(documents, tavily_results)
+    _write_back(state, tavily_results)
+    return {"documents": documents, "question": question, "speculative_search": None}
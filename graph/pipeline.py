@@ -0,0 +1,243 @@
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, List, Set
+import os
+import queue
+import threading
+
+from langchain.schema import Document
+
+from utils import logger
+from graph.constants import (
+    DEFAULT_CHECKPOINT_EVERY_BATCHES,
+    DEFAULT_PIPELINE_QUEUE_SIZE,
+    DEFAULT_URL_BATCH_SIZE,
+    DEFAULT_WRITE_BATCH_SIZE
+)
+from graph.fetch import FetchResult
+
+if TYPE_CHECKING:
+    from graph.ingest import IngestionReport, RAGVectorStore
+
+
+_DONE = object()
+
+
+class IngestionCheckpoint:
+    """Append-only file listing the URLs whose chunks are fully written, used to resume a crashed run."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def completed_urls(self) -> Set[str]:
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, "r") as file:
+            return {line.strip() for line in file if line.strip()}
+
+    def mark_completed(self, urls: Iterable[str]):
+        urls = list(urls)
+        if not urls:
+            return
+        with open(self.path, "a") as file:
+            file.write("".join(f"{url}\n" for url in urls))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+@dataclass
+class ChunkBatch:
+    documents: List[Document]
+    embeddings: List[List[float]] | None = None
+
+
+@dataclass
+class UrlPlanned:
+    """Marks that every chunk of a URL has been sent downstream, along with what to delete and reindex for it."""
+    result: FetchResult
+    to_delete: List[str] = field(default_factory=list)
+    to_reindex: List[Document] = field(default_factory=list)
+
+
+class StreamingIngestion:
+    """
+    Ingests URLs as a pipeline of threads connected by bounded queues:
+
+        fetch -> split + preprocess + dedup plan -> keyword extraction -> embed -> write
+
+    Only a few batches are in flight at any time, so memory stays flat however many URLs are ingested.
+    The writer records completed URLs in a checkpoint file, and a restarted run skips them.
+    The checkpoint is removed once a run finishes, so the next run re-crawls every URL.
+    The collection version is bumped once at the end of a run that changed it, even a failed one.
+    """
+
+    def __init__(
+        self,
+        store: "RAGVectorStore",
+        checkpoint_path: str | None = None,
+        url_batch_size: int = DEFAULT_URL_BATCH_SIZE,
+        write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE,
+        queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
+        checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY_BATCHES
+    ):
+        self.store = store
+        self.checkpoint = IngestionCheckpoint(
+            checkpoint_path or os.path.join(store.persist_directory, f"{store.collection_name}_ingest_checkpoint.txt")
+        )
+        self.url_batch_size = url_batch_size
+        self.write_batch_size = write_batch_size
+        self.queue_size = queue_size
+        self.checkpoint_every = checkpoint_every
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self._changed = False
+
+    def _put(self, output: queue.Queue, item: Any):
+        # Time out regularly so a failed downstream stage can't leave us blocked forever
+        while not self._stop.is_set():
+            try:
+                output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, input_queue: queue.Queue) -> Iterator[Any]:
+        while not self._stop.is_set():
+            try:
+                item = input_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def _run_stage(self, name: str, stage: Callable[[], None], output: queue.Queue | None):
+        try:
+            stage()
+        except BaseException as e:
+            logger.error(f"Ingestion stage {name} failed: {e}")
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            if output is not None:
+                self._put(output, _DONE)
+
+    def _fetch(self, urls: List[str], output: queue.Queue):
+        for start in range(0, len(urls), self.url_batch_size):
+            if self._stop.is_set():
+                return
+            for result in self.store.fetch_urls(urls[start:start + self.url_batch_size]):
+                self._put(output, result)
+
+    def _plan(self, input_queue: queue.Queue, output: queue.Queue):
+        batch: List[Document] = []
+        # URL markers wait until the batch holding their last chunk has been sent,
+        # so the writer never checkpoints a URL before all of its chunks are written
+        pending_markers: List[UrlPlanned] = []
+
+        def flush():
+            nonlocal batch, pending_markers
+            if batch:
+                self._put(output, ChunkBatch(batch))
+            for marker in pending_markers:
+                self._put(output, marker)
+            batch, pending_markers = [], []
+
+        for result, chunks in self.store.chunk_each(self._get(input_queue), lambda result: result.documents):
+            to_delete, to_reindex = [], []
+            if result.documents:
+                plan = self.store.plan_ingestion(chunks)
+                self.report.merge(plan.report)
+                to_delete, to_reindex = plan.to_delete, plan.to_reindex
+                for document in plan.to_add:
+                    batch.append(document)
+                    if len(batch) >= self.write_batch_size:
+                        flush()
+            result.documents = []
+            pending_markers.append(UrlPlanned(result, to_delete, to_reindex))
+            if not batch:
+                flush()
+        flush()
+
+    def _extract_keywords(self, input_queue: queue.Queue, output: queue.Queue):
+        for item in self._get(input_queue):
+            if isinstance(item, ChunkBatch):
+                self.store.add_additional_metadata(item.documents)
+            self._put(output, item)
+
+    def _embed(self, input_queue: queue.Queue, output: queue.Queue):
+        for item in self._get(input_queue):
+            if isinstance(item, ChunkBatch):
+                item.embeddings = self.store.embed_documents([document.page_content for document in item.documents])
+            self._put(output, item)
+
+    def _write(self, input_queue: queue.Queue):
+        completed: List[FetchResult] = []
+        batches_since_checkpoint = 0
+        changed = False
+        for item in self._get(input_queue):
+            if isinstance(item, ChunkBatch):
+                self.store.write_chunks(item.documents, item.embeddings)
+                batches_since_checkpoint += 1
+                changed = self._changed = True
+            else:
+                if item.to_delete:
+                    self.store.delete_chunks(item.to_delete)
+                    changed = self._changed = True
+                self.store.reindex_chunks(item.to_reindex)
+                if item.result.ok:
+                    completed.append(item.result)
+                else:
+                    self.report.failed_urls.append(item.result.url)
+                self.report.not_modified += item.result.not_modified
+            if batches_since_checkpoint >= self.checkpoint_every:
+                self._save_checkpoint(completed, changed)
+                completed, batches_since_checkpoint, changed = [], 0, False
+        if not self._stop.is_set():
+            self._save_checkpoint(completed, changed)
+
+    def _save_checkpoint(self, completed: List[FetchResult], changed: bool):
+        """Persist the keyword index before recording URLs as done, so a resumed run never misses their keywords."""
+        if changed:
+            self.store.save_keyword_index()
+        self.store.fetcher.remember(completed)
+        self.checkpoint.mark_completed(result.url for result in completed)
+
+    def run(self, urls: List[str]) -> "IngestionReport":
+        from graph.ingest import IngestionReport
+
+        self.report = IngestionReport()
+        self._stop.clear()
+        self._errors = []
+        self._changed = False
+        completed = self.checkpoint.completed_urls()
+        pending = [url for url in urls if url not in completed]
+        if completed:
+            logger.info(f"Resuming ingestion, skipping {len(urls) - len(pending)} URLs completed by a previous run")
+
+        fetched, planned, tagged, embedded = (queue.Queue(maxsize=self.queue_size) for _ in range(4))
+        stages = [
+            ("fetch", lambda: self._fetch(pending, fetched), fetched),
+            ("plan", lambda: self._plan(fetched, planned), planned),
+            ("keywords", lambda: self._extract_keywords(planned, tagged), tagged),
+            ("embed", lambda: self._embed(tagged, embedded), embedded),
+            ("write", lambda: self._write(embedded), None),
+        ]
+        threads = [
+            threading.Thread(target=self._run_stage, args=stage, name=f"ingest-{stage[0]}", daemon=True)
+            for stage in stages
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._changed:
+            self.store.bump_collection_version()
+        if self._errors:
+            raise self._errors[0]
+        self.checkpoint.clear()
+        return self.report
@@ -0,0 +1,92 @@
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, List, Sequence, Tuple
+import asyncio
+
+from langchain.schema import Document
+
+from graph.config import RAGConfig
+from graph.constants import DEFAULT_LEXICAL_WEIGHT, DEFAULT_RRF_K, DEFAULT_VECTOR_WEIGHT, HYBRID_RETRIEVAL
+
+if TYPE_CHECKING:
+    from graph.ingest import RAGVectorStore
+
+
+# Chroma's distances of normalized embeddings, as both backends produce, converted to their cosine similarity.
+# l2 distances are squared, 2 - 2 * cosine, which LangChain's default 1 - distance / sqrt(2) scales below zero
+RELEVANCE_FUNCTIONS: Dict[str, Callable[[float], float]] = {
+    "cosine": lambda distance: 1.0 - distance,
+    "l2": lambda distance: 1.0 - distance / 2,
+    "ip": lambda distance: 1.0 - distance,
+}
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Hashable]],
+    weights: Sequence[float] | None = None,
+    rrf_k: int = DEFAULT_RRF_K
+) -> List[Tuple[Hashable, float]]:
+    """
+    Fuse rankings of ids, best first, into one: each id scores the weighted sum of 1 / (rrf_k + rank)
+    over the rankings it appears in. Ties keep the order in which ids were first seen.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[Hashable, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def fuse_hybrid(
+    vector_results: List[Tuple[Document, float]],
+    lexical_results: List[Tuple[str, float]],
+    get_documents: Callable[[List[str]], Dict[str, Document]],
+    k: int,
+    vector_weight: float = DEFAULT_VECTOR_WEIGHT,
+    lexical_weight: float = DEFAULT_LEXICAL_WEIGHT,
+    rrf_k: int = DEFAULT_RRF_K
+) -> List[Tuple[Document, float]]:
+    """
+    Fuse vector (chunk, relevance) and BM25 (chunk id, score) rankings and return the k best chunks
+    with their vector relevance, 0 for chunks only found by BM25, which get_documents loads by id.
+    Vector results are matched by Document.id, the id the chunk is stored under like in the BM25 index,
+    as chunks of collections ingested before chunk ids were assigned have no chunk_id metadata.
+    """
+    by_id = {document.id: (document, score) for document, score in vector_results}
+    fused = reciprocal_rank_fusion(
+        [list(by_id), [chunk_id for chunk_id, _ in lexical_results]],
+        weights=[vector_weight, lexical_weight],
+        rrf_k=rrf_k
+    )[:k]
+    lexical_only = get_documents([chunk_id for chunk_id, _ in fused if chunk_id not in by_id])
+    results = []
+    for chunk_id, _ in fused:
+        if chunk_id in by_id:
+            results.append(by_id[chunk_id])
+        elif chunk_id in lexical_only:
+            results.append((lexical_only[chunk_id], 0.0))
+    return results
+
+
+def search(retriever: "RAGVectorStore", question: str, config: RAGConfig) -> List[Tuple[Document, float]]:
+    """
+    Documents for a question with the retrieval mode of the config, best first,
+    each with its vector relevance score, 0 for documents only matched lexically.
+    """
+    if config.retrieval_mode == HYBRID_RETRIEVAL:
+        return retriever.hybrid_search(
+            question,
+            k=config.retrieval_k,
+            fetch_k=config.hybrid_fetch_k,
+            vector_weight=config.vector_weight,
+            lexical_weight=config.lexical_weight,
+            rrf_k=config.rrf_k,
+            keyword_prefilter=config.keyword_prefilter
+        )
+    return retriever.search_with_relevance_scores(question, config.retrieval_k)
+
+
+async def asearch(retriever: "RAGVectorStore", question: str, config: RAGConfig) -> List[Tuple[Document, float]]:
+    if config.retrieval_mode == HYBRID_RETRIEVAL:
+        # The BM25 index is in memory and Chroma has no native async client, a worker thread does both
+        return await asyncio.to_thread(search, retriever, question, config)
+    return await retriever.asearch_with_relevance_scores(question, config.retrieval_k)
@@ -0,0 +1,102 @@
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Sequence, Set, Tuple
+
+from langchain.schema import Document
+
+from utils import logger
+from graph.config import RAGConfig
+from graph.constants import RETRIEVE, WEB_SEARCH
+from graph.local_keywords import TfidfKeywordExtractor
+from graph import retrieval
+
+if TYPE_CHECKING:
+    from graph.ingest import RAGVectorStore
+
+
+@dataclass
+class RouteSignals:
+    """
+    Retrieval evidence used to route a question without any LLM call.
+
+    Attributes:
+        documents(List[Document]): top-k documents of the collection, reused by the retrieve node
+        top_relevance(float): highest relevance score among them, 0 when the collection is empty
+        keyword_overlap(float): share of the question's candidate keywords present in the keyword index
+    """
+
+    documents: List[Document] = field(default_factory=list)
+    top_relevance: float = 0.0
+    keyword_overlap: float = 0.0
+
+
+def _signals(retriever: "RAGVectorStore", question: str, scored: List[Tuple[Document, float]]) -> RouteSignals:
+    return RouteSignals(
+        documents=[document for document, _ in scored],
+        top_relevance=max((score for _, score in scored), default=0.0),
+        keyword_overlap=retriever.keyword_overlap(TfidfKeywordExtractor.question_keywords(question))
+    )
+
+
+def route_signals(retriever: "RAGVectorStore", question: str, config: RAGConfig) -> RouteSignals:
+    """Signals from the documents the retrieval mode of the config returns, so retrieve can reuse them."""
+    return _signals(retriever, question, retrieval.search(retriever, question, config))
+
+
+async def aroute_signals(retriever: "RAGVectorStore", question: str, config: RAGConfig) -> RouteSignals:
+    return _signals(retriever, question, await retrieval.asearch(retriever, question, config))
+
+
+def score_route(signals: RouteSignals, config: RAGConfig) -> str:
+    """Retrieve when either the best match or the keyword overlap clears its threshold."""
+    if signals.top_relevance >= config.route_min_relevance or signals.keyword_overlap >= config.route_min_keyword_overlap:
+        logger.info(
+            f"---ROUTE DECISION: VECTOR STORE (relevance {signals.top_relevance:.2f}, overlap {signals.keyword_overlap:.2f})"
+        )
+        return RETRIEVE
+    logger.info(f"---ROUTE DECISION: WEB SEARCH (relevance {signals.top_relevance:.2f}, overlap {signals.keyword_overlap:.2f})")
+    return WEB_SEARCH
+
+
+def keyword_route(retriever: "RAGVectorStore", keywords_in_question: Set[str]) -> str:
+    if not retriever.has_any_keyword(keywords_in_question):
+        logger.info("---ROUTE DECISION: WEB SEARCH")
+        return WEB_SEARCH
+    logger.info("---ROUTE DECISION: VECTOR STORE")
+    return RETRIEVE
+
+
+def calibrate_threshold(in_domain: Sequence[float], out_of_domain: Sequence[float]) -> float:
+    """
+    Pick the threshold that best separates the scores of questions the collection can answer
+    from those it can't. Among equally accurate thresholds, the one halfway into the widest gap wins.
+    """
+    scores = sorted(set(in_domain) | set(out_of_domain))
+    if not scores:
+        raise ValueError("Calibration needs at least one score")
+    candidates = [scores[0]] + [(low + high) / 2 for low, high in zip(scores, scores[1:])] + [scores[-1] + 1e-6]
+    best_threshold, best_key = candidates[0], None
+    for threshold in candidates:
+        correct = sum(score >= threshold for score in in_domain) + sum(score < threshold for score in out_of_domain)
+        margin = min(abs(score - threshold) for score in scores)
+        if best_key is None or (correct, margin) > best_key:
+            best_threshold, best_key = threshold, (correct, margin)
+    return best_threshold
+
+
+def calibrate_routing(
+    retriever: "RAGVectorStore",
+    in_domain_questions: List[str],
+    out_of_domain_questions: List[str],
+    config: RAGConfig | None = None
+) -> Tuple[float, float]:
+    """Return the (min relevance, min keyword overlap) thresholds calibrated on labelled questions."""
+    config = config or RAGConfig()
+    in_domain = [route_signals(retriever, question, config) for question in in_domain_questions]
+    out_of_domain = [route_signals(retriever, question, config) for question in out_of_domain_questions]
+    min_relevance = calibrate_threshold(
+        [signals.top_relevance for signals in in_domain], [signals.top_relevance for signals in out_of_domain]
+    )
+    min_keyword_overlap = calibrate_threshold(
+        [signals.keyword_overlap for signals in in_domain], [signals.keyword_overlap for signals in out_of_domain]
+    )
+    return min_relevance, min_keyword_overlap
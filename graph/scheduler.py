@@ -0,0 +1,271 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+from graph.constants import (
+    BULK_PRIORITY,
+    DEFAULT_LLM_INITIAL_CONCURRENCY,
+    DEFAULT_LLM_MAX_CONCURRENCY,
+    DEFAULT_LLM_MIN_CONCURRENCY,
+    DEFAULT_LLM_TARGET_LATENCY_SECONDS,
+    INTERACTIVE_PRIORITY
+)
+
+
+PRIORITIES = (INTERACTIVE_PRIORITY, BULK_PRIORITY)
+
+_priority: ContextVar[str] = ContextVar("llm_priority", default=INTERACTIVE_PRIORITY)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+@contextmanager
+def llm_priority(priority: str) -> Iterator[None]:
+    """Issue the LLM calls made inside the block, including those of threads and tasks it starts, at this priority."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Refills per_minute units a minute, holding at most a minute's worth."""
+
+    def __init__(self, per_minute: float, now: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken. A request above the capacity waits for a full bucket instead of forever."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing * 60 / self.capacity)
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+
+@dataclass(order=True)
+class Ticket:
+    rank: int
+    sequence: int
+    tokens: float = field(compare=False)
+    wake: Callable[[], None] = field(compare=False, repr=False)
+    started: float = field(default=0.0, compare=False)
+    granted: bool = field(default=False, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+    released: bool = field(default=False, compare=False)
+
+
+class LLMScheduler:
+    """
+    Process wide admission control of LLM requests, shared by every chain whatever thread or event loop calls it.
+
+    A request waits until its priority is the most urgent waiting, fewer than the concurrency limit are in flight,
+    and the request and token buckets can pay for it. The limit adapts AIMD style: it grows by one every limit
+    successful requests answered within target_latency_seconds, and halves on a rate limit or a slower answer.
+    Only requests started after the last decrease can decrease it again, so a burst of 429s halves it once.
+    Embedding requests are not scheduled: the provider limits each model separately, and a large embedding batch
+    answered slowly would halve the limit of the chat requests.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        initial_concurrency: int = DEFAULT_LLM_INITIAL_CONCURRENCY,
+        min_concurrency: int = DEFAULT_LLM_MIN_CONCURRENCY,
+        max_concurrency: int = DEFAULT_LLM_MAX_CONCURRENCY,
+        target_latency_seconds: float | None = DEFAULT_LLM_TARGET_LATENCY_SECONDS,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        if not 1 <= min_concurrency <= initial_concurrency <= max_concurrency:
+            raise ValueError("Concurrency limits must satisfy 1 <= min <= initial <= max")
+        now = clock()
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency_seconds = target_latency_seconds
+        self.stats: Counter = Counter()
+        self._clock = clock
+        self._requests = TokenBucket(requests_per_minute, now) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute, now) if tokens_per_minute else None
+        self._limit = float(initial_concurrency)
+        self._last_decrease = float("-inf")
+        self._paused_until = float("-inf")
+        self._in_flight = 0
+        self._waiters: List[Ticket] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+        self._timer_due = float("inf")
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _enqueue(self, tokens: float, priority: str | None, wake: Callable[[], None]) -> Ticket:
+        ticket = Ticket(PRIORITIES.index(priority or current_priority()), next(self._sequence), tokens, wake)
+        with self._lock:
+            heapq.heappush(self._waiters, ticket)
+            self._dispatch()
+        return ticket
+
+    def acquire(self, tokens: float = 0, priority: str | None = None) -> Ticket:
+        """Block until a request estimated at tokens may be sent. Give the ticket back to release once answered."""
+        granted = threading.Event()
+        ticket = self._enqueue(tokens, priority, granted.set)
+        granted.wait()
+        return ticket
+
+    async def aacquire(self, tokens: float = 0, priority: str | None = None) -> Ticket:
+        """Async version of acquire, waiting without holding a thread."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            try:
+                loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+            except RuntimeError:
+                # The loop closed while the request waited, nobody is left to use the slot.
+                # wake is called by _dispatch, with the lock already held
+                self._release_locked(ticket)
+
+        ticket = self._enqueue(tokens, priority, wake)
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                ticket.cancelled = True
+            if ticket.granted:
+                self.release(ticket)
+            raise
+        return ticket
+
+    def release(
+        self,
+        ticket: Ticket,
+        latency: float | None = None,
+        throttled: bool = False,
+        retry_after: float | None = None
+    ):
+        """
+        Free the ticket's slot and adapt the limit: throttled when the provider answered 429,
+        latency being the seconds until it answered. Neither is given when the request failed otherwise.
+        """
+        with self._lock:
+            if self._release_locked(ticket, latency, throttled, retry_after):
+                self._dispatch()
+
+    def _release_locked(
+        self,
+        ticket: Ticket,
+        latency: float | None = None,
+        throttled: bool = False,
+        retry_after: float | None = None
+    ) -> bool:
+        """Free the ticket's slot with the lock held, returning whether it was still taken."""
+        if ticket.released:
+            return False
+        ticket.released = True
+        self._in_flight -= 1
+        now = self._clock()
+        if throttled:
+            self.stats["throttled"] += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            self._decrease(ticket, now)
+        elif latency is not None:
+            self.stats["completed"] += 1
+            if self.target_latency_seconds is not None and latency > self.target_latency_seconds:
+                self.stats["slow"] += 1
+                self._decrease(ticket, now)
+            else:
+                self._limit = min(float(self.max_concurrency), self._limit + 1 / self._limit)
+        return True
+
+    def _decrease(self, ticket: Ticket, now: float):
+        if ticket.started < self._last_decrease:
+            return
+        self._limit = max(float(self.min_concurrency), self._limit / 2)
+        self._last_decrease = now
+        self.stats["decreases"] += 1
+
+    def _dispatch(self):
+        """Grant waiting tickets in priority order while the limit and the buckets allow. Called with the lock held."""
+        now = self._clock()
+        while self._waiters:
+            ticket = self._waiters[0]
+            if ticket.cancelled:
+                heapq.heappop(self._waiters)
+                continue
+            if self._in_flight >= self.limit:
+                return
+            delay = max(
+                self._paused_until - now,
+                self._requests.delay(1, now) if self._requests else 0.0,
+                self._tokens.delay(ticket.tokens, now) if self._tokens else 0.0
+            )
+            if delay > 0:
+                self._schedule(now + delay)
+                return
+            heapq.heappop(self._waiters)
+            if self._requests:
+                self._requests.take(1, now)
+            if self._tokens:
+                self._tokens.take(ticket.tokens, now)
+            self._in_flight += 1
+            self.stats["requests"] += 1
+            ticket.started = now
+            ticket.granted = True
+            ticket.wake()
+
+    def _schedule(self, due: float):
+        if self._timer is not None and self._timer_due <= due:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(due - self._clock(), self._on_timer)
+        self._timer.daemon = True
+        self._timer_due = due
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._timer_due = float("inf")
+            self._dispatch()
+
+
+_llm_scheduler: LLMScheduler | None = LLMScheduler()
+
+
+def get_llm_scheduler() -> LLMScheduler | None:
+    return _llm_scheduler
+
+
+def set_llm_scheduler(scheduler: LLMScheduler | None):
+    """Replace the process wide LLM scheduler, pass None to send every request as soon as it is made."""
+    global _llm_scheduler
+    _llm_scheduler = scheduler
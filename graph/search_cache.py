@@ -0,0 +1,67 @@
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Tuple
+import threading
+import time
+
+from graph.answer_cache import normalize_question
+from graph.constants import DEFAULT_WEB_SEARCH_CACHE_MAX_ENTRIES, DEFAULT_WEB_SEARCH_CACHE_TTL_SECONDS
+
+
+class WebSearchCache:
+    """
+    In-memory LRU of web search results keyed by the normalized query. Entries expire after
+    ttl_seconds, as the web changes far more often than the collection.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_WEB_SEARCH_CACHE_MAX_ENTRIES,
+        ttl_seconds: float | None = DEFAULT_WEB_SEARCH_CACHE_TTL_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats: Counter = Counter()
+        self._entries: "OrderedDict[str, Tuple[List[Dict[str, Any]], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query: str) -> List[Dict[str, Any]] | None:
+        key = normalize_question(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and time.time() - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return list(entry[0])
+
+    def set(self, query: str, results: List[Dict[str, Any]]):
+        key = normalize_question(query)
+        with self._lock:
+            self._entries[key] = (list(results), time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_web_search_cache: WebSearchCache | None = WebSearchCache()
+
+
+def get_web_search_cache() -> WebSearchCache | None:
+    return _web_search_cache
+
+
+def set_web_search_cache(cache: WebSearchCache | None):
+    """Replace the process wide web search cache, pass None to search on every visit."""
+    global _web_search_cache
+    _web_search_cache = cache
@@ -0,0 +1,351 @@
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple, TypeVar
+from urllib.parse import urlparse
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+
+from langchain.schema import Document
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from utils import logger
+from graph.chains.keyword_extractor import get_keyword_extractor_chain, DocumentKeywords
+from graph.chunking import ChunkingPool
+from graph.constants import (
+    DEFAULT_CHUNKING_WORKERS,
+    DEFAULT_HYBRID_FETCH_K,
+    DEFAULT_LEXICAL_WEIGHT,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_RETRIEVAL_K,
+    DEFAULT_RRF_K,
+    DEFAULT_VECTOR_WEIGHT,
+    DOMAIN_SHARDING,
+    HASH_SHARDING,
+    LLM_KEYWORDS,
+    TFIDF_KEYWORDS
+)
+from graph.ingest import IngestionReport, RAGVectorStore
+from graph.local_keywords import TfidfKeywordExtractor
+from graph.retrieval import fuse_hybrid
+from graph import utils
+
+
+T = TypeVar("T")
+
+
+def shard_layout_path(persist_directory: str, collection_name: str) -> str:
+    return os.path.join(persist_directory, f"{collection_name}_shards.json")
+
+
+def read_shard_layout(persist_directory: str, collection_name: str) -> Dict[str, Any] | None:
+    try:
+        with open(shard_layout_path(persist_directory, collection_name), "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def collection_exists(persist_directory: str, collection_name: str) -> bool:
+    """Whether the collection, sharded or not, was ever created in persist_directory."""
+    if read_shard_layout(persist_directory, collection_name) is not None:
+        return True
+    if not os.path.isdir(persist_directory):
+        return False
+    import chromadb
+
+    client = chromadb.PersistentClient(path=persist_directory)
+    return collection_name in {collection.name for collection in client.list_collections()}
+
+
+class ShardedRAGVectorStore:
+    """
+    A collection spread over num_shards RAGVectorStore collections, each in a directory of its own.
+    Pages go to a shard by a hash of their URL, or of their domain so that a site lives in one shard.
+    Questions are searched on every shard in parallel and the best chunks of all of them are merged,
+    the keyword indexes are merged the same way. It can be used wherever a RAGVectorStore is.
+    The shards share one pool of chunking processes.
+
+    The layout is recorded next to the shards on creation, and a collection can't be reopened with another one,
+    as its pages would no longer be found in their shards.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        persist_directory: str,
+        num_shards: int,
+        shard_by: str = HASH_SHARDING,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        **store_options
+    ):
+        if shard_by not in (HASH_SHARDING, DOMAIN_SHARDING):
+            raise ValueError(f"Unknown sharding: {shard_by}")
+        if num_shards < 1:
+            raise ValueError("A sharded collection needs at least one shard")
+        layout = {"num_shards": num_shards, "shard_by": shard_by}
+        stored_layout = read_shard_layout(persist_directory, collection_name)
+        if stored_layout is not None and stored_layout != layout:
+            raise ValueError(f"Collection {collection_name} was created with the shard layout {stored_layout}, not {layout}")
+
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self.num_shards = num_shards
+        self.shard_by = shard_by
+        self.max_concurrency = max_concurrency
+        self.store_options = store_options
+        if stored_layout is None:
+            os.makedirs(persist_directory, exist_ok=True)
+            with open(shard_layout_path(persist_directory, collection_name), "w") as file:
+                json.dump(layout, file)
+        chunking_workers = store_options.get("chunking_workers", DEFAULT_CHUNKING_WORKERS)
+        self._chunking_pool = (
+            ChunkingPool(chunking_workers, store_options.get("text_splitter")) if chunking_workers > 1 else None
+        )
+        # One worker per shard, so a question searches all of them at once
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_shards, thread_name_prefix="shard")
+        self.shards: List[RAGVectorStore] = list(self._executor.map(self._open_shard, range(num_shards)))
+        self._rebuilding: Set[int] = set()
+        self._merged_keyword_extractor: TfidfKeywordExtractor | None = None
+        self._retrievers: Dict[int, Runnable] = {}
+
+    def _open_shard(self, index: int) -> RAGVectorStore:
+        return RAGVectorStore(
+            f"{self.collection_name}_{index}",
+            os.path.join(self.persist_directory, f"{self.collection_name}_shards", str(index)),
+            max_concurrency=self.max_concurrency,
+            chunking_pool=self._chunking_pool,
+            **self.store_options
+        )
+
+    def shard_index(self, source: str) -> int:
+        key = (urlparse(source).hostname or source) if self.shard_by == DOMAIN_SHARDING else source
+        return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big") % self.num_shards
+
+    def _group(self, items: Iterable[T], source: Callable[[T], str]) -> Dict[int, List[T]]:
+        groups: Dict[int, List[T]] = {}
+        for item in items:
+            groups.setdefault(self.shard_index(source(item)), []).append(item)
+        return groups
+
+    def _fan_out(self, call: Callable[[RAGVectorStore], T]) -> List[T]:
+        """
+        Call every shard at once. Shards being rebuilt are left out, as are the failures
+        of those whose rebuild started, dropping them, while they were being called.
+        """
+        futures = [
+            (index, self._executor.submit(call, shard)) for index, shard in enumerate(list(self.shards))
+            if index not in self._rebuilding
+        ]
+        results = []
+        for index, future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                if index not in self._rebuilding:
+                    raise
+                logger.warning(f"Shard {index} of {self.collection_name} is being rebuilt, left out: {e}")
+        return results
+
+    @property
+    def collection_version(self) -> int:
+        # Every shard's version only grows, so their sum changes whenever any shard does
+        return sum(shard.collection_version for shard in self.shards)
+
+    @property
+    def local_keyword_extractor(self) -> TfidfKeywordExtractor | None:
+        """The TF-IDF corpus statistics of all the shards, merged again after ingestion. None with LLM keywords."""
+        if self.store_options.get("keyword_extractor", LLM_KEYWORDS) != TFIDF_KEYWORDS:
+            return None
+        if self._merged_keyword_extractor is None:
+            self._merged_keyword_extractor = TfidfKeywordExtractor.merged(shard.local_keyword_extractor for shard in self.shards)
+        return self._merged_keyword_extractor
+
+    def embed_query(self, question: str) -> List[float]:
+        return self.shards[0].embed_query(question)
+
+    def extract_question_keywords(self, question: str) -> Set[str]:
+        """Keywords of a question, extracted the same way as the keywords of the stored chunks of every shard."""
+        if self.local_keyword_extractor:
+            return set(TfidfKeywordExtractor.question_keywords(question))
+        keywords: DocumentKeywords = get_keyword_extractor_chain().invoke({"document": question})
+        return set(keywords.keywords)
+
+    async def aextract_question_keywords(self, question: str) -> Set[str]:
+        if self.local_keyword_extractor:
+            return set(TfidfKeywordExtractor.question_keywords(question))
+        keywords: DocumentKeywords = await get_keyword_extractor_chain().ainvoke({"document": question})
+        return set(keywords.keywords)
+
+    def get_keywords_in_vector_store(self) -> Set[str]:
+        return set().union(*(shard.get_keywords_in_vector_store() for shard in self.shards))
+
+    def has_any_keyword(self, keywords: Set[str]) -> bool:
+        return any(shard.has_any_keyword(keywords) for shard in self.shards)
+
+    def keyword_overlap(self, keywords: Set[str]) -> float:
+        """Share of the given keywords present in any of the shards."""
+        keywords = set(utils.preprocess_keywords(keywords))
+        if not keywords:
+            return 0.0
+        return len(set().union(*(shard.present_keywords(keywords) for shard in self.shards))) / len(keywords)
+
+    def search_by_vector(
+        self, embedding: List[float], k: int = DEFAULT_RETRIEVAL_K, search_filter: Dict[str, Any] | None = None
+    ) -> List[Tuple[Document, float]]:
+        results = self._fan_out(lambda shard: shard.search_by_vector(embedding, k, search_filter))
+        return sorted((result for shard_results in results for result in shard_results), key=lambda result: -result[1])[:k]
+
+    def search_with_relevance_scores(self, question: str, k: int = DEFAULT_RETRIEVAL_K) -> List[Tuple[Document, float]]:
+        # Embedded once here rather than once by every shard
+        return self.search_by_vector(self.embed_query(question), k)
+
+    async def asearch_with_relevance_scores(self, question: str, k: int = DEFAULT_RETRIEVAL_K) -> List[Tuple[Document, float]]:
+        return await asyncio.to_thread(self.search_with_relevance_scores, question, k)
+
+    def get_documents(self, chunk_ids: List[str]) -> Dict[str, Document]:
+        if not chunk_ids:
+            return {}
+        documents: Dict[str, Document] = {}
+        for shard_documents in self._fan_out(lambda shard: shard.get_documents(chunk_ids)):
+            documents.update(shard_documents)
+        return documents
+
+    def hybrid_candidates(
+        self,
+        question: str,
+        fetch_k: int = DEFAULT_HYBRID_FETCH_K,
+        keyword_prefilter: bool = False,
+        embedding: List[float] | None = None
+    ) -> Tuple[List[Tuple[Document, float]], List[Tuple[str, float]]]:
+        """
+        The best candidates of every shard, merged by score. BM25 scores are computed with each shard's own
+        statistics, which shards filled the same way keep close to those of the whole collection.
+        """
+        embedding = embedding or self.embed_query(question)
+        candidates = self._fan_out(lambda shard: shard.hybrid_candidates(question, fetch_k, keyword_prefilter, embedding))
+        vector_results = sorted((result for results, _ in candidates for result in results), key=lambda result: -result[1])
+        lexical_results = sorted((result for _, results in candidates for result in results), key=lambda result: (-result[1], result[0]))
+        return vector_results[:fetch_k], lexical_results[:fetch_k]
+
+    def hybrid_search(
+        self,
+        question: str,
+        k: int = DEFAULT_RETRIEVAL_K,
+        fetch_k: int = DEFAULT_HYBRID_FETCH_K,
+        vector_weight: float = DEFAULT_VECTOR_WEIGHT,
+        lexical_weight: float = DEFAULT_LEXICAL_WEIGHT,
+        rrf_k: int = DEFAULT_RRF_K,
+        keyword_prefilter: bool = False
+    ) -> List[Tuple[Document, float]]:
+        vector_results, lexical_results = self.hybrid_candidates(question, fetch_k, keyword_prefilter)
+        return fuse_hybrid(
+            vector_results, lexical_results, self.get_documents,
+            k=k, vector_weight=vector_weight, lexical_weight=lexical_weight, rrf_k=rrf_k
+        )
+
+    def get_retriever(self, k: int = DEFAULT_RETRIEVAL_K) -> Runnable:
+        """A retriever searching every shard for the k best chunks overall, reused for the same k."""
+        if k not in self._retrievers:
+            def retrieve(question: str) -> List[Document]:
+                return [document for document, _ in self.search_with_relevance_scores(question, k)]
+
+            async def aretrieve(question: str) -> List[Document]:
+                return [document for document, _ in await self.asearch_with_relevance_scores(question, k)]
+
+            self._retrievers[k] = RunnableLambda(retrieve, afunc=aretrieve, name="sharded_retriever")
+        return self._retrievers[k]
+
+    def save_keyword_index(self):
+        for shard in self.shards:
+            shard.save_keyword_index()
+
+    def sources(self) -> Set[str]:
+        return set().union(*self._fan_out(lambda shard: shard.sources()))
+
+    def known_sources(self, sources: List[str]) -> Set[str]:
+        groups = self._group(sources, lambda source: source)
+        return set().union(*self._executor.map(lambda index: self.shards[index].known_sources(groups[index]), groups))
+
+    def _ingest(self, groups: Dict[int, List[T]], ingest: Callable[[RAGVectorStore, int, List[T]], IngestionReport]) -> IngestionReport:
+        report = IngestionReport()
+        if not groups:
+            return report
+        # Threads of their own, so that ingestion never holds up the searches of questions answered meanwhile
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="shard-ingest") as executor:
+            futures = [executor.submit(ingest, self.shards[index], index, items) for index, items in sorted(groups.items())]
+            try:
+                for future in futures:
+                    report.merge(future.result())
+            finally:
+                self._merged_keyword_extractor = None
+        return report
+
+    def add_documents_from_urls(self, urls: List[str], checkpoint_path: str | None = None) -> IngestionReport:
+        """Ingest every shard's share of the URLs, all shards at the same time."""
+        report = self._ingest(
+            self._group(urls, lambda url: url),
+            lambda shard, index, shard_urls: shard.add_documents_from_urls(
+                shard_urls, f"{checkpoint_path}.{index}" if checkpoint_path else None
+            )
+        )
+        logger.info(f"Documents added to {self.num_shards} shards: {report}")
+        return report
+
+    async def aadd_documents_from_urls(self, urls: List[str], checkpoint_path: str | None = None) -> IngestionReport:
+        return await asyncio.to_thread(self.add_documents_from_urls, urls, checkpoint_path)
+
+    def add_documents(self, documents: List[Document], bump_version: bool = True) -> IngestionReport:
+        return self._ingest(
+            self._group(documents, lambda document: document.metadata.get("source", "")),
+            lambda shard, index, shard_documents: shard.add_documents(shard_documents, bump_version)
+        )
+
+    def rebuild_shard(self, index: int) -> IngestionReport:
+        """
+        Drop one shard and ingest its pages again from their URLs, while the others keep serving.
+        Until it is rebuilt, questions are answered from the other shards only.
+        Pages written back from web search results are fetched whole this time.
+        """
+        urls = sorted(self.shards[index].sources())
+        logger.info(f"Rebuilding shard {index} of {self.collection_name} from {len(urls)} pages")
+        self._rebuilding.add(index)
+        try:
+            self.shards[index].drop()
+            self.shards[index].close()
+            self.shards[index] = self._open_shard(index)
+            return self.shards[index].add_documents_from_urls(urls)
+        finally:
+            self._rebuilding.discard(index)
+            self._merged_keyword_extractor = None
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        if self._chunking_pool is not None:
+            self._chunking_pool.close()
+        self._executor.shutdown(wait=False)
+
+
+def open_vector_store(
+    collection_name: str,
+    persist_directory: str,
+    num_shards: int | None = None,
+    shard_by: str | None = None,
+    **store_options
+) -> RAGVectorStore | ShardedRAGVectorStore:
+    """
+    Open a collection with the shard layout it was created with. num_shards and shard_by only need to be
+    given to create a sharded collection, a single collection is opened when neither is recorded nor given.
+    """
+    layout = read_shard_layout(persist_directory, collection_name)
+    if layout is None and (num_shards or 1) <= 1:
+        return RAGVectorStore(collection_name, persist_directory, **store_options)
+    layout = layout or {}
+    return ShardedRAGVectorStore(
+        collection_name,
+        persist_directory,
+        num_shards or layout["num_shards"],
+        shard_by or layout.get("shard_by", HASH_SHARDING),
+        **store_options
+    )
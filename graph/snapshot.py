@@ -0,0 +1,574 @@
+from bisect import bisect_left
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Set, Tuple
+import asyncio
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from langchain.schema import Document
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from utils import logger
+from graph.bm25 import lexical_tokens
+from graph.chains.keyword_extractor import get_keyword_extractor_chain, DocumentKeywords
+from graph.constants import (
+    DEFAULT_BM25_B,
+    DEFAULT_BM25_K1,
+    DEFAULT_HYBRID_FETCH_K,
+    DEFAULT_IVF_ITERATIONS,
+    DEFAULT_IVF_PROBES,
+    DEFAULT_LEXICAL_WEIGHT,
+    DEFAULT_PREFILTER_MAX_CANDIDATES,
+    DEFAULT_RETRIEVAL_K,
+    DEFAULT_RRF_K,
+    DEFAULT_VECTOR_WEIGHT,
+    LLM_KEYWORDS,
+    TFIDF_KEYWORDS
+)
+from graph.embeddings import get_embeddings
+from graph.keyword_index import KeywordIndex
+from graph.local_keywords import TfidfKeywordExtractor
+from graph.retrieval import RELEVANCE_FUNCTIONS, fuse_hybrid
+from graph import utils
+
+if TYPE_CHECKING:
+    from graph.ingest import RAGVectorStore
+    from graph.sharding import ShardedRAGVectorStore
+
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+KEYWORD_STATISTICS_FILE = "keyword_stats.json"
+# Rows of the embedding matrix handled at once while exporting, so memory stays bounded whatever the collection's size
+EXPORT_BATCH_SIZE = 65536
+STRING_TABLES = ("ids", "texts", "metadatas")
+
+
+def _save_array(directory: str, name: str, array: np.ndarray):
+    np.save(os.path.join(directory, f"{name}.npy"), array)
+
+
+def _load_array(directory: str, name: str) -> np.ndarray:
+    path = os.path.join(directory, f"{name}.npy")
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # Empty arrays can't be mapped
+        return np.load(path)
+
+
+class _StringTableWriter:
+    """Writes count strings back to back as they come, in the layout _StringTable maps."""
+
+    def __init__(self, directory: str, name: str, count: int):
+        self.directory = directory
+        self.name = name
+        self.offsets = np.zeros(count + 1, dtype=np.int64)
+        self.rows = 0
+        self.file = open(os.path.join(directory, f"{name}.bin"), "wb")
+
+    def append(self, string: str):
+        encoded = string.encode("utf-8")
+        self.file.write(encoded)
+        self.offsets[self.rows + 1] = self.offsets[self.rows] + len(encoded)
+        self.rows += 1
+
+    def close(self):
+        self.file.close()
+        _save_array(self.directory, f"{self.name}_offsets", self.offsets)
+
+
+def _save_strings(directory: str, name: str, strings: List[str]):
+    writer = _StringTableWriter(directory, name, len(strings))
+    for string in strings:
+        writer.append(string)
+    writer.close()
+
+
+class _PostingsWriter:
+    """
+    Term -> (row, frequency) postings, appended row by row to flat term id, row and frequency files
+    and grouped by term with NumPy on close: a sorted term table and row and frequency arrays sliced by term.
+    Only the vocabulary is kept in Python objects, never a posting.
+    """
+
+    COLUMNS = ("terms", "rows", "frequencies")
+
+    def __init__(self, directory: str, name: str, with_frequencies: bool = False):
+        self.directory = directory
+        self.name = name
+        self.with_frequencies = with_frequencies
+        self.vocabulary: Dict[str, int] = {}
+        self.buffers: Dict[str, List[int]] = {column: [] for column in self.COLUMNS}
+        self.files = {column: open(self._column_path(column), "wb") for column in self.COLUMNS}
+
+    def _column_path(self, column: str) -> str:
+        return os.path.join(self.directory, f"{self.name}_postings_{column}.tmp")
+
+    def add(self, row: int, frequencies: Dict[str, int]):
+        for term, frequency in frequencies.items():
+            self.buffers["terms"].append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+            self.buffers["rows"].append(row)
+            self.buffers["frequencies"].append(frequency)
+        if len(self.buffers["rows"]) >= EXPORT_BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        for column, values in self.buffers.items():
+            np.asarray(values, dtype=np.int32).tofile(self.files[column])
+            values.clear()
+
+    def _column(self, column: str) -> np.ndarray:
+        path = self._column_path(column)
+        return np.memmap(path, dtype=np.int32, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=np.int32)
+
+    def _save_ordered(self, column: str, order: np.ndarray):
+        values = self._column(column)
+        if not len(order):
+            _save_array(self.directory, f"{self.name}_{column}", values)
+            return
+        ordered = open_memmap(
+            os.path.join(self.directory, f"{self.name}_{column}.npy"), mode="w+", dtype=np.int32, shape=order.shape
+        )
+        for batch in _batches(len(order)):
+            ordered[batch] = values[order[batch]]
+        ordered.flush()
+
+    def close(self):
+        self._flush()
+        for file in self.files.values():
+            file.close()
+        terms = sorted(self.vocabulary)
+        ranks = np.empty(len(terms), dtype=np.int32)
+        ranks[[self.vocabulary[term] for term in terms]] = np.arange(len(terms), dtype=np.int32)
+        term_ranks = ranks[self._column("terms")]
+        # Rows were appended in increasing order, which the stable sort keeps within each term
+        order = np.argsort(term_ranks, kind="stable")
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_ranks, minlength=len(terms)))
+        _save_strings(self.directory, f"{self.name}_terms", terms)
+        _save_array(self.directory, f"{self.name}_offsets", offsets)
+        self._save_ordered("rows", order)
+        if self.with_frequencies:
+            self._save_ordered("frequencies", order)
+        for column in self.COLUMNS:
+            os.remove(self._column_path(column))
+
+
+class _StringTable:
+    """Strings stored back to back in a memory-mapped file, each decoded when accessed."""
+
+    def __init__(self, directory: str, name: str):
+        path = os.path.join(directory, f"{name}.bin")
+        self.offsets = _load_array(directory, f"{name}_offsets")
+        self.blob = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+    def find(self, value: str) -> int | None:
+        """Index of the value in a sorted table, by binary search."""
+        index = bisect_left(self, value)
+        return index if index < len(self) and self[index] == value else None
+
+
+class _Postings:
+    def __init__(self, directory: str, name: str, with_frequencies: bool = False):
+        self.terms = _StringTable(directory, f"{name}_terms")
+        self.offsets = _load_array(directory, f"{name}_offsets")
+        self.rows = _load_array(directory, f"{name}_rows")
+        self.frequencies = _load_array(directory, f"{name}_frequencies") if with_frequencies else None
+
+    def find(self, term: str) -> slice | None:
+        index = self.terms.find(term)
+        return None if index is None else slice(self.offsets[index], self.offsets[index + 1])
+
+
+def _batches(count: int) -> Iterator[slice]:
+    return (slice(start, min(start + EXPORT_BATCH_SIZE, count)) for start in range(0, count, EXPORT_BATCH_SIZE))
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    squared_norms = (centroids * centroids).sum(axis=1)
+    return np.concatenate([
+        np.argmin(squared_norms - 2 * vectors[batch] @ centroids.T, axis=1) for batch in _batches(len(vectors))
+    ])
+
+
+def _kmeans(vectors: np.ndarray, lists: int, iterations: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Centroids of the IVF lists, by Lloyd's iterations from a seeded sample, and the list of every vector."""
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[rng.choice(len(vectors), size=lists, replace=False)], dtype=np.float32)
+    for _ in range(iterations):
+        assignments = _nearest_centroids(vectors, centroids)
+        sums = np.zeros(centroids.shape, dtype=np.float64)
+        for batch in _batches(len(vectors)):
+            np.add.at(sums, assignments[batch], vectors[batch])
+        counts = np.bincount(assignments, minlength=lists)
+        # A list left empty keeps its centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids, _nearest_centroids(vectors, centroids)
+
+
+def _collection_pages(
+    store: "RAGVectorStore | ShardedRAGVectorStore", page_size: int
+) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any] | None], Any]]:
+    for shard in getattr(store, "shards", [store]):
+        offset = 0
+        while True:
+            records = shard.collection.get(
+                limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"]
+            )
+            ids = records.get("ids") or []
+            if not ids:
+                break
+            yield ids, records["documents"], records["metadatas"], records["embeddings"]
+            offset += len(ids)
+
+
+def _export_records(
+    store: "RAGVectorStore | ShardedRAGVectorStore", directory: str, count: int, page_size: int
+) -> np.ndarray:
+    """Stream the count chunks of the collection a page at a time into an embedding matrix and string tables."""
+    tables = {name: _StringTableWriter(directory, name, count) for name in STRING_TABLES}
+    embeddings = None
+    row = 0
+    try:
+        for ids, texts, metadatas, vectors in _collection_pages(store, page_size):
+            if row + len(ids) > count:
+                break
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if embeddings is None:
+                embeddings = open_memmap(
+                    os.path.join(directory, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(count, vectors.shape[1])
+                )
+            embeddings[row:row + len(ids)] = vectors
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                tables["ids"].append(chunk_id)
+                tables["texts"].append(text)
+                tables["metadatas"].append(json.dumps(metadata or {}))
+            row += len(ids)
+    finally:
+        for table in tables.values():
+            table.close()
+    if row != count:
+        raise ValueError(f"Collection {store.collection_name} changed while it was exported, export it again")
+    embeddings.flush()
+    return embeddings
+
+
+def _export_ordered(source: str, directory: str, embeddings: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """Copy the embedding matrix and string tables exported to source into directory, rows in the given order."""
+    ordered = open_memmap(os.path.join(directory, "embeddings.npy"), mode="w+", dtype=np.float32, shape=embeddings.shape)
+    for batch in _batches(len(order)):
+        ordered[batch] = embeddings[order[batch]]
+    ordered.flush()
+    for name in STRING_TABLES:
+        table = _StringTable(source, name)
+        writer = _StringTableWriter(directory, name, len(order))
+        for row in order:
+            writer.append(table[row])
+        writer.close()
+    return ordered
+
+
+def export_snapshot(
+    store: "RAGVectorStore | ShardedRAGVectorStore",
+    directory: str,
+    ivf_lists: int = 0,
+    ivf_iterations: int = DEFAULT_IVF_ITERATIONS,
+    page_size: int = 5000
+) -> Dict[str, Any]:
+    """
+    Write the collection, every shard of a sharded one, to directory in the format SnapshotVectorStore maps:
+    a float32 embedding matrix, the chunk texts and metadata behind offset tables, the keyword and BM25
+    postings as arrays, and the TF-IDF corpus statistics. With ivf_lists, the chunks are grouped into that
+    many k-means lists, stored contiguously. Chunks are streamed from Chroma a page at a time into files, and
+    postings are appended to flat integer files and grouped with NumPy instead of being held as Python objects.
+
+    The snapshot is written beside the directory and swapped in whole, so processes serving the previous one
+    keep reading it until they reopen. Returns the manifest.
+    """
+    shards = getattr(store, "shards", [store])
+    count = sum(shard.collection.count() for shard in shards)
+    if not count:
+        raise ValueError(f"Collection {store.collection_name} is empty, there is nothing to export")
+
+    tmp_directory = f"{directory}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    centroids = None
+    if ivf_lists:
+        unordered_directory = os.path.join(tmp_directory, "unordered")
+        os.makedirs(unordered_directory)
+        embeddings = _export_records(store, unordered_directory, count, page_size)
+        centroids, assignments = _kmeans(embeddings, min(ivf_lists, count), ivf_iterations)
+        embeddings = _export_ordered(
+            unordered_directory, tmp_directory, embeddings, np.argsort(assignments, kind="stable")
+        )
+        shutil.rmtree(unordered_directory)
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        list_offsets[1:] = np.cumsum(np.bincount(assignments, minlength=len(centroids)))
+    else:
+        embeddings = _export_records(store, tmp_directory, count, page_size)
+
+    norms = np.empty(count, dtype=np.float32)
+    for batch in _batches(count):
+        norms[batch] = np.linalg.norm(embeddings[batch], axis=1)
+
+    texts = _StringTable(tmp_directory, "texts")
+    metadatas = _StringTable(tmp_directory, "metadatas")
+    keyword_postings = _PostingsWriter(tmp_directory, "keywords")
+    bm25_postings = _PostingsWriter(tmp_directory, "bm25", with_frequencies=True)
+    bm25_lengths = np.zeros(count, dtype=np.int32)
+    for row in range(count):
+        keyword_postings.add(row, dict.fromkeys(KeywordIndex.keywords_from_metadata(json.loads(metadatas[row])), 1))
+        counts = Counter(lexical_tokens(texts[row]))
+        bm25_postings.add(row, counts)
+        bm25_lengths[row] = sum(counts.values())
+    keyword_postings.close()
+    bm25_postings.close()
+
+    keyword_extractor = store.local_keyword_extractor
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "collection_name": store.collection_name,
+        "collection_version": store.collection_version,
+        "chunks": count,
+        "dimensions": int(embeddings.shape[1]),
+        "metric": shards[0].distance_space,
+        "embedding_backend": shards[0].embedding_backend,
+        "keyword_extractor": TFIDF_KEYWORDS if keyword_extractor else LLM_KEYWORDS,
+        "ivf_lists": 0 if centroids is None else len(centroids),
+        "bm25": {"k1": DEFAULT_BM25_K1, "b": DEFAULT_BM25_B, "average_length": float(bm25_lengths.mean())},
+    }
+
+    _save_array(tmp_directory, "norms", norms)
+    _save_array(tmp_directory, "bm25_lengths", bm25_lengths)
+    if keyword_extractor:
+        keyword_extractor.save(os.path.join(tmp_directory, KEYWORD_STATISTICS_FILE))
+    if centroids is not None:
+        _save_array(tmp_directory, "ivf_centroids", centroids)
+        _save_array(tmp_directory, "ivf_offsets", list_offsets)
+    with open(os.path.join(tmp_directory, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+    previous_directory = f"{directory}.old"
+    if os.path.exists(directory):
+        shutil.rmtree(previous_directory, ignore_errors=True)
+        os.replace(directory, previous_directory)
+    os.replace(tmp_directory, directory)
+    shutil.rmtree(previous_directory, ignore_errors=True)
+    logger.info(f"Exported {count} chunks of {store.collection_name} to {directory}")
+    return manifest
+
+
+class SnapshotVectorStore:
+    """
+    Read-only collection answering questions from a snapshot written by export_snapshot, without Chroma.
+    Every array is memory-mapped: opening a snapshot only reads its manifest, pages are read as searches
+    touch them, and the processes serving one snapshot share them through the page cache.
+
+    Top-k is an exact vectorized scan of the embedding matrix, or of the nprobe IVF lists nearest to the question
+    when the snapshot was partitioned. It answers questions wherever a RAGVectorStore does, but can't ingest.
+    """
+
+    read_only = True
+
+    def __init__(self, directory: str, nprobe: int = DEFAULT_IVF_PROBES):
+        with open(os.path.join(directory, MANIFEST_FILE), "r") as file:
+            self.manifest: Dict[str, Any] = json.load(file)
+        if self.manifest["format_version"] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Snapshot {directory} has format {self.manifest['format_version']}, not {SNAPSHOT_FORMAT_VERSION}")
+        self.directory = directory
+        self.nprobe = nprobe
+        self.collection_name: str = self.manifest["collection_name"]
+        self.collection_version: int = self.manifest["collection_version"]
+        self.metric: str = self.manifest["metric"]
+        self._relevance = RELEVANCE_FUNCTIONS[self.metric]
+        self.embeddings = get_embeddings(self.manifest["embedding_backend"])
+        self.local_keyword_extractor = (
+            TfidfKeywordExtractor.load(os.path.join(directory, KEYWORD_STATISTICS_FILE))
+            if self.manifest["keyword_extractor"] == TFIDF_KEYWORDS else None
+        )
+        self.vectors = _load_array(directory, "embeddings")
+        self.norms = _load_array(directory, "norms")
+        self.ids = _StringTable(directory, "ids")
+        self.texts = _StringTable(directory, "texts")
+        self.metadatas = _StringTable(directory, "metadatas")
+        self.keywords = _Postings(directory, "keywords")
+        self.bm25 = _Postings(directory, "bm25", with_frequencies=True)
+        self.bm25_lengths = _load_array(directory, "bm25_lengths")
+        self.centroids = _load_array(directory, "ivf_centroids") if self.manifest["ivf_lists"] else None
+        self.list_offsets = _load_array(directory, "ivf_offsets") if self.manifest["ivf_lists"] else None
+        self._rows_by_id: Dict[str, int] | None = None
+        self._retrievers: Dict[int, Runnable] = {}
+
+    def embed_query(self, question: str) -> List[float]:
+        return self.embeddings.embed_query(question)
+
+    def extract_question_keywords(self, question: str) -> Set[str]:
+        if self.local_keyword_extractor:
+            return set(self.local_keyword_extractor.question_keywords(question))
+        keywords: DocumentKeywords = get_keyword_extractor_chain().invoke({"document": question})
+        return set(keywords.keywords)
+
+    async def aextract_question_keywords(self, question: str) -> Set[str]:
+        if self.local_keyword_extractor:
+            return set(self.local_keyword_extractor.question_keywords(question))
+        keywords: DocumentKeywords = await get_keyword_extractor_chain().ainvoke({"document": question})
+        return set(keywords.keywords)
+
+    def get_keywords_in_vector_store(self) -> Set[str]:
+        return {self.keywords.terms[index] for index in range(len(self.keywords.terms))}
+
+    def has_any_keyword(self, keywords: Set[str]) -> bool:
+        return any(self.keywords.terms.find(keyword) is not None for keyword in utils.preprocess_keywords(keywords))
+
+    def keyword_overlap(self, keywords: Set[str]) -> float:
+        keywords = set(utils.preprocess_keywords(keywords))
+        if not keywords:
+            return 0.0
+        return sum(self.keywords.terms.find(keyword) is not None for keyword in keywords) / len(keywords)
+
+    def document(self, row: int) -> Document:
+        return Document(id=self.ids[row], page_content=self.texts[row], metadata=json.loads(self.metadatas[row]))
+
+    def get_documents(self, chunk_ids: List[str]) -> Dict[str, Document]:
+        """Chunks by id, ids missing from the snapshot are left out. The id lookup is built on first use."""
+        if self._rows_by_id is None:
+            self._rows_by_id = {self.ids[row]: row for row in range(len(self.ids))}
+        return {chunk_id: self.document(self._rows_by_id[chunk_id]) for chunk_id in chunk_ids if chunk_id in self._rows_by_id}
+
+    def _probe(self, query: np.ndarray) -> np.ndarray | None:
+        """Rows of the nprobe lists whose centroids are nearest to the question, all rows without IVF lists."""
+        if self.centroids is None:
+            return None
+        nearest = np.argsort(((self.centroids - query) ** 2).sum(axis=1))[:self.nprobe]
+        return np.concatenate([np.arange(self.list_offsets[index], self.list_offsets[index + 1]) for index in sorted(nearest)])
+
+    def _distances(self, query: np.ndarray, rows: np.ndarray | None) -> np.ndarray:
+        """Chroma's distances of the metric, l2 being squared, between the question and the rows."""
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        norms = self.norms if rows is None else self.norms[rows]
+        products = vectors @ query
+        if self.metric == "l2":
+            return norms * norms + float(query @ query) - 2 * products
+        if self.metric == "cosine":
+            return 1 - products / np.maximum(norms * np.linalg.norm(query), np.finfo(np.float32).tiny)
+        return 1 - products
+
+    def search_by_vector(
+        self, embedding: List[float], k: int = DEFAULT_RETRIEVAL_K, candidates: np.ndarray | None = None
+    ) -> List[Tuple[Document, float]]:
+        """The k chunks nearest to an embedded question with their relevance, only among the candidate rows when given."""
+        query = np.asarray(embedding, dtype=np.float32)
+        rows = candidates if candidates is not None else self._probe(query)
+        distances = self._distances(query, rows)
+        k = min(k, len(distances))
+        if k <= 0:
+            return []
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        return [
+            (self.document(int(index if rows is None else rows[index])), self._relevance(float(distances[index])))
+            for index in top
+        ]
+
+    def search_with_relevance_scores(self, question: str, k: int = DEFAULT_RETRIEVAL_K) -> List[Tuple[Document, float]]:
+        return self.search_by_vector(self.embed_query(question), k)
+
+    async def asearch_with_relevance_scores(self, question: str, k: int = DEFAULT_RETRIEVAL_K) -> List[Tuple[Document, float]]:
+        return await asyncio.to_thread(self.search_with_relevance_scores, question, k)
+
+    def _prefilter(self, question: str) -> np.ndarray | None:
+        """Rows tagged with one of the question's candidate keywords, None when filtering wouldn't help."""
+        spans = [
+            self.keywords.find(keyword)
+            for keyword in utils.preprocess_keywords(TfidfKeywordExtractor.question_keywords(question))
+        ]
+        rows = [self.keywords.rows[span] for span in spans if span is not None]
+        if not rows:
+            return None
+        candidates = np.unique(np.concatenate(rows))
+        if not len(candidates) or len(candidates) > DEFAULT_PREFILTER_MAX_CANDIDATES:
+            return None
+        return candidates
+
+    def bm25_search(self, question: str, k: int, candidates: np.ndarray | None = None) -> List[Tuple[int, float]]:
+        """The k best (row, BM25 score) pairs, scored like BM25Index and only among the candidate rows when given."""
+        chunks = len(self.bm25_lengths)
+        parameters = self.manifest["bm25"]
+        k1, b, average_length = parameters["k1"], parameters["b"], parameters["average_length"] or 1
+        allowed = None
+        if candidates is not None:
+            allowed = np.zeros(chunks, dtype=bool)
+            allowed[candidates] = True
+        matched_rows, matched_scores = [], []
+        for term in set(lexical_tokens(question)):
+            span = self.bm25.find(term)
+            if span is None:
+                continue
+            rows = self.bm25.rows[span]
+            frequencies = self.bm25.frequencies[span].astype(np.float64)
+            idf = math.log(1 + (chunks - len(rows) + 0.5) / (len(rows) + 0.5))
+            if allowed is not None:
+                keep = allowed[rows]
+                rows, frequencies = rows[keep], frequencies[keep]
+            norm = k1 * (1 - b + b * self.bm25_lengths[rows] / average_length)
+            matched_rows.append(rows)
+            matched_scores.append(idf * frequencies * (k1 + 1) / (frequencies + norm))
+        if not matched_rows:
+            return []
+        rows, positions = np.unique(np.concatenate(matched_rows), return_inverse=True)
+        scores = np.bincount(positions, weights=np.concatenate(matched_scores))
+        if len(scores) > k:
+            keep = scores >= np.partition(scores, len(scores) - k)[len(scores) - k]
+            rows, scores = rows[keep], scores[keep]
+        # Ties broken by chunk id, as BM25Index does
+        ranked = sorted(((float(score), self.ids[int(row)], int(row)) for row, score in zip(rows, scores)), key=lambda item: (-item[0], item[1]))
+        return [(row, score) for score, _, row in ranked[:k]]
+
+    def hybrid_search(
+        self,
+        question: str,
+        k: int = DEFAULT_RETRIEVAL_K,
+        fetch_k: int = DEFAULT_HYBRID_FETCH_K,
+        vector_weight: float = DEFAULT_VECTOR_WEIGHT,
+        lexical_weight: float = DEFAULT_LEXICAL_WEIGHT,
+        rrf_k: int = DEFAULT_RRF_K,
+        keyword_prefilter: bool = False
+    ) -> List[Tuple[Document, float]]:
+        """Same fusion of vector and BM25 search as RAGVectorStore.hybrid_search."""
+        candidates = self._prefilter(question) if keyword_prefilter else None
+        vector_results = self.search_by_vector(self.embed_query(question), fetch_k, candidates)
+        lexical_rows = {self.ids[row]: (row, score) for row, score in self.bm25_search(question, fetch_k, candidates)}
+        return fuse_hybrid(
+            vector_results,
+            [(chunk_id, score) for chunk_id, (_, score) in lexical_rows.items()],
+            lambda chunk_ids: {chunk_id: self.document(lexical_rows[chunk_id][0]) for chunk_id in chunk_ids if chunk_id in lexical_rows},
+            k=k, vector_weight=vector_weight, lexical_weight=lexical_weight, rrf_k=rrf_k
+        )
+
+    def get_retriever(self, k: int = DEFAULT_RETRIEVAL_K) -> Runnable:
+        """A retriever of the k nearest chunks, reused for the same k."""
+        if k not in self._retrievers:
+            def retrieve(question: str) -> List[Document]:
+                return [document for document, _ in self.search_with_relevance_scores(question, k)]
+
+            async def aretrieve(question: str) -> List[Document]:
+                return [document for document, _ in await self.asearch_with_relevance_scores(question, k)]
+
+            self._retrievers[k] = RunnableLambda(retrieve, afunc=aretrieve, name="snapshot_retriever")
+        return self._retrievers[k]
+
+    def close(self):
+        pass
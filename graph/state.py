@@ -1,6 +1,12 @@
-from typing import List, TypedDict
+from typing import Any, List, TypedDict
 
+from langchain.schema import Document
+
+from graph.budget import QueryBudget
+from graph.config import RAGConfig
 from graph.ingest import RAGVectorStore
+from graph.sharding import ShardedRAGVectorStore
+from graph.snapshot import SnapshotVectorStore
 
 
 class GraphState(TypedDict):
@@ -12,10 +18,25 @@ class GraphState(TypedDict):
         answer(str): answer generated by the LLM
         web_search(bool): whether to add search
         documents(List[str]): list of documents to be used for answer generation
+        context(List[Document]): the documents compressed for the question, what generation and grounding see
+        retriever(RAGVectorStore | ShardedRAGVectorStore | SnapshotVectorStore): vector store to retrieve documents from
+        config(RAGConfig): settings for this run, defaults are used when missing
+        route_decision(str): node chosen by the router, either retrieve or websearch
+        prefetched_documents(List[Document]): documents fetched while routing, reused by retrieve
+        retrieval_relevance(float): relevance of the best retrieved document, when it was scored
+        speculative_search(Any): background web search started by retrieve, a Future or an asyncio Task
+        budget(QueryBudget): limits and usage of this question, created by the route node when missing
     """
 
     question: str
     answer: str
     web_search: bool
     documents: List[str]
-    retriever: RAGVectorStore
\ No newline at end of file
+    context: List[Document]
+    retriever: RAGVectorStore | ShardedRAGVectorStore | SnapshotVectorStore
+    config: RAGConfig
+    route_decision: str
+    prefetched_documents: List[Document]
+    retrieval_relevance: float
+    speculative_search: Any
+    budget: QueryBudget
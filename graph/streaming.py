@@ -0,0 +1,53 @@
+from typing import Any, Callable, Dict
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.callbacks.manager import adispatch_custom_event, dispatch_custom_event
+from langchain_core.runnables import RunnableConfig
+
+from graph.constants import ANSWER_TOKEN_EVENT, GENERATION_STARTED_EVENT
+
+
+def emit(name: str, data: Dict[str, Any], config: RunnableConfig | None):
+    """Send a custom event to the callbacks of a graph run, nodes called directly have no run to report to."""
+    if config is not None:
+        dispatch_custom_event(name, data, config=config)
+
+
+async def aemit(name: str, data: Dict[str, Any], config: RunnableConfig | None):
+    if config is not None:
+        await adispatch_custom_event(name, data, config=config)
+
+
+class AnswerStreamHandler(BaseCallbackHandler):
+    """
+    Forwards the answer tokens streamed by the generate node to on_token, and every other
+    event of the run, such as the verification outcome, to on_event. Records when the first token arrived.
+    """
+
+    run_inline = True
+
+    def __init__(
+        self,
+        on_token: Callable[[str], None],
+        on_event: Callable[[str, Dict[str, Any]], None] | None = None
+    ):
+        self.on_token = on_token
+        self.on_event = on_event
+        self.first_token_at: float | None = None
+        self.generations = 0
+
+    def token(self, token: str):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.on_token(token)
+
+    def on_custom_event(self, name: str, data: Any, **kwargs: Any):
+        if name == ANSWER_TOKEN_EVENT:
+            self.token(data["token"])
+            return
+        if name == GENERATION_STARTED_EVENT:
+            self.generations += 1
+            data = {**data, "attempt": self.generations}
+        if self.on_event:
+            self.on_event(name, data)
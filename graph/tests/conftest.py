@@ -0,0 +1,139 @@
+import sys
+from typing import Any, Callable, Iterable, List
+
+import pytest
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.runnables import Runnable, RunnableLambda
+
+import graph.graph as graph_module
+from graph.chains.answer_grader import GradeAnswer
+from graph.chains.hallucination_grader import GradeHallucination
+from graph.chains.retrieval_grader import GradeDocuments
+from graph.config import RAGConfig
+from graph.constants import HASHING_EMBEDDINGS, TFIDF_KEYWORDS
+from graph.fetch import FetchResult
+from graph.ingest import RAGVectorStore
+from graph.sharding import ShardedRAGVectorStore
+from service import QueryService
+
+
+PAGES = {
+    "https://a.invalid/attacks": "Adversarial attacks on language models. Jailbreak prompts bypass safety filters.",
+    "https://b.invalid/prompting": "Prompt engineering with few-shot examples and chain of thought.",
+    "https://c.invalid/errors": "The client failed with ERR_CONN_RESET when the proxy dropped the connection.",
+    "https://d.invalid/agents": "Agents plan with memory and tools, reflecting on past actions.",
+    "https://e.invalid/retrieval": "Retrieval augmented generation looks chunks up in a vector store.",
+    "https://f.invalid/training": "Reward models are trained on human preference data for alignment.",
+}
+STORE_OPTIONS = {
+    "embedding_backend": HASHING_EMBEDDINGS,
+    "embedding_cache": False,
+    "text_splitter": RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=0),
+    "keyword_extractor": TFIDF_KEYWORDS
+}
+
+
+class PagesVectorStore(RAGVectorStore):
+    """Collection reading its URLs from PAGES instead of fetching them."""
+
+    def fetch_urls(self, urls):
+        return [FetchResult(url=url, documents=[Document(page_content=PAGES[url], metadata={"source": url})]) for url in urls]
+
+
+class PagesShardedStore(ShardedRAGVectorStore):
+    def _open_shard(self, index):
+        shard = super()._open_shard(index)
+        shard.__class__ = PagesVectorStore
+        return shard
+
+
+class StubStore:
+    """
+    Collection answering every question with the same documents, for graph and service tests.
+    Routing finds the question's keywords in it, unless it is given the keywords it holds.
+    """
+
+    collection_name = "coll"
+    collection_version = 0
+    local_keyword_extractor = None
+
+    def __init__(self, texts: Iterable[str] = ("agents plan",), scores: List[float] | None = None, keywords: Iterable[str] | None = None):
+        self.texts = list(texts)
+        self.scores = scores
+        self.keywords = None if keywords is None else set(keywords)
+
+    def documents(self) -> List[Document]:
+        return [Document(page_content=text) for text in self.texts]
+
+    def extract_question_keywords(self, question):
+        return {"agents"}
+
+    async def aextract_question_keywords(self, question):
+        return {"agents"}
+
+    def has_any_keyword(self, keywords):
+        return self.keywords is None or bool(set(keywords) & self.keywords)
+
+    def keyword_overlap(self, keywords):
+        keywords = set(keywords)
+        if self.keywords is None or not keywords:
+            return float(self.keywords is None)
+        return len(keywords & self.keywords) / len(keywords)
+
+    def search_with_relevance_scores(self, question, k):
+        return list(zip(self.documents(), self.scores or [1.0] * len(self.texts)))[:k]
+
+    def get_retriever(self, k):
+        return RunnableLambda(lambda question: self.documents())
+
+
+class StubChains:
+    """
+    The LLM chains of the graph replaced by local stubs. By default every document is relevant,
+    generation joins the context and every answer is grounded and useful.
+    """
+
+    def __init__(self, monkeypatch: pytest.MonkeyPatch):
+        self.monkeypatch = monkeypatch
+        self.set(
+            generation=lambda inputs: " | ".join(document.page_content for document in inputs["context"]),
+            retrieval_grader=lambda inputs: GradeDocuments(binary_score="yes"),
+            hallucination_grader=lambda inputs: GradeHallucination(binary_score=True),
+            answer_grader=lambda inputs: GradeAnswer(binary_score=True)
+        )
+
+    def set(self, **chains: Runnable | Callable[[Any], Any]):
+        """Replace chains by name with runnables, or with functions of their inputs."""
+        self.set_getters(**{
+            name: (lambda chain=chain: chain if isinstance(chain, Runnable) else RunnableLambda(chain))
+            for name, chain in chains.items()
+        })
+
+    def set_getters(self, **getters: Callable[[], Runnable]):
+        """Replace the getters of chains by name, called every time a node needs the chain."""
+        targets = {
+            "generation": (sys.modules["graph.nodes.generate"], "get_generation_chain"),
+            "retrieval_grader": (sys.modules["graph.nodes.grade_documents"], "get_retrieval_grader"),
+            "hallucination_grader": (graph_module, "get_hallucination_grader_chain"),
+            "answer_grader": (graph_module, "get_answer_grader_chain"),
+        }
+        for name, getter in getters.items():
+            self.monkeypatch.setattr(*targets[name], getter)
+
+
+@pytest.fixture
+def stub_chains(monkeypatch) -> StubChains:
+    return StubChains(monkeypatch)
+
+
+@pytest.fixture
+def make_service(monkeypatch, tmp_path) -> Callable[..., QueryService]:
+    """Build QueryService instances answering from a StubStore, or from the store given."""
+
+    def make(config: RAGConfig | None = None, store: Any = None, **service_options) -> QueryService:
+        service = QueryService(str(tmp_path), "coll", config, **service_options)
+        monkeypatch.setattr(service, "get_vector_store", lambda collection_name=None: store or StubStore())
+        return service
+
+    return make
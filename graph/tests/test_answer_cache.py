@@ -0,0 +1,81 @@
+import os
+
+from graph.answer_cache import EXACT_HIT, MISS, SEMANTIC_HIT, AnswerCache, normalize_question
+
+
+def test_normalize_question() -> None:
+    assert normalize_question("  What is   Prompt Engineering?? ") == "what is prompt engineering"
+
+
+def test_exact_hit_does_not_embed() -> None:
+    cache = AnswerCache()
+    cache.put("rag-chroma", 0, "What is prompt engineering?", "An answer")
+
+    def embed(question):
+        raise AssertionError("exact hits should not embed the question")
+
+    lookup = cache.lookup("rag-chroma", 0, "what is prompt engineering", embed)
+    assert lookup.kind == EXACT_HIT
+    assert lookup.answer == "An answer"
+
+
+def test_semantic_hit_above_threshold() -> None:
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put("rag-chroma", 0, "What is prompt engineering?", "An answer", embedding=[1.0, 0.0])
+
+    close = cache.lookup("rag-chroma", 0, "Explain prompt engineering", lambda question: [0.99, 0.05])
+    far = cache.lookup("rag-chroma", 0, "How to make pizza", lambda question: [0.0, 1.0])
+
+    assert close.kind == SEMANTIC_HIT and close.answer == "An answer"
+    assert far.kind == MISS and far.embedding == [0.0, 1.0]
+
+
+def test_new_collection_version_invalidates_answers() -> None:
+    cache = AnswerCache()
+    cache.put("rag-chroma", 0, "What is prompt engineering?", "An answer", embedding=[1.0, 0.0])
+
+    lookup = cache.lookup("rag-chroma", 1, "What is prompt engineering?", lambda question: [1.0, 0.0])
+    assert lookup.kind == MISS
+
+
+def test_lru_eviction_and_ttl() -> None:
+    cache = AnswerCache(max_entries=2)
+    cache.put("rag-chroma", 0, "first", "1")
+    cache.put("rag-chroma", 0, "second", "2")
+    cache.lookup("rag-chroma", 0, "first")
+    cache.put("rag-chroma", 0, "third", "3")
+
+    assert cache.lookup("rag-chroma", 0, "second").kind == MISS
+    assert cache.lookup("rag-chroma", 0, "first").answer == "1"
+
+    expired = AnswerCache(ttl_seconds=-1)
+    expired.put("rag-chroma", 0, "first", "1")
+    assert expired.lookup("rag-chroma", 0, "first").kind == MISS
+
+
+def test_disk_backend_survives_restart(tmp_path) -> None:
+    path = os.path.join(tmp_path, "answers.sqlite")
+    cache = AnswerCache(path=path)
+    cache.put("rag-chroma", 3, "What is prompt engineering?", "An answer", embedding=[1.0, 0.0])
+    cache.close()
+
+    reopened = AnswerCache(path=path)
+    lookup = reopened.lookup("rag-chroma", 3, "Explain prompt engineering", lambda question: [1.0, 0.0])
+    assert lookup.kind == SEMANTIC_HIT
+    assert lookup.answer == "An answer"
+
+
+def test_semantic_index_follows_puts_and_evictions() -> None:
+    cache = AnswerCache(max_entries=3, similarity_threshold=0.9)
+    for index in range(5):
+        cache.put("rag-chroma", 0, f"question {index}", f"answer {index}", embedding=[1.0, float(index)])
+    cache.put("rag-chroma", 0, "question 4", "answer 4", embedding=[0.0, 1.0])
+
+    assert cache.lookup("rag-chroma", 0, "q", lambda question: [1.0, 0.0]).kind == MISS
+    assert cache.lookup("rag-chroma", 0, "q", lambda question: [1.0, 3.0]).answer == "answer 3"
+    assert cache.lookup("rag-chroma", 0, "q", lambda question: [0.0, 1.0]).answer == "answer 4"
+    # Embeddings of another size, e.g. after switching embedding backends, never match
+    assert cache.lookup("rag-chroma", 0, "q", lambda question: [1.0, 3.0, 0.0]).kind == MISS
+
+    lookup = cache.lookup("rag-chroma", 1, "question 3", lambda question: [1.0, 3.0])
+    assert lookup.kind == MISS and lookup.version == 1
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import uuid
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from graph.bm25 import BM25Index, lexical_tokens
+from graph.constants import HASHING_EMBEDDINGS, TFIDF_KEYWORDS
+from graph.embeddings import HashingEmbeddings
+from graph.fetch import FetchResult
+from graph.ingest import RAGVectorStore
+from graph.retrieval import reciprocal_rank_fusion
+
+
+PAGES = {
+    "https://docs.invalid/attacks": "Adversarial attacks on language models. Jailbreak prompts bypass safety filters.",
+    "https://docs.invalid/prompting": "Prompt engineering with few-shot examples and chain of thought.",
+    "https://docs.invalid/errors": "The client failed with ERR_CONN_RESET when the proxy dropped the connection.",
+    "https://docs.invalid/agents": "Agents plan with memory and tools, reflecting on past actions.",
+}
+
+
+class PagesVectorStore(RAGVectorStore):
+    def fetch_urls(self, urls):
+        return [FetchResult(url=url, documents=[Document(page_content=PAGES[url], metadata={"source": url})]) for url in urls]
+
+
+def test_lexical_tokens_keep_compound_terms_whole() -> None:
+    assert lexical_tokens("Is gpt-4o faster than v1.2?") == ["gpt-4o", "gpt", "4o", "faster", "v1.2", "v1", "2"]
+
+
+def test_exact_terms_rank_first_and_removed_chunks_disappear(tmp_path) -> None:
+    index = BM25Index(os.path.join(tmp_path, "bm25.json"))
+    index.add([
+        ("errors", "the request failed with err_conn_reset"),
+        ("retries", "the request failed and was retried"),
+        ("agents", "agents plan with memory"),
+    ])
+
+    assert [chunk_id for chunk_id, _ in index.search("what is err_conn_reset", k=3)] == ["errors"]
+    assert [chunk_id for chunk_id, _ in index.search("request failed", k=3)] == ["errors", "retries"]
+    assert index.search("request failed", k=3, candidates={"retries"})[0][0] == "retries"
+
+    index.remove(["errors"])
+    index.add([("agents", "agents use tools")])
+    index.save()
+    reloaded = BM25Index.load(index.path)
+    assert reloaded.search("err_conn_reset", k=3) == []
+    assert reloaded.search("memory", k=3) == []
+    assert [chunk_id for chunk_id, _ in reloaded.search("tools", k=3)] == ["agents"]
+
+
+def test_concurrent_saves_never_race_on_the_temporary_file(tmp_path) -> None:
+    index = BM25Index(os.path.join(tmp_path, "bm25.json"))
+    index.add([("agents", "agents plan with memory")])
+    errors = []
+
+    def save():
+        for _ in range(30):
+            try:
+                index.save()
+            except OSError as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=save) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert BM25Index.load(index.path).lengths == {"agents": 3}
+
+
+def test_reciprocal_rank_fusion_weights_rankings() -> None:
+    rankings = [["a", "b"], ["b", "c"]]
+
+    assert [item for item, _ in reciprocal_rank_fusion(rankings)] == ["b", "a", "c"]
+    assert [item for item, _ in reciprocal_rank_fusion(rankings, weights=[1.0, 3.0])] == ["b", "c", "a"]
+
+
+def test_hybrid_search_finds_exact_terms(tmp_path) -> None:
+    store = PagesVectorStore(
+        "coll", str(tmp_path),
+        embedding_backend=HASHING_EMBEDDINGS,
+        embedding_cache=False,
+        text_splitter=RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=0),
+        keyword_extractor=TFIDF_KEYWORDS
+    )
+    store.add_documents_from_urls(list(PAGES))
+
+    results = store.hybrid_search("what does err_conn_reset mean", k=2)
+    assert results[0][0].metadata["source"] == "https://docs.invalid/errors"
+    prefiltered = store.hybrid_search("jailbreak prompts", k=2, keyword_prefilter=True)
+    assert [document.metadata["source"] for document, _ in prefiltered] == ["https://docs.invalid/attacks"]
+
+    # Collections ingested before the BM25 index existed get it rebuilt on first use
+    os.remove(store.bm25_path)
+    reopened = PagesVectorStore("coll", str(tmp_path), embedding_backend=HASHING_EMBEDDINGS, keyword_extractor=TFIDF_KEYWORDS)
+    assert len(reopened.bm25_index) == len(PAGES)
+
+
+def test_hybrid_search_on_collections_without_chunk_ids(tmp_path) -> None:
+    import chromadb
+
+    # Collections ingested before chunk ids were assigned have uuid ids and no chunk_id metadata
+    texts = ["pizza dough recipe", "agents reflect on actions", "agents plan with memory"]
+    chromadb.PersistentClient(path=str(tmp_path)).create_collection("legacy").add(
+        ids=[str(uuid.uuid4()) for _ in texts],
+        embeddings=HashingEmbeddings().embed_documents(texts),
+        documents=texts,
+        metadatas=[{"source": "https://docs.invalid/", "keywords": json.dumps(text.split()[:1])} for text in texts]
+    )
+    store = RAGVectorStore("legacy", str(tmp_path), embedding_backend=HASHING_EMBEDDINGS, embedding_cache=False)
+
+    results = [document.page_content for document, _ in store.hybrid_search("agents", k=3)]
+    assert sorted(results[:2]) == sorted(texts[1:]) and results[2] == texts[0]
+    prefiltered = store.hybrid_search("agents", k=3, keyword_prefilter=True)
+    assert sorted(document.page_content for document, _ in prefiltered) == sorted(texts[1:])
+    stored = store.collection.get(include=["metadatas"])
+    assert [metadata["chunk_id"] for metadata in stored["metadatas"]] == stored["ids"]
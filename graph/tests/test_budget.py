@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableLambda
+
+from graph.budget import QueryBudget
+from graph.chains.hallucination_grader import GradeHallucination
+from graph.chains.retrieval_grader import GradeDocuments
+from graph.config import RAGConfig
+from graph.constants import PER_DOCUMENT_GRADING
+
+
+@pytest.fixture
+def calls(stub_chains):
+    """Graph whose answers are never grounded, so without a budget it would regenerate forever."""
+    calls = {"generate": 0, "grade": 0}
+
+    def generation_chain():
+        calls["generate"] += 1
+        model = GenericFakeChatModel(messages=iter([AIMessage(f"answer {calls['generate']}")]))
+        return RunnableLambda(lambda x: x["question"]) | model | StrOutputParser()
+
+    def grade(inputs):
+        calls["grade"] += 1
+        return GradeDocuments(binary_score="yes")
+
+    stub_chains.set_getters(generation=generation_chain)
+    stub_chains.set(retrieval_grader=grade, hallucination_grader=lambda x: GradeHallucination(binary_score=False))
+    return calls
+
+
+@pytest.fixture
+def service_with(make_service):
+    return lambda **limits: make_service(RAGConfig(grading_mode=PER_DOCUMENT_GRADING, **limits))
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_regenerations_are_bounded(service_with, calls, asynchronous) -> None:
+    service = service_with(max_regenerations=2)
+    if asynchronous:
+        response = asyncio.run(service.aanswer("How do agents plan?"))
+    else:
+        response = service.answer("How do agents plan?")
+
+    assert response["answer"] == "answer 3"
+    assert response["budget_exhausted"] is True
+    assert response["usage"]["exhausted"] == "regenerations"
+    assert response["usage"]["regenerations"] == 2
+    # Only the generations are LLM calls, the graders are stubs
+    assert response["usage"]["llm_calls"] == 3
+
+
+def test_llm_call_budget_stops_verification(service_with, calls) -> None:
+    service = service_with(max_llm_calls=1)
+    response = service.answer("How do agents plan?")
+
+    assert response["answer"] == "answer 1"
+    assert response["usage"]["exhausted"] == "llm_calls"
+    assert calls["generate"] == 1
+
+
+def test_deadline_returns_an_answer_without_grading(service_with, calls) -> None:
+    service = service_with()
+    response = service.answer("How do agents plan?", budget={"deadline_seconds": 0})
+
+    assert response["answer"] == "answer 1"
+    assert response["usage"]["exhausted"] == "deadline"
+    assert calls["grade"] == 0
+
+
+def test_unknown_budget_override_is_an_error(service_with, calls) -> None:
+    service = service_with()
+    response = service.answer("How do agents plan?", budget={"max_dollars": 1})
+
+    assert "Unknown budget limit" in response["error"]
+
+
+def test_budget_counts_reported_tokens() -> None:
+    budget = QueryBudget(max_tokens=100)
+    budget.on_llm_end(LLMResult(generations=[], llm_output={"token_usage": {"total_tokens": 60}}))
+    assert budget.allows()
+    budget.on_llm_end(LLMResult(generations=[], llm_output={"token_usage": {"total_tokens": 60}}))
+
+    assert not budget.allows()
+    assert budget.usage()["tokens"] == 120 and budget.exhausted == "tokens"
+
+
+@pytest.mark.parametrize("budget, error", [
+    ({"max_llm_calls": "two"}, "max_llm_calls must be an integer"),
+    ({"max_regenerations": 1.5}, "max_regenerations must be an integer"),
+    ({"deadline_seconds": -1}, "deadline_seconds can't be negative"),
+    ([10], "must be an object of limits"),
+])
+def test_invalid_budget_overrides_fail_before_answering(service_with, calls, budget, error) -> None:
+    response = service_with().answer("How do agents plan?", budget=budget)
+
+    assert error in response["error"]
+    assert calls["generate"] == 0
+
+
+def test_budget_overrides_are_converted(service_with) -> None:
+    budget = service_with().new_budget({"max_tokens": "100", "deadline_seconds": 5, "max_llm_calls": None})
+
+    assert (budget.max_tokens, budget.deadline_seconds, budget.max_llm_calls) == (100, 5.0, None)
+    assert isinstance(budget.deadline_seconds, float)
@@ -0,0 +1,57 @@
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+import pytest
+
+from graph.chunking import ChunkingPool, chunk_documents
+from graph.constants import HASHING_EMBEDDINGS, TFIDF_KEYWORDS
+from graph.ingest import RAGVectorStore
+
+
+SPLITTER = RecursiveCharacterTextSplitter(chunk_size=60, chunk_overlap=0)
+
+
+def make_documents():
+    return [
+        Document(
+            page_content=f"Page {index} talks about agents .\n\n   Memory ,  tools and planning !\n \n" * (index % 4 + 1),
+            metadata={"source": f"https://pages.invalid/{index}"}
+        )
+        for index in range(40)
+    ] + [Document(page_content="", metadata={"source": "https://pages.invalid/empty"})]
+
+
+def as_bytes(chunks):
+    return repr([(chunk.page_content, chunk.metadata) for chunk in chunks]).encode("utf-8")
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ChunkingPool(2, SPLITTER, batch_size=7)
+    yield pool
+    pool.close()
+
+
+def test_workers_chunk_exactly_like_the_serial_path(pool) -> None:
+    expected = chunk_documents(SPLITTER, make_documents())
+
+    assert as_bytes(pool.chunk(make_documents())) == as_bytes(expected)
+
+    pages = [[document] for document in make_documents()] + [[]]
+    chunked = list(pool.chunk_each(pages, lambda documents: documents))
+    assert [item for item, _ in chunked] == pages
+    assert as_bytes([chunk for _, chunks in chunked for chunk in chunks]) == as_bytes(expected)
+    assert chunked[-1][1] == []
+
+
+def test_store_chunks_on_workers(tmp_path) -> None:
+    options = {"embedding_backend": HASHING_EMBEDDINGS, "embedding_cache": False, "keyword_extractor": TFIDF_KEYWORDS}
+    serial = RAGVectorStore("serial", str(tmp_path), text_splitter=SPLITTER, **options)
+    parallel = RAGVectorStore("parallel", str(tmp_path), text_splitter=SPLITTER, chunking_workers=2, **options)
+    try:
+        assert as_bytes(parallel.chunk_documents(make_documents())) == as_bytes(serial.chunk_documents(make_documents()))
+    finally:
+        parallel.close()
+
+    unpicklable = RecursiveCharacterTextSplitter(chunk_size=60, chunk_overlap=0, length_function=lambda text: len(text))
+    with pytest.raises(ValueError):
+        RAGVectorStore("other", str(tmp_path), text_splitter=unpicklable, chunking_workers=2, **options)
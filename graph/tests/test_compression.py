@@ -0,0 +1,62 @@
+from langchain.schema import Document
+
+import graph.graph as graph_module
+from graph.chains.hallucination_grader import GradeHallucination
+from graph.compression import compress_documents
+from graph.config import RAGConfig
+from graph.constants import PER_DOCUMENT_GRADING
+from graph.tests.conftest import StubStore
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def test_sentences_matching_the_question_are_kept_within_the_budget() -> None:
+    documents = [
+        Document(
+            page_content="Agents plan with task decomposition. The weather was nice. Cats sleep a lot. Memory stores past actions.",
+            metadata={"source": "https://docs.invalid/agents", "chunk_id": "1", "keywords": "[\"agents\"]"}
+        ),
+        Document(page_content="Agents  plan with task decomposition.\nThe weather was nice."),
+        Document(page_content="An unrelated page the grader still found relevant."),
+    ]
+
+    compressed = compress_documents("How do agents plan?", documents, max_tokens=None, window=0, token_counter=count_words)
+    assert [document.page_content for document in compressed] == [
+        "Agents plan with task decomposition.",
+        "An unrelated page the grader still found relevant.",
+    ]
+    assert compressed[0].metadata == {"source": "https://docs.invalid/agents"}
+
+    with_neighbours = compress_documents("How do agents plan?", documents, max_tokens=None, window=1, token_counter=count_words)
+    assert with_neighbours[0].page_content == "Agents plan with task decomposition. The weather was nice."
+
+    budgeted = compress_documents("How do agents plan?", documents, max_tokens=11, window=1, token_counter=count_words)
+    assert [document.page_content for document in budgeted] == ["Agents plan with task decomposition. The weather was nice."]
+    assert sum(count_words(document.page_content) for document in budgeted) <= 11
+
+    truncated = compress_documents("How do agents plan?", documents, max_tokens=3, window=0, token_counter=count_words)
+    assert truncated[0].page_content
+
+
+def test_generation_and_grounding_see_the_same_compressed_context(stub_chains) -> None:
+    seen = {}
+
+    def ground(inputs):
+        seen["grounding"] = inputs["documents"]
+        return GradeHallucination(binary_score=True)
+
+    def generate(inputs):
+        seen["generation"] = inputs["context"]
+        return "Agents plan ahead."
+
+    stub_chains.set(generation=generate, hallucination_grader=ground)
+    store = StubStore(["Agents plan ahead. Bananas are yellow. Trains run late. Rivers flow.", "Agents plan ahead."])
+    config = RAGConfig(grading_mode=PER_DOCUMENT_GRADING, context_sentence_window=0)
+    result = graph_module.app.invoke({"question": "How do agents plan?", "retriever": store, "config": config})
+
+    assert result["answer"] == "Agents plan ahead."
+    assert [document.page_content for document in seen["generation"]] == ["Agents plan ahead."]
+    assert seen["grounding"] == seen["generation"]
+    assert len(result["documents"]) == 2
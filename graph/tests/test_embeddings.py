@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from graph.embeddings import CachedEmbeddings, HashingEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [float(len(text)), 1.0]
+
+
+def test_hashing_embeddings_are_deterministic_and_normalized() -> None:
+    embeddings = HashingEmbeddings(dimensions=64)
+    first, second = embeddings.embed_documents(["prompt engineering", "prompt engineering"])
+
+    assert first == second
+    assert len(first) == 64
+    assert np.isclose(np.linalg.norm(first), 1.0)
+    assert embeddings.embed_query("") == [0.0] * 64
+
+
+def test_hashing_embeddings_rank_related_text_higher() -> None:
+    embeddings = HashingEmbeddings()
+    query = np.asarray(embeddings.embed_query("what is prompt engineering"))
+    related, unrelated = np.asarray(embeddings.embed_documents(["prompt engineering techniques", "pizza dough recipe"]))
+
+    assert query @ related > query @ unrelated
+
+
+def test_cached_embeddings_only_embed_misses_in_batches(tmp_path) -> None:
+    path = os.path.join(tmp_path, "embeddings.sqlite")
+    underlying = CountingEmbeddings()
+    cached = CachedEmbeddings(underlying, path, namespace="counting", batch_size=2)
+
+    first = cached.embed_documents(["a", "bb", "ccc", "a"])
+    assert underlying.calls == [["a", "bb"], ["ccc"]]
+    assert first == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0], [1.0, 1.0]]
+
+    reopened = CachedEmbeddings(underlying, path, namespace="counting", batch_size=2)
+    assert reopened.embed_documents(["bb", "dddd"]) == [[2.0, 1.0], [4.0, 1.0]]
+    assert reopened.embed_query("ccc") == [3.0, 1.0]
+    assert underlying.calls[2:] == [["dddd"]]
+    assert (reopened.hits, reopened.misses) == (2, 1)
+
+
+def test_cached_embeddings_namespace_separates_models() -> None:
+    underlying = CountingEmbeddings()
+    cached = CachedEmbeddings(underlying, None, namespace="model-a")
+    cached.embed_query("text")
+    cached.namespace = "model-b"
+    cached.embed_query("text")
+
+    assert underlying.calls == [["text"], ["text"]]
+
+
+def test_cached_embeddings_memory_is_a_bounded_lru() -> None:
+    underlying = CountingEmbeddings()
+    cached = CachedEmbeddings(underlying, None, namespace="counting", max_memory_entries=2)
+    cached.embed_documents(["a", "bb", "ccc"])
+    cached.embed_query("bb")
+    cached.embed_query("a")
+
+    assert underlying.calls == [["a", "bb", "ccc"], ["a"]]
+    assert len(cached._memory) == 2
+    assert (cached.hits, cached.misses) == (1, 4)
+
+
+def test_cached_vectors_of_another_size_are_ignored(tmp_path) -> None:
+    path = os.path.join(tmp_path, "embeddings.sqlite")
+    underlying = CountingEmbeddings()
+    CachedEmbeddings(underlying, path, namespace="counting").embed_query("text")
+
+    resized = CachedEmbeddings(underlying, path, namespace="counting", dimensions=3)
+    resized.embed_query("text")
+
+    assert underlying.calls == [["text"], ["text"]]
+
+
+def test_cached_embeddings_count_concurrent_lookups() -> None:
+    cached = CachedEmbeddings(CountingEmbeddings(), None, namespace="counting")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(cached.embed_query, ["a", "bb", "ccc", "dddd"] * 50))
+
+    assert cached.hits + cached.misses == 200
@@ -0,0 +1,73 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import pytest
+
+from graph.fetch import URLFetcher
+
+
+PAGE = b"<html lang='en'><head><title>Prompt engineering</title></head><body><p>Prompt engineering is fun.</p></body></html>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    flaky_requests = 0
+
+    def do_GET(self):
+        if self.path == "/page":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            self.wfile.write(PAGE)
+        elif self.path == "/flaky":
+            Handler.flaky_requests += 1
+            if Handler.flaky_requests == 1:
+                self.send_response(503)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(PAGE)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_fetch_all_reports_failures_per_url(base_url, tmp_path) -> None:
+    fetcher = URLFetcher(cache_dir=str(tmp_path), retries=1, backoff=0)
+    results = fetcher.fetch_all([f"{base_url}/page", f"{base_url}/missing", f"{base_url}/flaky"])
+
+    page, missing, flaky = results
+    assert page.ok and page.documents[0].metadata["title"] == "Prompt engineering"
+    assert page.documents[0].metadata["source"] == f"{base_url}/page"
+    assert "Prompt engineering is fun." in page.documents[0].page_content
+    assert not missing.ok and missing.error == "HTTP 404"
+    assert flaky.ok and flaky.documents
+
+
+def test_conditional_get_skips_unchanged_pages(base_url, tmp_path) -> None:
+    fetcher = URLFetcher(cache_dir=str(tmp_path), backoff=0)
+    first = fetcher.fetch_all([f"{base_url}/page"])
+    # Nothing is remembered until the caller has stored the pages
+    assert fetcher.fetch(f"{base_url}/page").documents
+
+    fetcher.remember(first)
+    second = URLFetcher(cache_dir=str(tmp_path)).fetch(f"{base_url}/page")
+    assert second.ok and second.not_modified and second.status == 304
+    assert second.documents == []
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+import pytest
+
+from graph.constants import HASHING_EMBEDDINGS, OPENAI_EMBEDDINGS, TFIDF_KEYWORDS
+from graph.ingest import RAGVectorStore
+
+
+SOURCE = "https://a.invalid/page"
+
+
+def open_store(tmp_path, collection_name="coll"):
+    return RAGVectorStore(
+        collection_name, str(tmp_path), embedding_backend=HASHING_EMBEDDINGS, embedding_cache=False,
+        text_splitter=RecursiveCharacterTextSplitter(chunk_size=30, chunk_overlap=0), keyword_extractor=TFIDF_KEYWORDS
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    return open_store(tmp_path)
+
+
+def ingest(store, *paragraphs):
+    return store.add_documents([Document(page_content="\n\n".join(paragraphs), metadata={"source": SOURCE})])
+
+
+def stored_chunks(store):
+    stored = store.collection.get(include=["documents", "metadatas"])
+    return sorted((metadata["chunk_index"], text) for text, metadata in zip(stored["documents"], stored["metadatas"]))
+
+
+def counts(report):
+    return report.added, report.updated, report.skipped, report.deleted
+
+
+def test_unchanged_pages_are_skipped(store) -> None:
+    assert counts(ingest(store, "agents plan with memory", "tools extend agents")) == (2, 0, 0, 0)
+    version = store.collection_version
+
+    assert counts(ingest(store, "agents plan with memory", "tools extend agents")) == (0, 0, 2, 0)
+    assert store.collection_version == version
+
+
+def test_changed_chunks_are_updated_and_removed_ones_deleted(store) -> None:
+    ingest(store, "agents plan with memory", "tools extend agents", "reflection improves plans")
+
+    assert counts(ingest(store, "agents plan with memory", "tools extend robots", "reflection improves plans")) == (0, 1, 2, 0)
+    # The page shrinks to its first chunk
+    assert counts(ingest(store, "agents plan with memory")) == (0, 0, 1, 2)
+    assert stored_chunks(store) == [(0, "agents plan with memory")]
+
+
+def test_skipped_chunks_get_their_new_position(store) -> None:
+    ingest(store, "agents plan with memory", "tools extend agents")
+
+    assert counts(ingest(store, "a new introduction", "agents plan with memory", "tools extend agents")) == (1, 0, 2, 0)
+    assert stored_chunks(store) == [(0, "a new introduction"), (1, "agents plan with memory"), (2, "tools extend agents")]
+    # Positions are compared against the refreshed ones, so changing the last chunk is an update
+    assert counts(ingest(store, "a new introduction", "agents plan with memory", "tools extend robots")) == (0, 1, 2, 0)
+    assert stored_chunks(store)[-1] == (2, "tools extend robots")
+
+
+def test_stores_create_no_fetcher_until_they_fetch(store) -> None:
+    ingest(store, "agents plan with memory")
+
+    assert store._fetcher is None
+    assert not os.path.exists(store.http_cache_directory)
+    assert store.fetcher.cache.directory == store.http_cache_directory
+
+
+def test_relevance_is_the_cosine_similarity_in_new_and_legacy_collections(store, tmp_path) -> None:
+    import chromadb
+
+    chromadb.PersistentClient(path=str(tmp_path)).create_collection("legacy")
+    legacy = open_store(tmp_path, "legacy")
+    question, text = "how do agents plan", "agents plan with memory"
+    expected = np.dot(store.embed_query(question), store.embed_query(text))
+
+    for collection in (store, legacy):
+        collection.add_documents([Document(page_content=text, metadata={"source": SOURCE})])
+        [(_, relevance)] = collection.search_with_relevance_scores(question, 1)
+        assert relevance == pytest.approx(expected, abs=1e-5)
+    assert (store.distance_space, legacy.distance_space) == ("cosine", "l2")
+
+
+def test_collections_refuse_another_embedding_model(store, tmp_path, monkeypatch) -> None:
+    import chromadb
+
+    assert store.collection.metadata["embedding_model"] == store.embedding_model
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-fake")
+    with pytest.raises(ValueError, match="was embedded with hashing"):
+        RAGVectorStore("coll", str(tmp_path), embedding_backend=OPENAI_EMBEDDINGS, embedding_cache=False)
+
+    # Collections created before the model was recorded are checked against their vectors
+    chromadb.PersistentClient(path=str(tmp_path)).create_collection("legacy").add(
+        ids=["chunk"], embeddings=[[1.0, 0.0, 0.0]], documents=["agents plan"]
+    )
+    with pytest.raises(ValueError, match="holds 3 dimension embeddings"):
+        open_store(tmp_path, "legacy")
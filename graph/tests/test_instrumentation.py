@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+from uuid import uuid4
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import LLMResult
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+
+from graph.chains.cache import ChainCache, cached_structured_output, set_chain_cache
+from graph.chains.retrieval_grader import GradeDocuments
+from graph.config import RAGConfig
+from graph.constants import PER_DOCUMENT_GRADING
+from graph.instrumentation import Instrumentation, MetricsRegistry, QueryTrace, traced_chain
+from graph.tests.conftest import StubStore
+
+
+class StructuredLLM:
+    model_name = "fake-model"
+
+    def with_structured_output(self, schema):
+        return RunnableLambda(lambda prompt: schema(binary_score="yes"))
+
+
+@pytest.fixture
+def service(stub_chains, make_service, tmp_path):
+    grade_prompt = ChatPromptTemplate.from_messages([("human", "Document: {document} Question: {question}")])
+    stub_chains.set(retrieval_grader=traced_chain(
+        "retrieval_grader", grade_prompt | cached_structured_output("retrieval_grader", StructuredLLM(), GradeDocuments)
+    ))
+    stub_chains.set_getters(generation=lambda: traced_chain(
+        "generation",
+        RunnableLambda(lambda x: x["question"]) | GenericFakeChatModel(messages=iter([AIMessage("Agents plan ahead")])) | StrOutputParser()
+    ))
+    set_chain_cache(ChainCache())
+    instrumentation = Instrumentation(
+        trace_path=os.path.join(tmp_path, "traces.jsonl"), metrics_path=os.path.join(tmp_path, "metrics.prom")
+    )
+    config = RAGConfig(grading_mode=PER_DOCUMENT_GRADING, max_concurrency=1)
+    # The same document twice, so that the second grading call is a chain cache hit
+    query_service = make_service(config, StubStore(["agents plan"] * 2), instrumentation=instrumentation)
+    yield query_service
+    instrumentation.close()
+    set_chain_cache(ChainCache())
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_every_node_and_chain_is_traced(service, tmp_path, asynchronous) -> None:
+    if asynchronous:
+        response = asyncio.run(service.aanswer("How do agents plan?"))
+    else:
+        response = service.answer("How do agents plan?")
+
+    assert response["answer"] == "Agents plan ahead"
+    with open(os.path.join(tmp_path, "traces.jsonl")) as file:
+        traces = [json.loads(line) for line in file]
+    assert len(traces) == 1
+    trace = traces[0]
+    assert [span["node"] for span in trace["spans"]] == ["route", "retrieve", "grade_documents", "compress_context", "generate"]
+    assert trace["nodes"]["generate"]["llm_calls"] == 1
+    assert trace["chains"]["generation"]["llm_calls"] == 1
+    assert trace["chains"]["retrieval_grader"]["runs"] == 2
+    assert trace["nodes"]["grade_documents"]["cache_hits"] == 1
+    assert trace["totals"]["llm_calls"] == 1
+    assert trace["cache"] == "miss" and trace["budget_exhausted"] is False
+    assert 0 < trace["nodes"]["generate"]["seconds"] <= trace["seconds"]
+
+    with open(os.path.join(tmp_path, "metrics.prom")) as file:
+        metrics = file.read()
+    assert 'rag_node_runs_total{node="generate"} 1' in metrics
+    assert 'rag_chain_cache_hits_total{chain="retrieval_grader"} 1' in metrics
+    assert "rag_query_seconds_count 1" in metrics
+
+
+def test_token_usage_is_split_into_prompt_and_completion() -> None:
+    trace = QueryTrace("q")
+    node_run, llm_run = uuid4(), uuid4()
+    trace.on_chain_start({}, {}, run_id=node_run, tags=["graph:step:1"], metadata={"langgraph_node": "generate"}, name="generate")
+    trace.on_chat_model_start({}, [], run_id=llm_run, parent_run_id=node_run)
+    trace.on_llm_end(
+        LLMResult(generations=[], llm_output={"token_usage": {"prompt_tokens": 12, "completion_tokens": 5}}), run_id=llm_run
+    )
+    trace.on_chain_end({}, run_id=node_run)
+
+    stats = trace.finish().to_dict()["nodes"]["generate"]
+    assert (stats["runs"], stats["llm_calls"], stats["prompt_tokens"], stats["completion_tokens"]) == (1, 1, 12, 5)
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    metrics = MetricsRegistry(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 5.0):
+        metrics.observe("rag_query_seconds", {}, seconds)
+
+    rendered = metrics.render()
+    assert 'rag_query_seconds_bucket{le="0.1"} 1' in rendered
+    assert 'rag_query_seconds_bucket{le="1"} 2' in rendered
+    assert 'rag_query_seconds_bucket{le="+Inf"} 3' in rendered
+    assert "rag_query_seconds_sum 5.55" in rendered
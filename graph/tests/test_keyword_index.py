@@ -0,0 +1,54 @@
+import os
+import threading
+
+from graph.keyword_index import KeywordIndex
+
+
+def test_keyword_index_round_trip(tmp_path) -> None:
+    path = os.path.join(tmp_path, "rag-chroma_keyword_index.json")
+    index = KeywordIndex.load(path)
+    assert not index.exists()
+
+    index.add("chunk-1", ["prompt engineering", "llm"])
+    index.add("chunk-2", ["llm", "agents"])
+    index.save()
+
+    loaded = KeywordIndex.load(path)
+    assert loaded.keywords() == {"prompt engineering", "llm", "agents"}
+    assert loaded.chunk_ids_for(["llm"]) == {"chunk-1", "chunk-2"}
+    assert loaded.contains_any(["pizza", "agents"])
+    assert not loaded.contains_any(["pizza"])
+
+
+def test_keyword_index_remove_drops_empty_keywords(tmp_path) -> None:
+    index = KeywordIndex(os.path.join(tmp_path, "index.json"))
+    index.add("chunk-1", ["prompt engineering", "llm"])
+    index.add("chunk-2", ["llm"])
+
+    index.remove(["chunk-1"])
+
+    assert index.keywords() == {"llm"}
+    assert index.chunk_ids_for(["llm"]) == {"chunk-2"}
+
+
+def test_concurrent_saves_never_race_on_the_temporary_file(tmp_path) -> None:
+    path = os.path.join(tmp_path, "rag-chroma_keyword_index.json")
+    index = KeywordIndex(path)
+    index.add("chunk-1", ["agents"])
+    errors = []
+
+    def save():
+        for _ in range(30):
+            try:
+                index.save()
+            except OSError as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=save) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert KeywordIndex.load(path).keywords() == {"agents"}
@@ -0,0 +1,42 @@
+import os
+
+from graph.local_keywords import TfidfKeywordExtractor, candidate_terms
+
+
+def test_candidate_terms_split_at_stopwords_and_punctuation() -> None:
+    terms = candidate_terms("What is Chain-of-Thought prompting? Add a few-shot example.")
+
+    assert terms == [
+        "chain of thought", "prompting", "chain of thought prompting",
+        "add", "few shot", "example", "few shot example"
+    ]
+
+
+def test_terms_common_to_the_corpus_rank_below_specific_ones() -> None:
+    extractor = TfidfKeywordExtractor(keywords_per_chunk=2)
+    topics = ["memory", "tools", "planning", "reflection", "prompting"]
+    keywords = extractor.extract([f"agents {topic}" for topic in topics])
+
+    assert keywords[0] == ["memory", "agents memory"]
+    assert all("agents" not in chunk_keywords for chunk_keywords in keywords)
+    assert extractor.document_count == 5
+    assert extractor.document_frequencies["agents"] == 5
+
+
+def test_statistics_persist_across_loads(tmp_path) -> None:
+    path = os.path.join(tmp_path, "stats.json")
+    extractor = TfidfKeywordExtractor(path)
+    extractor.extract(["adversarial attacks on language models"])
+    extractor.save()
+
+    reloaded = TfidfKeywordExtractor.load(path)
+    assert reloaded.document_count == 1
+    assert reloaded.document_frequencies["adversarial attacks"] == 1
+    assert reloaded.extract(["language models"], update=False) == [["language", "models", "language models"]]
+    assert reloaded.document_count == 1
+
+
+def test_question_keywords_keep_every_candidate() -> None:
+    assert TfidfKeywordExtractor.question_keywords("What are adversarial attacks?") == [
+        "adversarial", "attacks", "adversarial attacks"
+    ]
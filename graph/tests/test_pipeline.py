@@ -0,0 +1,80 @@
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+import pytest
+
+from graph.constants import HASHING_EMBEDDINGS, TFIDF_KEYWORDS
+from graph.fetch import FetchResult
+from graph.ingest import RAGVectorStore
+from graph.pipeline import StreamingIngestion
+
+
+URLS = [f"https://a.invalid/{index}" for index in range(6)]
+
+
+class CountingStore(RAGVectorStore):
+    """Serves a page per URL, remembering what was fetched and failing to embed after a number of batches."""
+
+    fetched = None
+    embed_limit = None
+
+    def fetch_urls(self, urls):
+        self.fetched.extend(urls)
+        return [
+            FetchResult(url=url, documents=[Document(page_content=f"page {url} about agents", metadata={"source": url})])
+            for url in urls
+        ]
+
+    def embed_documents(self, texts):
+        if self.embed_limit is not None:
+            if self.embed_limit == 0:
+                raise RuntimeError("embedding backend down")
+            self.embed_limit -= 1
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CountingStore(
+        "coll", str(tmp_path), embedding_backend=HASHING_EMBEDDINGS, embedding_cache=False,
+        text_splitter=RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=0), keyword_extractor=TFIDF_KEYWORDS
+    )
+    store.fetched = []
+    return store
+
+
+def ingestion(store):
+    return StreamingIngestion(store, url_batch_size=2, write_batch_size=1, queue_size=1, checkpoint_every=1)
+
+
+def test_pipeline_writes_every_page_and_bumps_the_version_once(store) -> None:
+    report = ingestion(store).run(URLS)
+
+    assert (report.added, report.failed_urls) == (len(URLS), [])
+    assert store.sources() == set(URLS)
+    assert store.keyword_index.chunk_ids_for({"agents"})
+    assert store.collection_version == 1
+    assert not ingestion(store).checkpoint.completed_urls()
+
+    report = ingestion(store).run(URLS)
+    assert (report.added, report.skipped) == (0, len(URLS))
+    assert store.collection_version == 1
+
+
+def test_failed_run_only_checkpoints_written_pages(store) -> None:
+    store.embed_limit = 3
+    with pytest.raises(RuntimeError, match="embedding backend down"):
+        ingestion(store).run(URLS)
+
+    completed = ingestion(store).checkpoint.completed_urls()
+    assert completed <= store.sources() < set(URLS)
+    assert store.collection_version == 1
+
+
+def test_resumed_run_skips_checkpointed_urls(store) -> None:
+    ingestion(store).checkpoint.mark_completed(URLS[:3])
+
+    report = ingestion(store).run(URLS)
+
+    assert store.fetched == URLS[3:]
+    assert report.added == 3
+    assert not ingestion(store).checkpoint.completed_urls()
@@ -0,0 +1,51 @@
+import asyncio
+
+from graph.config import RAGConfig
+from graph.constants import RETRIEVE, SCORE_ROUTING, WEB_SEARCH
+from graph.nodes import aretrieve, retrieve, route
+from graph.routing import RouteSignals, calibrate_threshold, score_route
+from graph.tests.conftest import StubStore
+
+
+class ScoredStore(StubStore):
+    def __init__(self, scores):
+        super().__init__([f"doc {i}" for i in range(len(scores))], scores, keywords=["jailbreak", "prompts"])
+
+    def get_retriever(self, k):
+        raise AssertionError("routed documents should be reused")
+
+
+def test_calibrate_threshold_separates_scores() -> None:
+    threshold = calibrate_threshold([0.6, 0.7, 0.8], [0.1, 0.2, 0.4])
+    assert threshold == 0.5
+    assert calibrate_threshold([0.5], [0.5, 0.1]) == 0.3
+
+
+def test_score_route_uses_either_signal() -> None:
+    config = RAGConfig(route_min_relevance=0.5, route_min_keyword_overlap=0.5)
+    assert score_route(RouteSignals(top_relevance=0.6), config) == RETRIEVE
+    assert score_route(RouteSignals(top_relevance=0.1, keyword_overlap=0.5), config) == RETRIEVE
+    assert score_route(RouteSignals(top_relevance=0.1, keyword_overlap=0.2), config) == WEB_SEARCH
+
+
+def test_score_routing_prefetches_documents_for_retrieve() -> None:
+    config = RAGConfig(routing_mode=SCORE_ROUTING, retrieval_k=2, route_min_relevance=0.5)
+    store = ScoredStore([0.9, 0.3, 0.2])
+    state = {"question": "What are jailbreak prompts?", "retriever": store, "config": config}
+
+    update = route(state)
+    assert update["route_decision"] == RETRIEVE
+    assert [document.page_content for document in update["prefetched_documents"]] == ["doc 0", "doc 1"]
+
+    state.update(update)
+    assert retrieve(state)["documents"] == update["prefetched_documents"]
+    assert asyncio.run(aretrieve(state))["prefetched_documents"] is None
+
+
+def test_score_routing_sends_unknown_questions_to_web_search() -> None:
+    config = RAGConfig(routing_mode=SCORE_ROUTING, route_min_relevance=0.5)
+    store = ScoredStore([0.1])
+    update = route({"question": "How do I bake bread?", "retriever": store, "config": config})
+
+    assert update["route_decision"] == WEB_SEARCH
+    assert update["prefetched_documents"] is None
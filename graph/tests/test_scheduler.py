@@ -0,0 +1,162 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import contextvars
+import json
+import threading
+import time
+
+import pytest
+
+from graph.chains.llm import get_llm
+from graph.constants import BULK_PRIORITY, INTERACTIVE_PRIORITY
+from graph.scheduler import PRIORITIES, LLMScheduler, get_llm_scheduler, llm_priority, set_llm_scheduler
+
+
+COMPLETION = {
+    "id": "chatcmpl-fake",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o-mini",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6}
+}
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    """OpenAI compatible chat completions endpoint rate limiting its first request and recording its peak load."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeOpenAIHandler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak = 0
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            first = server.requests == 1
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+        time.sleep(0.05)
+        with server.lock:
+            server.in_flight -= 1
+        body = json.dumps({"error": {"message": "Rate limit reached"}} if first else COMPLETION).encode()
+        self.send_response(429 if first else 200)
+        if first:
+            self.send_header("retry-after-ms", "20")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def scheduler():
+    previous = get_llm_scheduler()
+    scheduler = LLMScheduler(initial_concurrency=2, max_concurrency=2)
+    set_llm_scheduler(scheduler)
+    yield scheduler
+    set_llm_scheduler(previous)
+
+
+def test_interactive_requests_go_first_and_rate_limits_halve_the_concurrency(scheduler) -> None:
+    held = [scheduler.acquire(), scheduler.acquire()]
+    granted = []
+
+    def request():
+        ticket = scheduler.acquire()
+        granted.append(PRIORITIES[ticket.rank])
+        scheduler.release(ticket, latency=0.1)
+
+    with llm_priority(BULK_PRIORITY):
+        bulk = threading.Thread(target=contextvars.copy_context().run, args=(request,))
+    bulk.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=request)
+    interactive.start()
+    time.sleep(0.05)
+
+    # Both wait for a slot, the later interactive one gets it
+    scheduler.release(held[0], throttled=True)
+    scheduler.release(held[1], throttled=True)
+    bulk.join(5)
+    interactive.join(5)
+
+    assert granted == [INTERACTIVE_PRIORITY, BULK_PRIORITY]
+    assert scheduler.stats["throttled"] == 2
+    # Both throttled requests were in flight together, the limit is halved once
+    assert scheduler.stats["decreases"] == 1
+    assert scheduler.limit == 2
+
+
+def test_token_bucket_paces_requests() -> None:
+    now = [0.0]
+    scheduler = LLMScheduler(tokens_per_minute=600, clock=lambda: now[0])
+    scheduler.release(scheduler.acquire(tokens=600), latency=0.1)
+    woken = []
+    scheduler._enqueue(60, None, lambda: woken.append(now[0]))
+    scheduler._timer.cancel()
+    assert woken == []
+    now[0] = 6.0
+    scheduler._on_timer()
+    assert woken == [6.0]
+
+
+def test_slot_of_a_request_whose_loop_closed_goes_to_the_next_one() -> None:
+    scheduler = LLMScheduler(initial_concurrency=1, max_concurrency=1)
+    held = scheduler.acquire()
+    loop = asyncio.new_event_loop()
+    abandoned = loop.create_task(scheduler.aacquire())
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+    granted = []
+    waiter = threading.Thread(target=lambda: granted.append(scheduler.acquire()), daemon=True)
+    waiter.start()
+    time.sleep(0.05)
+
+    releaser = threading.Thread(target=scheduler.release, args=(held,), kwargs={"latency": 0.1}, daemon=True)
+    releaser.start()
+    releaser.join(5)
+    waiter.join(5)
+
+    assert not releaser.is_alive() and not waiter.is_alive()
+    assert len(granted) == 1 and scheduler.in_flight == 1
+    assert not abandoned.done()
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_llm_requests_are_scheduled_against_a_local_server(monkeypatch, scheduler, asynchronous) -> None:
+    server = FakeOpenAI()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-fake")
+    monkeypatch.setenv("OPENAI_API_BASE", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    get_llm.cache_clear()
+    try:
+        llm = get_llm()
+        prompts = [f"question {index}" for index in range(6)]
+        if asynchronous:
+            answers = asyncio.run(llm.abatch(prompts, config={"max_concurrency": 6}))
+        else:
+            answers = llm.batch(prompts, config={"max_concurrency": 6})
+    finally:
+        get_llm.cache_clear()
+        server.shutdown()
+        server.server_close()
+
+    assert [answer.content for answer in answers] == ["ok"] * 6
+    # The 429 was retried by the client, every attempt went through the scheduler
+    assert server.requests == 7
+    assert server.peak <= 2
+    assert scheduler.stats["throttled"] == 1
+    assert scheduler.stats["requests"] == 7
+    assert scheduler.in_flight == 0
@@ -0,0 +1,83 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from graph.answer_cache import EXACT_HIT, MISS, AnswerCache
+from graph.config import RAGConfig
+from graph.constants import HASHING_EMBEDDINGS, PER_DOCUMENT_GRADING, TFIDF_KEYWORDS
+from graph.sharding import collection_exists
+from graph.tests.conftest import StubStore
+from service import QueryService, run_batch, serve_jsonl
+
+
+@pytest.fixture
+def service(stub_chains, make_service):
+    stub_chains.set(generation=lambda inputs: f"answer to {inputs['question']}")
+    return make_service(RAGConfig(grading_mode=PER_DOCUMENT_GRADING, max_concurrency=1))
+
+
+def test_serve_answers_json_lines_concurrently(service) -> None:
+    requests = [json.dumps({"id": index, "question": f"How do agents plan {index}?"}) for index in range(6)]
+    stdin = io.StringIO("\n".join(requests[:3] + ["", "not json", json.dumps({"id": "x"})] + requests[3:]) + "\n")
+    stdout = io.StringIO()
+    serve_jsonl(service, stdin, stdout, parallelism=3)
+
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert len(responses) == 8
+    answered = {response["id"]: response["answer"] for response in responses if "answer" in response}
+    assert answered == {index: f"answer to How do agents plan {index}?" for index in range(6)}
+    assert sum("Invalid request" in response.get("error", "") for response in responses) == 2
+
+
+def test_batch_writes_every_answer(service, tmp_path) -> None:
+    output_path = str(tmp_path / "answers.jsonl")
+    responses = run_batch(service, ["How do agents plan?", "What is memory?"], output_path, parallelism=2)
+
+    with open(output_path) as file:
+        written = [json.loads(line) for line in file]
+    assert sorted(response["index"] for response in written) == [0, 1]
+    assert {response["answer"] for response in responses} == {"answer to How do agents plan?", "answer to What is memory?"}
+    assert all(response["elapsed_seconds"] >= 0 for response in written)
+
+    async def from_a_running_loop():
+        return run_batch(service, ["How do agents plan?"], output_path, parallelism=1)
+
+    assert asyncio.run(from_a_running_loop())[0]["answer"] == "answer to How do agents plan?"
+
+
+def test_invalid_parallelism_and_unknown_collections_are_rejected(service, tmp_path) -> None:
+    for parallelism in (0, -1):
+        with pytest.raises(ValueError):
+            serve_jsonl(service, io.StringIO(), io.StringIO(), parallelism=parallelism)
+        with pytest.raises(ValueError):
+            run_batch(service, ["How do agents plan?"], str(tmp_path / "answers.jsonl"), parallelism)
+
+    store_options = {"embedding_backend": HASHING_EMBEDDINGS, "embedding_cache": False, "keyword_extractor": TFIDF_KEYWORDS}
+    real_service = QueryService(str(tmp_path), "coll", store_options=store_options)
+    assert real_service.get_vector_store().collection_name == "coll"
+    stdout = io.StringIO()
+    serve_jsonl(real_service, io.StringIO(json.dumps({"question": "Hi?", "collection_name": "made_up"}) + "\n"), stdout)
+
+    assert "Unknown collection" in json.loads(stdout.getvalue())["error"]
+    assert collection_exists(str(tmp_path), "coll") and not collection_exists(str(tmp_path), "made_up")
+
+
+def test_answers_are_cached_under_the_version_they_were_looked_up_with(stub_chains, make_service) -> None:
+    class IngestedMeanwhile(StubStore):
+        def embed_query(self, question):
+            return [1.0, 0.0]
+
+        def get_retriever(self, k):
+            # An ingestion finishing while the answer is generated
+            self.collection_version += 1
+            return super().get_retriever(k)
+
+    store = IngestedMeanwhile()
+    cache = AnswerCache()
+    service = make_service(RAGConfig(grading_mode=PER_DOCUMENT_GRADING), store, answer_cache=cache)
+    assert service.answer("How do agents plan?")["cache"] == MISS
+
+    assert cache.lookup("coll", 0, "How do agents plan?").kind == EXACT_HIT
+    assert cache.lookup("coll", store.collection_version, "How do agents plan?").kind == MISS
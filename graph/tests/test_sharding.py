@@ -0,0 +1,102 @@
+from collections import Counter
+
+import pytest
+
+from graph import retrieval
+from graph.config import RAGConfig
+from graph.constants import DOMAIN_SHARDING, HYBRID_RETRIEVAL
+from graph.ingest import RAGVectorStore
+from graph.nodes import retrieve
+from graph.sharding import ShardedRAGVectorStore, open_vector_store
+from graph.tests.conftest import PAGES, STORE_OPTIONS, PagesShardedStore, PagesVectorStore
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    store = PagesShardedStore("coll", str(tmp_path), num_shards=3, **STORE_OPTIONS)
+    store.add_documents_from_urls(list(PAGES))
+    yield store
+    store.close()
+
+
+def test_pages_are_spread_over_shards_and_searched_together(sharded, tmp_path) -> None:
+    assert sum(len(shard.sources()) > 0 for shard in sharded.shards) > 1
+    assert sharded.sources() == set(PAGES)
+    assert sharded.known_sources(["https://c.invalid/errors", "https://z.invalid/"]) == {"https://c.invalid/errors"}
+
+    single = PagesVectorStore("single", str(tmp_path), **STORE_OPTIONS)
+    single.add_documents_from_urls(list(PAGES))
+    question = "How do agents plan with memory?"
+    assert [document.page_content for document, _ in sharded.search_with_relevance_scores(question, 3)] == [
+        document.page_content for document, _ in single.search_with_relevance_scores(question, 3)
+    ]
+    assert sharded.get_retriever(1).invoke(question)[0].metadata["source"] == "https://d.invalid/agents"
+    assert sharded.keyword_overlap({"jailbreak", "memory", "unknown"}) == pytest.approx(2 / 3)
+    assert sharded.has_any_keyword({"alignment"})
+
+    config = RAGConfig(retrieval_mode=HYBRID_RETRIEVAL, retrieval_k=2)
+    assert retrieval.search(sharded, "err_conn_reset", config)[0][0].metadata["source"] == "https://c.invalid/errors"
+    update = retrieve({"question": question, "retriever": sharded, "config": config})
+    assert update["documents"][0].metadata["source"] == "https://d.invalid/agents"
+
+
+def test_layout_is_kept_and_shards_rebuild_alone(sharded, tmp_path) -> None:
+    with pytest.raises(ValueError):
+        ShardedRAGVectorStore("coll", str(tmp_path), num_shards=2, **STORE_OPTIONS)
+    with pytest.raises(ValueError):
+        ShardedRAGVectorStore("coll", str(tmp_path), num_shards=3, shard_by=DOMAIN_SHARDING, **STORE_OPTIONS)
+    reopened = open_vector_store("coll", str(tmp_path), **STORE_OPTIONS)
+    assert isinstance(reopened, ShardedRAGVectorStore) and reopened.num_shards == 3
+    reopened.close()
+    assert isinstance(open_vector_store("other", str(tmp_path), **STORE_OPTIONS), RAGVectorStore)
+
+    index = max(range(3), key=lambda index: len(sharded.shards[index].sources()))
+    sources = sharded.shards[index].sources()
+    version = sharded.collection_version
+    report = sharded.rebuild_shard(index)
+
+    assert report.added == len(sources)
+    assert sharded.shards[index].sources() == sources
+    assert sharded.sources() == set(PAGES)
+    assert sharded.collection_version > version
+
+
+def test_questions_are_answered_by_the_other_shards_during_a_rebuild(sharded, monkeypatch) -> None:
+    index = max(range(3), key=lambda index: len(sharded.shards[index].sources()))
+    rebuilt_sources = sharded.shards[index].sources()
+    answered = []
+    fetch_urls = PagesVectorStore.fetch_urls
+
+    def fetch_while_answering(shard, urls):
+        answered.append(sharded.search_with_relevance_scores("How do agents plan with memory?", 6))
+        return fetch_urls(shard, urls)
+
+    monkeypatch.setattr(PagesVectorStore, "fetch_urls", fetch_while_answering)
+    sharded.rebuild_shard(index)
+
+    [results] = answered
+    assert {document.metadata["source"] for document, _ in results} == set(PAGES) - rebuilt_sources
+    assert len(sharded.search_with_relevance_scores("How do agents plan with memory?", 6)) == len(PAGES)
+
+    def dropped_meanwhile(shard):
+        # The rebuild of a shard starts while a question is searching it
+        if shard is sharded.shards[index]:
+            sharded._rebuilding.add(index)
+            raise ValueError("Collection does not exist")
+        return shard.collection_name
+
+    assert sharded._fan_out(dropped_meanwhile) == [f"coll_{other}" for other in range(3) if other != index]
+
+
+def test_shards_share_chunking_processes_and_keyword_statistics(sharded, tmp_path) -> None:
+    statistics = sharded.local_keyword_extractor
+    assert statistics.document_count == len(PAGES)
+    assert statistics.document_frequencies == sum(
+        (shard.local_keyword_extractor.document_frequencies for shard in sharded.shards), Counter()
+    )
+
+    pooled = ShardedRAGVectorStore("pooled", str(tmp_path), num_shards=2, chunking_workers=2, **STORE_OPTIONS)
+    try:
+        assert pooled.shards[0].chunking_pool is pooled.shards[1].chunking_pool is not None
+    finally:
+        pooled.close()
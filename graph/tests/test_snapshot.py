@@ -0,0 +1,63 @@
+import pytest
+
+from graph import retrieval, snapshot as snapshot_module
+from graph.config import RAGConfig
+from graph.constants import HYBRID_RETRIEVAL
+from graph.nodes import retrieve
+from graph.snapshot import SnapshotVectorStore, export_snapshot
+from graph.tests.conftest import PAGES, STORE_OPTIONS, PagesVectorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PagesVectorStore("coll", str(tmp_path / "chroma"), **STORE_OPTIONS)
+    store.add_documents_from_urls(list(PAGES))
+    yield store
+    store.close()
+
+
+def test_snapshot_answers_like_its_collection(store, tmp_path) -> None:
+    manifest = export_snapshot(store, str(tmp_path / "snapshot"))
+    snapshot = SnapshotVectorStore(str(tmp_path / "snapshot"))
+    assert manifest["chunks"] == len(PAGES) and snapshot.collection_version == store.collection_version
+
+    question = "How do agents plan with memory?"
+    expected = store.search_with_relevance_scores(question, 4)
+    results = snapshot.search_with_relevance_scores(question, 4)
+    # Chunks sharing no hashed term tie, only the scores are compared past the best ones
+    assert [score for _, score in results] == pytest.approx([score for _, score in expected], abs=1e-4)
+    assert [document for document, _ in results[:3]] == [document for document, _ in expected[:3]]
+
+    assert snapshot.get_keywords_in_vector_store() == store.get_keywords_in_vector_store()
+    assert snapshot.local_keyword_extractor.document_count == store.local_keyword_extractor.document_count
+    assert snapshot.local_keyword_extractor.document_frequencies == store.local_keyword_extractor.document_frequencies
+    keywords = {"jailbreak", "memory", "unknown"}
+    assert snapshot.keyword_overlap(keywords) == pytest.approx(store.keyword_overlap(keywords))
+    assert snapshot.has_any_keyword({"alignment"}) and not snapshot.has_any_keyword({"unknown"})
+
+    assert store.bm25_index.search("err_conn_reset proxy", 3) == [
+        (snapshot.ids[row], pytest.approx(score)) for row, score in snapshot.bm25_search("err_conn_reset proxy", 3)
+    ]
+    config = RAGConfig(retrieval_mode=HYBRID_RETRIEVAL, retrieval_k=2, keyword_prefilter=True)
+    assert retrieval.search(snapshot, "err_conn_reset", config)[0][0].metadata["source"] == "https://c.invalid/errors"
+    update = retrieve({"question": question, "retriever": snapshot, "config": RAGConfig(retrieval_k=2)})
+    assert update["documents"][0].metadata["source"] == "https://d.invalid/agents"
+
+
+def test_ivf_snapshot_searches_the_nearest_lists(store, tmp_path, monkeypatch) -> None:
+    # Pages and batches smaller than the collection are streamed one after the other
+    monkeypatch.setattr(snapshot_module, "EXPORT_BATCH_SIZE", 4)
+    manifest = export_snapshot(store, str(tmp_path / "snapshot"), ivf_lists=3, page_size=4)
+    assert manifest["ivf_lists"] == 3
+    question = "Reward models trained on human preference data"
+
+    exhaustive = SnapshotVectorStore(str(tmp_path / "snapshot"), nprobe=3)
+    assert [score for _, score in exhaustive.search_with_relevance_scores(question, 6)] == pytest.approx(
+        [score for _, score in store.search_with_relevance_scores(question, 6)], abs=1e-4
+    )
+    probed = SnapshotVectorStore(str(tmp_path / "snapshot"), nprobe=1)
+    assert probed.get_retriever(1).invoke(question)[0].metadata["source"] == "https://f.invalid/training"
+
+    # Exporting again swaps the new snapshot in whole
+    export_snapshot(store, str(tmp_path / "snapshot"))
+    assert SnapshotVectorStore(str(tmp_path / "snapshot")).centroids is None
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+import graph.graph as graph_module
+from graph.chains.retrieval_grader import GradeDocuments
+from graph.config import RAGConfig
+from graph.constants import PER_DOCUMENT_GRADING, SPECULATE_ALWAYS, SPECULATE_NEVER
+from graph.nodes.web_search import set_web_search_tool, speculation_stats
+from graph.tests.conftest import StubStore
+
+
+class StubSearch:
+    """Local stand-in for TavilySearchResults, blocking until released so tests control the overlap."""
+
+    def __init__(self):
+        self.queries = []
+        self.release = threading.Event()
+
+    def search(self, query):
+        self.queries.append(query["query"])
+        self.release.wait(timeout=5)
+        return [{"content": "from the web"}]
+
+    def runnable(self):
+        return RunnableLambda(self.search)
+
+
+@pytest.fixture
+def search(stub_chains):
+    stub = StubSearch()
+    set_web_search_tool(stub.runnable())
+    speculation_stats.clear()
+    yield stub
+    set_web_search_tool(None)
+
+
+def grade_with(stub_chains, stub, relevant):
+    def grade(inputs):
+        # The speculative search can only finish once grading has started
+        stub.release.set()
+        return GradeDocuments(binary_score="yes" if relevant else "no")
+
+    stub_chains.set(retrieval_grader=grade)
+
+
+def run(policy, asynchronous=False):
+    config = RAGConfig(grading_mode=PER_DOCUMENT_GRADING, speculative_web_search=policy, max_concurrency=1)
+    inputs = {"question": "How do agents plan?", "retriever": StubStore(["agents plan", "agents act"]), "config": config}
+    if asynchronous:
+        return asyncio.run(graph_module.app.ainvoke(inputs))
+    return graph_module.app.invoke(inputs)
+
+
+def test_speculative_search_is_discarded_when_grading_passes(stub_chains, search) -> None:
+    grade_with(stub_chains, search, relevant=True)
+    result = run(SPECULATE_ALWAYS)
+
+    assert result["answer"] == "agents plan | agents act"
+    assert speculation_stats["started"] == 1 and speculation_stats["cancelled"] == 1
+    assert speculation_stats["used"] == 0
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_speculative_search_is_consumed_when_grading_fails(stub_chains, search, asynchronous) -> None:
+    grade_with(stub_chains, search, relevant=False)
+    result = run(SPECULATE_ALWAYS, asynchronous)
+
+    assert result["answer"] == "from the web"
+    assert search.queries == ["How do agents plan?"]
+    assert speculation_stats["used"] == 1
+
+
+def test_no_speculation_by_default(stub_chains, search) -> None:
+    search.release.set()
+    grade_with(stub_chains, search, relevant=False)
+    result = run(SPECULATE_NEVER)
+
+    assert result["answer"] == "from the web"
+    assert search.queries == ["How do agents plan?"]
+    assert speculation_stats["started"] == 0
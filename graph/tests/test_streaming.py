@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+
+from graph.chains.hallucination_grader import GradeHallucination
+from graph.config import RAGConfig
+from graph.constants import GENERATION_STARTED_EVENT, PER_DOCUMENT_GRADING, VERIFICATION_EVENT
+
+
+@pytest.fixture
+def service(stub_chains, make_service):
+    answers = iter(["Agents plan ahead", "Agents plan step by step"])
+    groundedness = iter([False, True])
+    stub_chains.set_getters(generation=lambda: (
+        RunnableLambda(lambda x: x["question"]) | GenericFakeChatModel(messages=iter([AIMessage(next(answers))])) | StrOutputParser()
+    ))
+    stub_chains.set(hallucination_grader=lambda x: GradeHallucination(binary_score=next(groundedness)))
+    return make_service(RAGConfig(grading_mode=PER_DOCUMENT_GRADING))
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_answer_is_streamed_with_verification_events(service, asynchronous) -> None:
+    tokens, events = [], []
+    on_event = lambda name, data: events.append((name, data))
+    if asynchronous:
+        response = asyncio.run(service.aanswer("How do agents plan?", on_token=tokens.append, on_event=on_event))
+    else:
+        response = service.answer("How do agents plan?", on_token=tokens.append, on_event=on_event)
+
+    assert "".join(tokens) == "Agents plan aheadAgents plan step by step"
+    assert len(tokens) > 2
+    assert events == [
+        (GENERATION_STARTED_EVENT, {"attempt": 1}),
+        (VERIFICATION_EVENT, {"decision": "not_supported"}),
+        (GENERATION_STARTED_EVENT, {"attempt": 2}),
+        (VERIFICATION_EVENT, {"decision": "useful"}),
+    ]
+    assert response["answer"] == "Agents plan step by step"
+    assert 0 <= response["time_to_first_token_seconds"] <= response["elapsed_seconds"]
+
+
+def test_answer_without_callbacks_is_not_streamed(service) -> None:
+    response = service.answer("How do agents plan?")
+
+    assert response["answer"] == "Agents plan step by step"
+    assert "time_to_first_token_seconds" not in response
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.runnables import RunnableLambda
+
+from graph.config import RAGConfig
+from graph.constants import HASHING_EMBEDDINGS, TFIDF_KEYWORDS
+from graph.ingest import RAGVectorStore
+from graph.nodes import web_search
+from graph.nodes.web_search import set_web_search_tool
+from graph.search_cache import WebSearchCache, get_web_search_cache, set_web_search_cache
+from graph.write_back import trusted_results, wait_for_write_backs
+
+
+TRUSTED_CONTENT = "Tree of thoughts lets a language model explore several reasoning paths and backtrack. " * 4
+RESULTS = [
+    {"url": "https://research.example.org/tot", "content": TRUSTED_CONTENT},
+    {"url": "http://blog.invalid/tot", "content": "Insecure copy of the page. " * 20},
+    {"url": "https://research.example.org/teaser", "content": "Read more."},
+]
+
+
+@pytest.fixture
+def search_cache():
+    """A fresh process wide web search cache, the previous one is restored afterwards."""
+    previous = get_web_search_cache()
+    cache = WebSearchCache()
+    set_web_search_cache(cache)
+    yield cache
+    set_web_search_cache(previous)
+
+
+def test_cache_expires_and_evicts() -> None:
+    cache = WebSearchCache(max_entries=2, ttl_seconds=0.05)
+    cache.set("What is tree of thoughts?", RESULTS)
+
+    assert cache.get("  what is TREE of thoughts ") == RESULTS
+    cache.set("second", [])
+    cache.set("third", [])
+    assert cache.get("what is tree of thoughts") is None
+    time.sleep(0.06)
+    assert cache.get("third") is None
+    assert cache.stats == {"hits": 1, "misses": 2}
+
+
+def test_repeated_searches_hit_the_cache_and_add_no_duplicates(search_cache) -> None:
+    queries = []
+    set_web_search_tool(RunnableLambda(lambda query: queries.append(query["query"]) or RESULTS))
+    try:
+        state = {"question": "What is tree of thoughts?", "documents": [Document(page_content="Read more.")]}
+        first = web_search(state)
+        # A rejected answer sends the question back through the web search
+        second = web_search({**state, "documents": first["documents"]})
+    finally:
+        set_web_search_tool(None)
+
+    assert queries == ["What is tree of thoughts?"]
+    assert [document.metadata.get("source") for document in first["documents"]] == [
+        None, "https://research.example.org/tot", "http://blog.invalid/tot"
+    ]
+    assert second["documents"] == first["documents"]
+    assert search_cache.stats["hits"] == 1
+
+
+def test_trusted_results_are_written_back(search_cache, tmp_path) -> None:
+    store = RAGVectorStore(
+        "coll", str(tmp_path),
+        embedding_backend=HASHING_EMBEDDINGS,
+        embedding_cache=False,
+        text_splitter=RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0),
+        keyword_extractor=TFIDF_KEYWORDS
+    )
+    config = RAGConfig(web_search_write_back=True, write_back_domains=("example.org",))
+    assert trusted_results(RESULTS, config) == RESULTS[:1]
+
+    set_web_search_tool(RunnableLambda(lambda query: RESULTS))
+    try:
+        web_search({"question": "What is tree of thoughts?", "documents": [], "retriever": store, "config": config})
+        wait_for_write_backs(timeout=30)
+    finally:
+        set_web_search_tool(None)
+
+    documents = store.get_retriever(1).invoke("tree of thoughts reasoning paths")
+    assert documents[0].metadata["source"] == "https://research.example.org/tot"
+    assert store.keyword_overlap({"thoughts"}) == 1.0
+    # Written back pages keep the answers cached for the collection
+    assert store.collection_version == 0
+    assert store.known_sources([result["url"] for result in RESULTS]) == {"https://research.example.org/tot"}
@@ -1,10 +1,16 @@
-from typing import List
+from typing import Any, Coroutine, Dict, List, Tuple, TypeVar
+import asyncio
+import concurrent.futures
+import hashlib
 
 from langchain.schema import Document
 
 from graph.re_patterns import EXTRA_WHITESPACE_PATTERN
 
 
+T = TypeVar("T")
+
+
 def preprocess_keywords(keywords: List[str]) -> List[str]:
     processed_keywords = [keyword.replace("-", " ").lower() for keyword in keywords]
     return processed_keywords
@@ -18,4 +24,47 @@ def preprocess_documents(documents: List[Document]) -> List[Document]:
     for document in documents:
         document.page_content = trim_extra_space(document.page_content)
     return documents
-        
\ No newline at end of file
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def assign_chunk_ids(documents: List[Document]) -> List[str]:
+    """
+    Give every chunk a deterministic id derived from its source URL and content hash,
+    so re-ingesting an unchanged page produces the same ids. The position of the chunk
+    within its source and its content hash are stored in the metadata.
+    """
+    chunk_indices: Dict[str, int] = {}
+    occurrences: Dict[Tuple[str, str], int] = {}
+    ids = []
+    for document in documents:
+        source = document.metadata.get("source", "")
+        digest = content_hash(document.page_content)
+        # Identical chunks repeated within one page still need distinct ids
+        occurrence = occurrences.get((source, digest), 0)
+        occurrences[(source, digest)] = occurrence + 1
+        chunk_index = chunk_indices.get(source, 0)
+        chunk_indices[source] = chunk_index + 1
+
+        chunk_id = hashlib.sha256(f"{source}\x00{digest}\x00{occurrence}".encode("utf-8")).hexdigest()
+        document.metadata["chunk_id"] = chunk_id
+        document.metadata["content_hash"] = digest
+        document.metadata["chunk_index"] = chunk_index
+        ids.append(chunk_id)
+    return ids
+
+
+def run_sync(coroutine: Coroutine[Any, Any, T]) -> T:
+    """
+    Run a coroutine to completion from synchronous code. asyncio.run can't be used in a thread
+    already running an event loop, e.g. in Jupyter or an async server, the coroutine then runs
+    on a worker thread with a loop of its own while the caller waits.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="run-sync") as executor:
+        return executor.submit(asyncio.run, coroutine).result()
@@ -0,0 +1,78 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence
+from urllib.parse import urlparse
+import concurrent.futures
+import threading
+
+from langchain.schema import Document
+
+from utils import logger
+from graph.config import RAGConfig
+
+if TYPE_CHECKING:
+    from graph.ingest import IngestionReport, RAGVectorStore
+
+
+# One writer, so write-backs reach the collection in order and never contend with each other
+_write_back_executor: concurrent.futures.ThreadPoolExecutor | None = None
+_write_back_executor_lock = threading.Lock()
+
+
+def _domain_allowed(domain: str, allowed_domains: Sequence[str]) -> bool:
+    return not allowed_domains or any(domain == allowed or domain.endswith(f".{allowed}") for allowed in allowed_domains)
+
+
+def trusted_results(results: List[Dict[str, Any]], config: RAGConfig) -> List[Dict[str, Any]]:
+    """
+    Web results worth keeping in the collection: served over HTTPS from one of the allowed domains,
+    any domain when none are configured, and long enough to hold more than a teaser.
+    """
+    trusted = []
+    for result in results:
+        url = urlparse(result.get("url") or "")
+        if url.scheme != "https" or not _domain_allowed(url.hostname or "", config.write_back_domains):
+            continue
+        if len(result.get("content") or "") < config.write_back_min_chars:
+            continue
+        trusted.append(result)
+    return trusted
+
+
+def write_back_results(store: "RAGVectorStore", results: List[Dict[str, Any]], config: RAGConfig) -> "IngestionReport | None":
+    """
+    Chunk, tag and ingest the trusted web results into the store. Pages already in the collection are
+    left alone, as a search snippet would replace their crawled chunks. The collection version is kept,
+    as added pages don't make the cached answers wrong, and bumping it would drop them all at every write-back.
+    """
+    results = trusted_results(results, config)
+    known = store.known_sources([result["url"] for result in results])
+    documents = [
+        Document(page_content=result["content"], metadata={"source": result["url"]})
+        for result in results if result["url"] not in known
+    ]
+    if not documents:
+        return None
+    logger.info(f"---WRITING {len(documents)} WEB RESULTS BACK TO THE VECTOR STORE---")
+    return store.add_documents(documents, bump_version=False)
+
+
+def _write_back(store: "RAGVectorStore", results: List[Dict[str, Any]], config: RAGConfig) -> "IngestionReport | None":
+    try:
+        return write_back_results(store, results, config)
+    except Exception as e:
+        logger.error(f"Writing web results back failed: {e}")
+        return None
+
+
+def start_write_back(store: "RAGVectorStore", results: List[Dict[str, Any]], config: RAGConfig) -> concurrent.futures.Future:
+    """Write the results back on a background thread, answering the question never waits for it."""
+    global _write_back_executor
+    with _write_back_executor_lock:
+        if _write_back_executor is None:
+            _write_back_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="web-write-back")
+    return _write_back_executor.submit(_write_back, store, results, config)
+
+
+def wait_for_write_backs(timeout: float | None = None):
+    """Block until every write-back started so far is done, e.g. before a short-lived process exits."""
+    if _write_back_executor is not None:
+        _write_back_executor.submit(lambda: None).result(timeout=timeout)
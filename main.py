@@ -1,17 +1,104 @@
+from typing import Any, Dict
 import argparse
-import os
+import json
+import sys
 
 from dotenv import load_dotenv
 
-from utils import logger, read_urls_from_file
-from constants import DEFAULT_COLLECTION_NAME, DEFAULT_PERSIST_DIRECTORY
-from graph import app
-from graph.ingest import RAGVectorStore
+from utils import logger, read_urls_from_file, read_questions_from_file
+from constants import (
+    DEFAULT_ANSWER_CACHE_PATH,
+    DEFAULT_BATCH_PARALLELISM,
+    DEFAULT_CHAIN_CACHE_PATH,
+    DEFAULT_COLLECTION_NAME,
+    DEFAULT_PERSIST_DIRECTORY
+)
+from graph.answer_cache import AnswerCache
+from graph.chains.cache import ChainCache, get_chain_cache, set_chain_cache
+from graph.config import RAGConfig
+from graph.constants import (
+    BATCH_GRADING,
+    BUDGET_EXHAUSTED,
+    GENERATION_STARTED_EVENT,
+    VERIFICATION_EVENT,
+    DEFAULT_ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    DEFAULT_CHUNKING_WORKERS,
+    DEFAULT_ANSWER_CACHE_TTL_SECONDS,
+    DEFAULT_CONTEXT_MAX_TOKENS,
+    DEFAULT_CONTEXT_SENTENCE_WINDOW,
+    DEFAULT_DEADLINE_SECONDS,
+    DEFAULT_EMBEDDING_BATCH_SIZE,
+    DEFAULT_HYBRID_FETCH_K,
+    DEFAULT_IVF_PROBES,
+    DEFAULT_LEXICAL_WEIGHT,
+    DEFAULT_LLM_INITIAL_CONCURRENCY,
+    DEFAULT_LLM_MAX_CONCURRENCY,
+    DEFAULT_LLM_TARGET_LATENCY_SECONDS,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_LLM_CALLS,
+    DEFAULT_MAX_REGENERATIONS,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_RETRIEVAL_K,
+    DEFAULT_ROUTE_MIN_KEYWORD_OVERLAP,
+    DEFAULT_ROUTE_MIN_RELEVANCE,
+    DEFAULT_RRF_K,
+    DEFAULT_SPECULATIVE_MAX_RELEVANCE,
+    DEFAULT_VECTOR_WEIGHT,
+    DEFAULT_WEB_SEARCH_CACHE_TTL_SECONDS,
+    DEFAULT_WRITE_BACK_MIN_CHARS,
+    DOMAIN_SHARDING,
+    HASH_SHARDING,
+    HASHING_EMBEDDINGS,
+    HYBRID_RETRIEVAL,
+    KEYWORD_ROUTING,
+    LLM_KEYWORDS,
+    OPENAI_EMBEDDINGS,
+    PER_DOCUMENT_GRADING,
+    SCORE_ROUTING,
+    SPECULATE_ALWAYS,
+    SPECULATE_LOW_RELEVANCE,
+    SPECULATE_NEVER,
+    TFIDF_KEYWORDS,
+    VECTOR_RETRIEVAL
+)
+from graph.instrumentation import Instrumentation
+from graph.routing import calibrate_routing
+from graph.scheduler import LLMScheduler, set_llm_scheduler
+from graph.sharding import ShardedRAGVectorStore, open_vector_store
+from graph.snapshot import export_snapshot
+from graph.search_cache import WebSearchCache, set_web_search_cache
+from graph.write_back import wait_for_write_backs
+from service import QueryService, run_batch, serve_jsonl
 
 
 load_dotenv()
 
 
+VERIFICATION_MESSAGES = {
+    "useful": "[verified]",
+    "not_supported": "[not grounded in the documents, regenerating]",
+    "not_useful": "[does not answer the question, searching the web]",
+    BUDGET_EXHAUSTED: "[query budget exhausted, returning the best answer so far]"
+}
+
+
+def print_token(token: str):
+    sys.stdout.write(token)
+    sys.stdout.flush()
+
+
+def print_event(name: str, data: Dict[str, Any]):
+    if name == GENERATION_STARTED_EVENT and data["attempt"] > 1:
+        print_token(f"\n--- attempt {data['attempt']} ---\n")
+    elif name == VERIFICATION_EVENT:
+        print_token(f"\n{VERIFICATION_MESSAGES.get(data['decision'], data['decision'])}\n")
+
+
+def limit(value: float | int) -> float | int | None:
+    """Budget limits given on the command line, a negative value means unlimited."""
+    return None if value < 0 else value
+
+
 def main():
     parser = argparse.ArgumentParser(description="Run corrective RAG with a question or URL ingestion.")
     
@@ -27,31 +114,408 @@ def main():
         help=f"Path to the directory where vector store will be stored. Defaults to {DEFAULT_PERSIST_DIRECTORY}",
         default=DEFAULT_PERSIST_DIRECTORY
     )
+    parser.add_argument(
+        '--questions', type=str,
+        help="Path to text file containing one question per line, answered as a batch"
+    )
+    parser.add_argument(
+        '--parallelism', type=int,
+        help=f"Number of questions answered concurrently in batch and serve mode. Defaults to {DEFAULT_BATCH_PARALLELISM}",
+        default=DEFAULT_BATCH_PARALLELISM
+    )
+    parser.add_argument(
+        '--output', type=str,
+        help="Path to the JSONL file batch answers are written to. Defaults to <questions file>.answers.jsonl"
+    )
+    parser.add_argument(
+        '--max_concurrency', type=int,
+        help=f"Maximum number of concurrent LLM calls per question or ingestion stage. Defaults to {DEFAULT_MAX_CONCURRENCY}",
+        default=DEFAULT_MAX_CONCURRENCY
+    )
+    parser.add_argument(
+        '--llm_requests_per_minute', type=float,
+        help="Requests per minute sent to the LLM provider by the whole process. Defaults to no limit"
+    )
+    parser.add_argument(
+        '--llm_tokens_per_minute', type=float,
+        help="Tokens per minute sent to the LLM provider by the whole process. Defaults to no limit"
+    )
+    parser.add_argument(
+        '--llm_initial_concurrency', type=int,
+        help=f"LLM requests in flight at first, adapted to rate limits and latency. Defaults to {DEFAULT_LLM_INITIAL_CONCURRENCY}",
+        default=DEFAULT_LLM_INITIAL_CONCURRENCY
+    )
+    parser.add_argument(
+        '--llm_max_concurrency', type=int,
+        help=f"Most LLM requests ever in flight in the whole process. Defaults to {DEFAULT_LLM_MAX_CONCURRENCY}",
+        default=DEFAULT_LLM_MAX_CONCURRENCY
+    )
+    parser.add_argument(
+        '--llm_target_latency', type=float,
+        help=f"Seconds of an LLM answer above which fewer requests are sent at once, -1 to only adapt to rate limits. "
+        f"Defaults to {DEFAULT_LLM_TARGET_LATENCY_SECONDS}",
+        default=DEFAULT_LLM_TARGET_LATENCY_SECONDS
+    )
+    parser.add_argument(
+        '--no_llm_scheduler', action='store_true',
+        help="Send every LLM request as soon as it is made, without process wide rate limits or priorities"
+    )
+    parser.add_argument(
+        '--grading_mode', type=str, choices=[BATCH_GRADING, PER_DOCUMENT_GRADING],
+        help=f"Grade retrieved documents in one LLM call or one call per document. Defaults to {BATCH_GRADING}",
+        default=BATCH_GRADING
+    )
+    parser.add_argument(
+        '--answer_cache', action='store_true',
+        help="Answer repeated and near-duplicate questions from a cache invalidated on ingestion"
+    )
+    parser.add_argument(
+        '--answer_cache_path', type=str,
+        help=f"Path to the SQLite file backing the answer cache. Defaults to {DEFAULT_ANSWER_CACHE_PATH}",
+        default=DEFAULT_ANSWER_CACHE_PATH
+    )
+    parser.add_argument(
+        '--answer_cache_ttl', type=float,
+        help=f"Seconds a cached answer stays valid. Defaults to {DEFAULT_ANSWER_CACHE_TTL_SECONDS}",
+        default=DEFAULT_ANSWER_CACHE_TTL_SECONDS
+    )
+    parser.add_argument(
+        '--answer_cache_similarity', type=float,
+        help=f"Minimum cosine similarity for a semantic cache hit. Defaults to {DEFAULT_ANSWER_CACHE_SIMILARITY_THRESHOLD}",
+        default=DEFAULT_ANSWER_CACHE_SIMILARITY_THRESHOLD
+    )
+    parser.add_argument(
+        '--chain_cache_path', type=str,
+        help=f"Path to the SQLite file memoizing keyword extraction and grading calls. Defaults to {DEFAULT_CHAIN_CACHE_PATH}",
+        default=DEFAULT_CHAIN_CACHE_PATH
+    )
+    parser.add_argument(
+        '--no_chain_cache', action='store_true',
+        help="Always send keyword extraction and grading calls to the model"
+    )
+    parser.add_argument(
+        '--embedding_backend', type=str, choices=[OPENAI_EMBEDDINGS, HASHING_EMBEDDINGS],
+        help=f"Embedder for ingestion and queries, {HASHING_EMBEDDINGS} runs locally on the CPU. Defaults to {OPENAI_EMBEDDINGS}",
+        default=OPENAI_EMBEDDINGS
+    )
+    parser.add_argument(
+        '--embedding_batch_size', type=int,
+        help=f"Number of texts embedded per request during ingestion. Defaults to {DEFAULT_EMBEDDING_BATCH_SIZE}",
+        default=DEFAULT_EMBEDDING_BATCH_SIZE
+    )
+    parser.add_argument(
+        '--chunking_workers', type=int,
+        help=f"Processes splitting and cleaning documents during ingestion. Defaults to {DEFAULT_CHUNKING_WORKERS}, "
+        "splitting in the ingesting process",
+        default=DEFAULT_CHUNKING_WORKERS
+    )
+    parser.add_argument(
+        '--no_embedding_cache', action='store_true',
+        help="Don't cache embeddings next to the collection"
+    )
+    parser.add_argument(
+        '--keyword_extractor', type=str, choices=[LLM_KEYWORDS, TFIDF_KEYWORDS],
+        help=f"How chunks and questions are tagged with keywords, {TFIDF_KEYWORDS} runs locally without LLM calls. "
+        f"Use the same extractor for ingesting and querying a collection. Defaults to {LLM_KEYWORDS}",
+        default=LLM_KEYWORDS
+    )
+    parser.add_argument(
+        '--routing_mode', type=str, choices=[KEYWORD_ROUTING, SCORE_ROUTING],
+        help=f"{SCORE_ROUTING} routes on retrieval scores and keyword overlap instead of an LLM keyword call. Defaults to {KEYWORD_ROUTING}",
+        default=KEYWORD_ROUTING
+    )
+    parser.add_argument(
+        '--retrieval_k', type=int,
+        help=f"Number of documents retrieved from the vector store. Defaults to {DEFAULT_RETRIEVAL_K}",
+        default=DEFAULT_RETRIEVAL_K
+    )
+    parser.add_argument(
+        '--retrieval_mode', type=str, choices=[VECTOR_RETRIEVAL, HYBRID_RETRIEVAL],
+        help=f"{HYBRID_RETRIEVAL} fuses vector search with BM25 keyword search, which finds exact terms such as "
+        f"product names and error codes. Defaults to {VECTOR_RETRIEVAL}",
+        default=VECTOR_RETRIEVAL
+    )
+    parser.add_argument(
+        '--hybrid_fetch_k', type=int,
+        help=f"Candidates taken from each of the vector and BM25 rankings before fusing them. Defaults to {DEFAULT_HYBRID_FETCH_K}",
+        default=DEFAULT_HYBRID_FETCH_K
+    )
+    parser.add_argument(
+        '--vector_weight', type=float,
+        help=f"Weight of the vector ranking in {HYBRID_RETRIEVAL} retrieval. Defaults to {DEFAULT_VECTOR_WEIGHT}",
+        default=DEFAULT_VECTOR_WEIGHT
+    )
+    parser.add_argument(
+        '--lexical_weight', type=float,
+        help=f"Weight of the BM25 ranking in {HYBRID_RETRIEVAL} retrieval. Defaults to {DEFAULT_LEXICAL_WEIGHT}",
+        default=DEFAULT_LEXICAL_WEIGHT
+    )
+    parser.add_argument(
+        '--rrf_k', type=int,
+        help=f"Constant of the reciprocal rank fusion. Defaults to {DEFAULT_RRF_K}",
+        default=DEFAULT_RRF_K
+    )
+    parser.add_argument(
+        '--keyword_prefilter', action='store_true',
+        help=f"Restrict {HYBRID_RETRIEVAL} retrieval to the chunks tagged with one of the question's keywords"
+    )
+    parser.add_argument(
+        '--route_min_relevance', type=float,
+        help=f"Relevance of the best match above which {SCORE_ROUTING} routing retrieves. Defaults to {DEFAULT_ROUTE_MIN_RELEVANCE}",
+        default=DEFAULT_ROUTE_MIN_RELEVANCE
+    )
+    parser.add_argument(
+        '--route_min_keyword_overlap', type=float,
+        help=f"Share of indexed question keywords above which {SCORE_ROUTING} routing retrieves. Defaults to {DEFAULT_ROUTE_MIN_KEYWORD_OVERLAP}",
+        default=DEFAULT_ROUTE_MIN_KEYWORD_OVERLAP
+    )
+    parser.add_argument(
+        '--speculative_web_search', type=str, choices=[SPECULATE_NEVER, SPECULATE_ALWAYS, SPECULATE_LOW_RELEVANCE],
+        help="Start the web search in the background while documents are retrieved and graded, "
+        f"trading extra search calls for lower latency. Defaults to {SPECULATE_NEVER}",
+        default=SPECULATE_NEVER
+    )
+    parser.add_argument(
+        '--speculative_max_relevance', type=float,
+        help=f"With {SPECULATE_LOW_RELEVANCE}, speculate when the best retrieved document is less relevant than this. "
+        f"Defaults to {DEFAULT_SPECULATIVE_MAX_RELEVANCE}",
+        default=DEFAULT_SPECULATIVE_MAX_RELEVANCE
+    )
+    parser.add_argument(
+        '--calibrate_routing', type=str, nargs=2, metavar=('IN_DOMAIN', 'OUT_OF_DOMAIN'),
+        help="Files of questions the collection can and can't answer, used to print calibrated routing thresholds"
+    )
+    parser.add_argument(
+        '--max_llm_calls', type=int,
+        help=f"LLM calls allowed per question, -1 for no limit. Defaults to {DEFAULT_MAX_LLM_CALLS}",
+        default=DEFAULT_MAX_LLM_CALLS
+    )
+    parser.add_argument(
+        '--max_tokens', type=int,
+        help=f"Tokens allowed per question, -1 for no limit. Defaults to {DEFAULT_MAX_TOKENS}",
+        default=DEFAULT_MAX_TOKENS
+    )
+    parser.add_argument(
+        '--max_regenerations', type=int,
+        help=f"Times an answer failing verification may be regenerated, -1 for no limit. Defaults to {DEFAULT_MAX_REGENERATIONS}",
+        default=DEFAULT_MAX_REGENERATIONS
+    )
+    parser.add_argument(
+        '--deadline_seconds', type=float,
+        help=f"Seconds allowed per question before the best answer so far is returned, -1 for no limit. "
+        f"Defaults to {DEFAULT_DEADLINE_SECONDS}",
+        default=DEFAULT_DEADLINE_SECONDS
+    )
+    parser.add_argument(
+        '--no_context_compression', action='store_true',
+        help="Pass the graded documents whole to generation and the hallucination grader"
+    )
+    parser.add_argument(
+        '--context_max_tokens', type=int,
+        help=f"Tokens of document text generation and the hallucination grader see, -1 for no limit. "
+        f"Defaults to {DEFAULT_CONTEXT_MAX_TOKENS}",
+        default=DEFAULT_CONTEXT_MAX_TOKENS
+    )
+    parser.add_argument(
+        '--context_sentence_window', type=int,
+        help=f"Sentences kept around each one matching the question. Defaults to {DEFAULT_CONTEXT_SENTENCE_WINDOW}",
+        default=DEFAULT_CONTEXT_SENTENCE_WINDOW
+    )
+    parser.add_argument(
+        '--no_web_search_cache', action='store_true',
+        help="Search the web on every visit of the web search node, even for a query searched moments ago"
+    )
+    parser.add_argument(
+        '--web_search_cache_ttl', type=float,
+        help=f"Seconds web search results are reused for the same query, -1 for no expiry. "
+        f"Defaults to {DEFAULT_WEB_SEARCH_CACHE_TTL_SECONDS}",
+        default=DEFAULT_WEB_SEARCH_CACHE_TTL_SECONDS
+    )
+    parser.add_argument(
+        '--web_search_write_back', action='store_true',
+        help="Ingest trusted web results into the collection, so later questions on the topic are answered locally"
+    )
+    parser.add_argument(
+        '--write_back_domains', type=str, nargs='+', default=[],
+        help="Only write back results from these domains and their subdomains. Defaults to any domain"
+    )
+    parser.add_argument(
+        '--write_back_min_chars', type=int,
+        help=f"Web results shorter than this are never written back. Defaults to {DEFAULT_WRITE_BACK_MIN_CHARS}",
+        default=DEFAULT_WRITE_BACK_MIN_CHARS
+    )
+    parser.add_argument(
+        '--num_shards', type=int,
+        help="Spread a new collection over this many shards, searched in parallel. "
+        "Existing collections are always opened with the layout they were created with"
+    )
+    parser.add_argument(
+        '--shard_by', type=str, choices=[HASH_SHARDING, DOMAIN_SHARDING],
+        help=f"Assign pages to shards by a hash of their URL, or of their domain to keep each site in one shard. "
+        f"Defaults to {HASH_SHARDING}"
+    )
+    parser.add_argument(
+        '--rebuild_shard', type=int,
+        help="Drop one shard of a sharded collection and ingest its pages again"
+    )
+    parser.add_argument(
+        '--export_snapshot', type=str, metavar='DIRECTORY',
+        help="Export the collection, after any ingestion, to a snapshot directory that --snapshot serves from"
+    )
+    parser.add_argument(
+        '--ivf_lists', type=int, default=0,
+        help="Partition the exported snapshot into this many k-means lists, so searches only scan the nearest ones. "
+        "Defaults to 0, an exact scan of every chunk"
+    )
+    parser.add_argument(
+        '--snapshot', type=str, metavar='DIRECTORY',
+        help="Answer questions from a memory-mapped snapshot of the collection instead of opening it, read-only"
+    )
+    parser.add_argument(
+        '--ivf_probes', type=int, default=DEFAULT_IVF_PROBES,
+        help=f"IVF lists of a partitioned snapshot searched for every question. Defaults to {DEFAULT_IVF_PROBES}"
+    )
+    parser.add_argument(
+        '--stream', action='store_true',
+        help="Print the answer to a single question token by token as it is generated, then whether it passed verification"
+    )
+    parser.add_argument(
+        '--serve', action='store_true',
+        help="Keep the graph and vector store warm and answer JSON-lines questions read from stdin"
+    )
+    parser.add_argument(
+        '--trace_path', type=str,
+        help="Append a JSON trace of every question, with the time, LLM calls, tokens, cache hits and retries of each node and chain"
+    )
+    parser.add_argument(
+        '--metrics_path', type=str,
+        help="Keep Prometheus counters and latency histograms of the nodes and chains up to date in this file"
+    )
 
     args = parser.parse_args()
     
     collection_name = args.collection_name
     persist_directory = args.persist_directory
+    set_chain_cache(None if args.no_chain_cache else ChainCache(path=args.chain_cache_path))
+    set_web_search_cache(None if args.no_web_search_cache else WebSearchCache(ttl_seconds=limit(args.web_search_cache_ttl)))
+    set_llm_scheduler(None if args.no_llm_scheduler else LLMScheduler(
+        requests_per_minute=args.llm_requests_per_minute,
+        tokens_per_minute=args.llm_tokens_per_minute,
+        initial_concurrency=min(args.llm_initial_concurrency, args.llm_max_concurrency),
+        max_concurrency=args.llm_max_concurrency,
+        target_latency_seconds=limit(args.llm_target_latency)
+    ))
+    store_options = {
+        "embedding_backend": args.embedding_backend,
+        "embedding_batch_size": args.embedding_batch_size,
+        "embedding_cache": not args.no_embedding_cache,
+        "keyword_extractor": args.keyword_extractor,
+        "chunking_workers": args.chunking_workers,
+        "num_shards": args.num_shards,
+        "shard_by": args.shard_by
+    }
 
     if args.urls:
         logger.info("Attempting to add urls..")
         urls = read_urls_from_file(args.urls)
         logger.info(f"Found {len(urls)} from {args.urls}")
-        vector_store = RAGVectorStore(collection_name, persist_directory)
+        vector_store = open_vector_store(
+            collection_name, persist_directory, max_concurrency=args.max_concurrency, **store_options
+        )
         vector_store.add_documents_from_urls(urls)
+        vector_store.close()
+        if get_chain_cache():
+            logger.info(f"Chain cache hit rate during ingestion: {get_chain_cache().hit_rate():.1%}")
+    if args.rebuild_shard is not None:
+        vector_store = open_vector_store(
+            collection_name, persist_directory, max_concurrency=args.max_concurrency, **store_options
+        )
+        if not isinstance(vector_store, ShardedRAGVectorStore):
+            raise ValueError(f"Collection {collection_name} is not sharded")
+        logger.info(f"Rebuilt shard {args.rebuild_shard}: {vector_store.rebuild_shard(args.rebuild_shard)}")
+        vector_store.close()
+    if args.export_snapshot:
+        vector_store = open_vector_store(
+            collection_name, persist_directory, max_concurrency=args.max_concurrency, **store_options
+        )
+        manifest = export_snapshot(vector_store, args.export_snapshot, ivf_lists=args.ivf_lists)
+        logger.info(f"Snapshot manifest: {json.dumps(manifest)}")
+        vector_store.close()
     
-    if args.question:
-        if not os.path.exists(persist_directory):
-            raise ValueError("Specified vector store doesn't exist")
-        retriever = RAGVectorStore(
-            collection_name=collection_name,
-            persist_directory=persist_directory
+    config = RAGConfig(
+        max_concurrency=args.max_concurrency,
+        grading_mode=args.grading_mode,
+        routing_mode=args.routing_mode,
+        retrieval_k=args.retrieval_k,
+        retrieval_mode=args.retrieval_mode,
+        hybrid_fetch_k=args.hybrid_fetch_k,
+        vector_weight=args.vector_weight,
+        lexical_weight=args.lexical_weight,
+        rrf_k=args.rrf_k,
+        keyword_prefilter=args.keyword_prefilter,
+        route_min_relevance=args.route_min_relevance,
+        route_min_keyword_overlap=args.route_min_keyword_overlap,
+        speculative_web_search=args.speculative_web_search,
+        speculative_max_relevance=args.speculative_max_relevance,
+        max_llm_calls=limit(args.max_llm_calls),
+        max_tokens=limit(args.max_tokens),
+        max_regenerations=limit(args.max_regenerations),
+        deadline_seconds=limit(args.deadline_seconds),
+        compress_context=not args.no_context_compression,
+        context_max_tokens=limit(args.context_max_tokens),
+        context_sentence_window=args.context_sentence_window,
+        web_search_write_back=args.web_search_write_back,
+        write_back_domains=tuple(args.write_back_domains),
+        write_back_min_chars=args.write_back_min_chars
+    )
+    answer_cache = None
+    if args.answer_cache:
+        answer_cache = AnswerCache(
+            path=args.answer_cache_path,
+            ttl_seconds=args.answer_cache_ttl,
+            similarity_threshold=args.answer_cache_similarity
+        )
+    instrumentation = None
+    if args.trace_path or args.metrics_path:
+        instrumentation = Instrumentation(trace_path=args.trace_path, metrics_path=args.metrics_path)
+    service = QueryService(
+        persist_directory, collection_name, config, answer_cache, store_options, instrumentation,
+        snapshot_directory=args.snapshot, ivf_probes=args.ivf_probes
+    )
+
+    if args.calibrate_routing:
+        in_domain, out_of_domain = (read_questions_from_file(path) for path in args.calibrate_routing)
+        min_relevance, min_keyword_overlap = calibrate_routing(
+            service.get_vector_store(collection_name), in_domain, out_of_domain, config
+        )
+        logger.info(
+            f"Calibrated routing thresholds: --route_min_relevance {min_relevance:.4f} "
+            f"--route_min_keyword_overlap {min_keyword_overlap:.4f}"
         )
+    elif args.serve:
+        serve_jsonl(service, sys.stdin, sys.stdout, args.parallelism)
+    elif args.questions:
+        questions = read_questions_from_file(args.questions)
+        output_path = args.output or f"{args.questions}.answers.jsonl"
+        run_batch(service, questions, output_path, args.parallelism)
+    elif args.question:
         logger.info(f"Querying with question: {args.question}")
-        result = app.invoke(input={"question": args.question, "retriever": retriever})
-        logger.info(f"Answer: {result['answer']}")
+        if args.stream:
+            result = service.answer(args.question, on_token=print_token, on_event=print_event)
+        else:
+            result = service.answer(args.question)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        if "time_to_first_token_seconds" in result:
+            logger.info(f"Time to first token: {result['time_to_first_token_seconds']}s")
+        if result.get("budget_exhausted"):
+            logger.warning(f"Query budget exhausted ({result['usage']['exhausted']}), the answer may be unverified")
+        logger.info(f"Answer: {result['answer']} ({result['elapsed_seconds']}s)")
     else:
         logger.info("No question provided, URL ingestion completed.")
+    wait_for_write_backs()
+    if instrumentation is not None:
+        instrumentation.close()
 
 
 if __name__ == "__main__":
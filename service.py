@@ -0,0 +1,360 @@
+from typing import Any, Callable, Dict, Iterable, List, TextIO
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import time
+
+from utils import logger
+from graph.answer_cache import MISS, AnswerCache, CacheLookup
+from graph.budget import QueryBudget
+from graph.config import RAGConfig
+from graph.constants import DEFAULT_IVF_PROBES, GENERATE
+from graph.ingest import RAGVectorStore
+from graph.sharding import ShardedRAGVectorStore, collection_exists, open_vector_store
+from graph.snapshot import SnapshotVectorStore
+from graph.instrumentation import Instrumentation, QueryTrace
+from graph.streaming import AnswerStreamHandler
+from graph import utils
+
+
+class QueryService:
+    """
+    Keeps the compiled graph and one warm RAGVectorStore per collection, a ShardedRAGVectorStore
+    for sharded ones, so that consecutive questions don't pay the cold-start cost again.
+    With snapshot_directory, the default collection is served read-only from its memory-mapped snapshot instead.
+    An optional AnswerCache is consulted before running the graph.
+    With instrumentation, every question answered is traced per node and chain.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str,
+        default_collection_name: str,
+        config: RAGConfig | None = None,
+        answer_cache: AnswerCache | None = None,
+        store_options: Dict[str, Any] | None = None,
+        instrumentation: Instrumentation | None = None,
+        snapshot_directory: str | None = None,
+        ivf_probes: int = DEFAULT_IVF_PROBES
+    ):
+        self.persist_directory = persist_directory
+        self.default_collection_name = default_collection_name
+        self.config = config or RAGConfig()
+        self.answer_cache = answer_cache
+        self.store_options = store_options or {}
+        self.instrumentation = instrumentation
+        self.snapshot_directory = snapshot_directory
+        self.ivf_probes = ivf_probes
+        self._vector_stores: Dict[str, RAGVectorStore | ShardedRAGVectorStore | SnapshotVectorStore] = {}
+        self._lock = threading.Lock()
+        from graph import app
+
+        self.app = app
+
+    def _serves_snapshot(self, collection_name: str) -> bool:
+        return self.snapshot_directory is not None and collection_name == self.default_collection_name
+
+    def get_vector_store(self, collection_name: str | None = None) -> RAGVectorStore | ShardedRAGVectorStore | SnapshotVectorStore:
+        collection_name = collection_name or self.default_collection_name
+        with self._lock:
+            if collection_name not in self._vector_stores and self._serves_snapshot(collection_name):
+                logger.info(f"Opening snapshot {self.snapshot_directory}")
+                self._vector_stores[collection_name] = SnapshotVectorStore(self.snapshot_directory, self.ivf_probes)
+            if collection_name not in self._vector_stores:
+                if not os.path.exists(self.persist_directory):
+                    raise ValueError("Specified vector store doesn't exist")
+                # Requests may name any collection, only the default one is created when missing
+                if collection_name != self.default_collection_name and not collection_exists(self.persist_directory, collection_name):
+                    raise ValueError(f"Unknown collection: {collection_name}")
+                logger.info(f"Opening collection {collection_name}")
+                self._vector_stores[collection_name] = open_vector_store(
+                    collection_name=collection_name,
+                    persist_directory=self.persist_directory,
+                    max_concurrency=self.config.max_concurrency,
+                    **self.store_options
+                )
+            return self._vector_stores[collection_name]
+
+    def _new_response(self, question: str, collection_name: str | None) -> Dict[str, Any]:
+        return {
+            "question": question,
+            "collection_name": collection_name or self.default_collection_name
+        }
+
+    def new_budget(self, overrides: Dict[str, Any] | None = None) -> QueryBudget:
+        """A budget with the limits of the service config, with any of them overridden for one request."""
+        if overrides is not None and not isinstance(overrides, dict):
+            raise ValueError(f"Budget overrides must be an object of limits, got {overrides!r}")
+        # Every override is checked before any is applied
+        limits = {limit: QueryBudget.parse_limit(limit, value) for limit, value in (overrides or {}).items()}
+        budget = QueryBudget.from_config(self.config)
+        for limit, value in limits.items():
+            setattr(budget, limit, value)
+        return budget
+
+    def _graph_input(self, question: str, retriever: RAGVectorStore | ShardedRAGVectorStore | SnapshotVectorStore, budget: QueryBudget) -> Dict[str, Any]:
+        return {
+            "question": question,
+            "retriever": retriever,
+            "config": self.config,
+            "budget": budget
+        }
+
+    def _lookup_answer(self, retriever: RAGVectorStore | ShardedRAGVectorStore | SnapshotVectorStore, question: str) -> CacheLookup:
+        if self.answer_cache is None:
+            return CacheLookup(None, MISS)
+        try:
+            return self.answer_cache.lookup(
+                retriever.collection_name, retriever.collection_version, question, retriever.embed_query
+            )
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+            return CacheLookup(None, MISS)
+
+    def _store_answer(self, retriever: RAGVectorStore | ShardedRAGVectorStore | SnapshotVectorStore, question: str, answer: str, lookup: CacheLookup):
+        # Stored under the version the question was looked up with, an ingestion finishing meanwhile
+        # must not have an answer generated from the old contents served for the new ones
+        if self.answer_cache is not None and lookup.version is not None:
+            self.answer_cache.put(retriever.collection_name, lookup.version, question, answer, lookup.embedding)
+
+    @staticmethod
+    def _stream_handler(on_token: Callable[[str], None] | None, on_event) -> AnswerStreamHandler | None:
+        return AnswerStreamHandler(on_token, on_event) if on_token else None
+
+    def _new_trace(self, question: str) -> QueryTrace | None:
+        return self.instrumentation.new_trace(question) if self.instrumentation is not None else None
+
+    @staticmethod
+    def _run_config(*callbacks) -> Dict[str, Any] | None:
+        callbacks = [callback for callback in callbacks if callback is not None]
+        return {"callbacks": callbacks} if callbacks else None
+
+    @staticmethod
+    def _final_answer(update: Dict[str, Any], answer: str | None) -> str | None:
+        # The last answer generated before the graph ends is the one that passed verification
+        return (update.get(GENERATE) or {}).get("answer", answer)
+
+    def _run_graph(
+        self,
+        question: str,
+        retriever: RAGVectorStore | ShardedRAGVectorStore | SnapshotVectorStore,
+        budget: QueryBudget,
+        handler: AnswerStreamHandler | None,
+        trace: QueryTrace | None = None
+    ) -> str:
+        graph_input = self._graph_input(question, retriever, budget)
+        config = self._run_config(handler, trace)
+        if handler is None:
+            return self.app.invoke(input=graph_input, config=config)["answer"]
+        answer = None
+        for update in self.app.stream(graph_input, config=config, stream_mode="updates"):
+            answer = self._final_answer(update, answer)
+        return answer
+
+    async def _arun_graph(
+        self,
+        question: str,
+        retriever: RAGVectorStore | ShardedRAGVectorStore | SnapshotVectorStore,
+        budget: QueryBudget,
+        handler: AnswerStreamHandler | None,
+        trace: QueryTrace | None = None
+    ) -> str:
+        graph_input = self._graph_input(question, retriever, budget)
+        config = self._run_config(handler, trace)
+        if handler is None:
+            return (await self.app.ainvoke(input=graph_input, config=config))["answer"]
+        answer = None
+        async for update in self.app.astream(graph_input, config=config, stream_mode="updates"):
+            answer = self._final_answer(update, answer)
+        return answer
+
+    def _finish(
+        self,
+        response: Dict[str, Any],
+        start: float,
+        handler: AnswerStreamHandler | None,
+        budget: QueryBudget | None,
+        trace: QueryTrace | None = None
+    ) -> Dict[str, Any]:
+        response["elapsed_seconds"] = round(time.perf_counter() - start, 4)
+        if budget is not None:
+            response["usage"] = budget.usage()
+            # The answer is the best one reached before a limit was hit, possibly unverified
+            response["budget_exhausted"] = budget.exhausted is not None
+        if handler is not None and handler.first_token_at is not None:
+            response["time_to_first_token_seconds"] = round(handler.first_token_at - start, 4)
+        if trace is not None:
+            trace.attributes.update(
+                {key: response[key] for key in ("collection_name", "cache", "budget_exhausted", "error") if key in response}
+            )
+            self.instrumentation.record(trace)
+        return response
+
+    def answer(
+        self,
+        question: str,
+        collection_name: str | None = None,
+        on_token: Callable[[str], None] | None = None,
+        on_event: Callable[[str, Dict[str, Any]], None] | None = None,
+        budget: Dict[str, Any] | None = None
+    ) -> Dict[str, Any]:
+        """
+        Run a single question through the graph, unless it is already cached, and time it.
+        With on_token, the answer is streamed token by token as it is generated, on_event then
+        receives the start of every generation and the verification outcome that follows it,
+        and the time to the first token is reported.
+        budget overrides limits of the query budget for this question only.
+        """
+        start = time.perf_counter()
+        response = self._new_response(question, collection_name)
+        handler = self._stream_handler(on_token, on_event)
+        trace = self._new_trace(question)
+        query_budget = None
+        try:
+            query_budget = self.new_budget(budget)
+            retriever = self.get_vector_store(collection_name)
+            lookup = self._lookup_answer(retriever, question)
+            response["cache"] = lookup.kind
+            if lookup.answer is not None:
+                response["answer"] = lookup.answer
+                if handler is not None:
+                    handler.token(lookup.answer)
+            else:
+                response["answer"] = self._run_graph(question, retriever, query_budget, handler, trace)
+                if not query_budget.exhausted:
+                    self._store_answer(retriever, question, response["answer"], lookup)
+        except Exception as e:
+            logger.error(f"Failed to answer question '{question}': {e}")
+            response["error"] = str(e)
+        return self._finish(response, start, handler, query_budget, trace)
+
+    async def aanswer(
+        self,
+        question: str,
+        collection_name: str | None = None,
+        on_token: Callable[[str], None] | None = None,
+        on_event: Callable[[str, Dict[str, Any]], None] | None = None,
+        budget: Dict[str, Any] | None = None
+    ) -> Dict[str, Any]:
+        """Async version of answer, running the graph on the event loop and the answer cache in threads."""
+        start = time.perf_counter()
+        response = self._new_response(question, collection_name)
+        handler = self._stream_handler(on_token, on_event)
+        trace = self._new_trace(question)
+        query_budget = None
+        try:
+            query_budget = self.new_budget(budget)
+            retriever = self.get_vector_store(collection_name)
+            lookup = await asyncio.to_thread(self._lookup_answer, retriever, question)
+            response["cache"] = lookup.kind
+            if lookup.answer is not None:
+                response["answer"] = lookup.answer
+                if handler is not None:
+                    handler.token(lookup.answer)
+            else:
+                response["answer"] = await self._arun_graph(question, retriever, query_budget, handler, trace)
+                if not query_budget.exhausted:
+                    await asyncio.to_thread(self._store_answer, retriever, question, response["answer"], lookup)
+        except Exception as e:
+            logger.error(f"Failed to answer question '{question}': {e}")
+            response["error"] = str(e)
+        return self._finish(response, start, handler, query_budget, trace)
+
+
+def _check_parallelism(parallelism: int):
+    if not isinstance(parallelism, int) or parallelism < 1:
+        raise ValueError(f"Parallelism must be a positive integer, got {parallelism!r}")
+
+
+def _serve_request(service: QueryService, line: str) -> Dict[str, Any]:
+    try:
+        request = json.loads(line)
+        question = request["question"]
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        return {"error": f"Invalid request: {e}"}
+    response = service.answer(question, request.get("collection_name"), budget=request.get("budget"))
+    if "id" in request:
+        response["id"] = request["id"]
+    return response
+
+
+def serve_jsonl(service: QueryService, input_stream: TextIO, output_stream: TextIO, parallelism: int = 1):
+    """
+    Answer JSON-lines requests of the form {"id": ..., "question": ..., "collection_name": ..., "budget": {...}}
+    read from input_stream, writing one JSON response per line to output_stream.
+    The optional budget overrides limits of the query budget, e.g. {"deadline_seconds": 10}.
+    Up to parallelism requests are answered at once and every response is written as soon as it is ready,
+    so responses may come out of order, each carrying the id of its request.
+    """
+    _check_parallelism(parallelism)
+    logger.info(f"Serving questions as JSON lines with parallelism {parallelism}, waiting for input..")
+    output_lock = threading.Lock()
+    # Lines are only read once a worker is free, so a large input is never buffered whole
+    slots = threading.Semaphore(parallelism)
+
+    def handle(line: str):
+        try:
+            response = _serve_request(service, line)
+            with output_lock:
+                output_stream.write(json.dumps(response) + "\n")
+                output_stream.flush()
+        finally:
+            slots.release()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="serve") as executor:
+        for line in input_stream:
+            line = line.strip()
+            if not line:
+                continue
+            slots.acquire()
+            executor.submit(handle, line)
+
+
+async def arun_batch(
+    service: QueryService,
+    questions: Iterable[str],
+    output_path: str,
+    parallelism: int,
+    collection_name: str | None = None
+) -> List[Dict[str, Any]]:
+    """
+    Answer many questions concurrently on one event loop and write the answers,
+    with their timings, to output_path as JSON lines in the order they complete.
+    """
+    _check_parallelism(parallelism)
+    questions = list(questions)
+    logger.info(f"Answering {len(questions)} questions with parallelism {parallelism}")
+    start = time.perf_counter()
+    # Open the store once up front instead of racing for it from every task
+    service.get_vector_store(collection_name)
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def answer(index: int, question: str) -> Dict[str, Any]:
+        async with semaphore:
+            response = await service.aanswer(question, collection_name)
+        response["index"] = index
+        return response
+
+    responses = []
+    with open(output_path, "w") as output_file:
+        tasks = [answer(index, question) for index, question in enumerate(questions)]
+        for task in asyncio.as_completed(tasks):
+            response = await task
+            output_file.write(json.dumps(response) + "\n")
+            output_file.flush()
+            responses.append(response)
+    logger.info(f"Answered {len(responses)} questions in {time.perf_counter() - start:.2f}s, written to {output_path}")
+    return responses
+
+
+def run_batch(
+    service: QueryService,
+    questions: Iterable[str],
+    output_path: str,
+    parallelism: int,
+    collection_name: str | None = None
+) -> List[Dict[str, Any]]:
+    """Synchronous version of arun_batch, also usable where an event loop is already running."""
+    return utils.run_sync(arun_batch(service, questions, output_path, parallelism, collection_name))
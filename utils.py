@@ -18,4 +18,9 @@ logger = logging.getLogger(__name__)
 def read_urls_from_file(file_path):
     with open(file_path, 'r') as file:
         urls = [line.strip() for line in file.readlines()]
-    return urls
\ No newline at end of file
+    return urls
+
+def read_questions_from_file(file_path):
+    with open(file_path, 'r') as file:
+        questions = [line.strip() for line in file.readlines() if line.strip()]
+    return questions